@@ -0,0 +1,81 @@
+"""
+Latency and SQL queries of the flask-admin pages on big tables.
+
+    $ python benchmarks/admin_benchmark.py
+    $ python benchmarks/admin_benchmark.py --people 500000 --requests 20
+
+Seeds a fresh sqlite database (see api_benchmark.py), loads every admin list
+page with its sorts, searches and filters, and the edit forms, through the
+Flask test client of the full app, and reports their latency and SQL
+queries. The query budgets of every page are checked by tests/test_admin.py.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from api_benchmark import SRC, percentile
+
+PAGES = [
+    ("users", "/admin/user/"),
+    ("users search", "/admin/user/?search=user12"),
+    ("users edit", "/admin/user/edit/?id=1"),
+    ("people", "/admin/people/"),
+    ("people last page", "/admin/people/?page=100"),
+    ("people huge page_size", "/admin/people/?page_size=100000"),
+    ("people sort name", "/admin/people/?sort=1&desc=1"),
+    ("people sort eye_color", "/admin/people/?sort=4"),
+    ("people search", "/admin/people/?search=Person+42"),
+    ("people filter gender", "/admin/people/?flt0_0=female"),
+    ("people edit", "/admin/people/edit/?id=1"),
+    ("planets", "/admin/planets/"),
+    ("planets sort population", "/admin/planets/?sort=2&desc=1"),
+    ("planets filter population", "/admin/planets/?flt0_1=500000000"),
+    ("planets edit", "/admin/planets/edit/?id=1"),
+    ("vehicles", "/admin/vehicles/"),
+    ("vehicles filter capacity", "/admin/vehicles/?flt0_0=42"),
+    ("vehicles edit", "/admin/vehicles/edit/?id=1"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--people", type=int, default=200000)
+    parser.add_argument("--planets", type=int, default=200000)
+    parser.add_argument("--vehicles", type=int, default=20000)
+    parser.add_argument("--favorites", type=int, default=20000, help="per favorite table")
+    parser.add_argument("--requests", type=int, default=10, help="per page")
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "admin.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    os.environ["API_ONLY"] = "false"
+    sys.path.insert(0, SRC)
+    from api_benchmark import seed
+    from wsgi import app
+    from models import db
+    from utils import QueryCounter
+
+    seed({"users": args.users, "people": args.people, "planets": args.planets,
+          "vehicles": args.vehicles, "favorites": args.favorites}, 0)
+    client = app.test_client()
+    with app.app_context():
+        engine = db.engine
+
+    for name, path in PAGES:
+        latencies, queries = [], 0
+        for _ in range(args.requests):
+            with QueryCounter(engine) as counter:
+                started = time.perf_counter()
+                response = client.get(path)
+                response.get_data()
+                latencies.append(time.perf_counter() - started)
+            queries = max(queries, counter.count)
+        print(f"{name:<28} p50 {percentile(latencies, 0.50) * 1000:8.1f} ms   "
+              f"p95 {percentile(latencies, 0.95) * 1000:8.1f} ms   queries {queries}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+Load benchmark for every route of the API.
+
+    $ python benchmarks/api_benchmark.py --mode client
+    $ python benchmarks/api_benchmark.py --mode gunicorn --concurrency 8
+    $ python benchmarks/api_benchmark.py --save-baseline
+    $ python benchmarks/api_benchmark.py --compare
+
+Seeds a fresh sqlite database with users, people, planets, vehicles and
+favorites, then drives every scenario below through the Flask test client
+(in process) and/or a real gunicorn server, and reports throughput,
+p50/p95/p99 latency and SQL queries per request.
+
+--save-baseline stores the results in benchmarks/baseline.json, --compare
+checks the current run against it and exits with status 1 when a scenario
+got slower (p95) or issues more queries than the baseline allows.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC = os.path.join(ROOT, "src")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Prefix of the API endpoint names, scenarios use the name without it
+API_BLUEPRINT = "api."
+
+
+class Scenario:
+    # make_request(i) returns (method, path, body, headers) for iteration i.
+    # `destructive` scenarios consume one disposable row per iteration.
+    def __init__(self, name, endpoint, make_request, destructive=False):
+        self.name = name
+        self.endpoint = endpoint
+        self.make_request = make_request
+        self.destructive = destructive
+
+
+def build_scenarios(sizes, disposable_start):
+    rng = random.Random(1)
+    run_id = int(time.time())
+    names = "abcdefghijklmnopqrstuvwxyz"
+
+    def user_id(i):
+        return rng.randint(1, sizes["users"])
+
+    def json_body(value):
+        return json.dumps(value).encode("utf-8"), {"Content-Type": "application/json"}
+
+    def post(path, value):
+        body, headers = json_body(value)
+        return "POST", path, body, headers
+
+    return [
+        Scenario("sitemap", "sitemap", lambda i: ("GET", "/", None, {})),
+        Scenario("metrics", "get_metrics", lambda i: ("GET", "/metrics", None, {})),
+        Scenario("cache stats", "get_cache_stats", lambda i: ("GET", "/cache/stats", None, {})),
+        Scenario("list users", "get_all_users", lambda i: ("GET", "/users?limit=100", None, {})),
+        Scenario("batch users", "get_all_users",
+                 lambda i: ("GET", "/users?ids=" + ",".join(str(user_id(i)) for _ in range(20)), None, {})),
+        Scenario("get user", "get_user_details_by_id", lambda i: ("GET", f"/user/{user_id(i)}", None, {})),
+        Scenario("user favorites", "get_user_favorites",
+                 lambda i: ("GET", f"/user/{user_id(i)}/favorites", None, {})),
+        Scenario("is favorite", "is_user_favorite",
+                 lambda i: ("GET", f"/user/{user_id(i)}/favorites/people/{i % 100 + 1}", None, {})),
+        Scenario("create user", "create_user",
+                 lambda i: post("/create_user", {"email": f"bench{run_id}-{i}@example.com", "password": "x"})),
+        Scenario("update user", "update_user_by_id",
+                 lambda i: ("PATCH", f"/update/{user_id(i)}", *json_body({"password": f"p{i}"}))),
+        Scenario("delete user", "delete_user_by_id",
+                 lambda i: ("DELETE", f"/delete/{disposable_start['users'] + i}", None, {}), destructive=True),
+        Scenario("list people", "get_all_people", lambda i: ("GET", "/people?limit=100", None, {})),
+        Scenario("filter people", "get_all_people",
+                 lambda i: ("GET", "/people?limit=100&eye_color=blue&sort=name", None, {})),
+        Scenario("batch people", "get_all_people",
+                 lambda i: ("GET", "/people?ids=" + ",".join(str(rng.randint(1, sizes["people"])) for _ in range(20)),
+                            None, {})),
+        Scenario("get people", "get_people_by_id",
+                 lambda i: ("GET", f"/people/{rng.randint(1, sizes['people'])}", None, {})),
+        Scenario("create people", "create_people",
+                 lambda i: post("/create_people", {"name": f"bench-{run_id}-{i}"})),
+        Scenario("bulk people", "bulk_create_entity",
+                 lambda i: post("/bulk/people", [{"name": f"bulk-{run_id}-{i}-{n}"} for n in range(100)])),
+        # The 100 people created by the same iteration of "bulk people"
+        Scenario("bulk delete people", "bulk_delete_entity",
+                 lambda i: ("DELETE", f"/bulk/people?name__prefix=bulk-{run_id}-{i}-", None, {})),
+        Scenario("delete people", "delete_people_by_id",
+                 lambda i: ("DELETE", f"/delete/people/{disposable_start['people'] + i}", None, {}), destructive=True),
+        Scenario("list planets", "get_all_planets", lambda i: ("GET", "/planets?limit=100", None, {})),
+        Scenario("get planet", "get_planet_by_id",
+                 lambda i: ("GET", f"/planets/{rng.randint(1, sizes['planets'])}", None, {})),
+        Scenario("create planet", "create_planet",
+                 lambda i: post("/create_planet", {"name": f"bench-{run_id}-{i}", "population": i, "terrain": 1})),
+        Scenario("delete planet", "delete_planet_by_id",
+                 lambda i: ("DELETE", f"/delete/planet/{disposable_start['planets'] + i}", None, {}), destructive=True),
+        Scenario("list vehicles", "get_all_vehicles", lambda i: ("GET", "/vehicles?limit=100", None, {})),
+        Scenario("search", "search_names",
+                 lambda i: ("GET", f"/search?q={rng.choice(names).upper()}{rng.choice(names)}", None, {})),
+        Scenario("export planets", "export_all", lambda i: ("GET", "/export/planets", None, {})),
+        Scenario("export csv gzip", "export_all",
+                 lambda i: ("GET", "/export/planets?format=csv", None, {"Accept-Encoding": "gzip"})),
+        Scenario("popular people", "get_popular", lambda i: ("GET", "/popular/people?limit=20", None, {})),
+        Scenario("related people", "get_related_people",
+                 lambda i: ("GET", f"/people/{i % 100 + 1}/related", None, {})),
+        Scenario("related planets", "get_related_planets",
+                 lambda i: ("GET", f"/planets/{i % 100 + 1}/related", None, {})),
+        Scenario("add favorites", "add_fav_to_user",
+                 lambda i: post(f"/user/{user_id(i)}/favorites", {
+                     "people": [f"Person {rng.randint(1, sizes['people'])}" for _ in range(5)],
+                     "planets": [f"Planet {rng.randint(1, sizes['planets'])}" for _ in range(5)]})),
+        Scenario("remove favorites", "remove_fav_from_user",
+                 lambda i: ("DELETE", f"/user/{user_id(i)}/favorites", *json_body({
+                     "people": [f"Person {rng.randint(1, sizes['people'])}" for _ in range(5)],
+                     "planets": [f"Planet {rng.randint(1, sizes['planets'])}" for _ in range(5)]}))),
+    ]
+
+
+def seed(sizes, disposable):
+    # Seeds the database of the imported app. Returns the first disposable id
+    # of every table, rows from there on can be deleted by the benchmark.
+    from sqlalchemy import insert as sql_insert
+    from wsgi import app
+    from models import db, User, People, Planets, Vehicles, FavoritePeople, FavoritePlanets
+    from encoding import encode_fragment
+    from popularity import reconcile_favorite_counts
+
+    rng = random.Random(0)
+    colors = ["blue", "brown", "red", "yellow", "green"]
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+
+        def insert(model, rows):
+            for start in range(0, len(rows), 5000):
+                db.session.execute(sql_insert(model), rows[start:start + 5000])
+
+        users = sizes["users"] + disposable
+        people = sizes["people"] + disposable
+        planets = sizes["planets"] + disposable
+        insert(User, [{"email": f"user{i}@example.com", "password": "x", "is_active": True}
+                      for i in range(1, users + 1)])
+        people_rows = [{"name": f"Person {i}", "gender": rng.choice(["male", "female", "n/a"]),
+                        "hair_color": rng.choice(colors), "eye_color": rng.choice(colors)}
+                       for i in range(1, people + 1)]
+        for row in people_rows:
+            row["serialized"] = encode_fragment(People, row)
+        insert(People, people_rows)
+        planet_rows = [{"name": f"Planet {i}", "population": rng.randint(0, 10 ** 9),
+                        "terrain": rng.randint(0, 20)} for i in range(1, planets + 1)]
+        for row in planet_rows:
+            row["serialized"] = encode_fragment(Planets, row)
+        insert(Planets, planet_rows)
+        insert(Vehicles, [{"name": f"Vehicle {i}", "capacity": rng.randint(1, 500)}
+                          for i in range(1, sizes["vehicles"] + 1)])
+
+        for model, column, count in ((FavoritePeople, "people_id", people), (FavoritePlanets, "planet_id", planets)):
+            pairs = set()
+            while len(pairs) < sizes["favorites"]:
+                pairs.add((rng.randint(1, users), rng.randint(1, count)))
+            insert(model, [{"user_id": user, column: target} for user, target in sorted(pairs)])
+        db.session.commit()
+        # The favorites were inserted directly, build their counts
+        reconcile_favorite_counts()
+
+    return {"users": sizes["users"] + 1, "people": sizes["people"] + 1, "planets": sizes["planets"] + 1}
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def summarize(name, latencies, elapsed, statuses, queries=None):
+    result = {
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "errors": sum(count for status, count in statuses.items() if status >= 400),
+    }
+    if queries is not None:
+        result["queries_per_request"] = sum(queries) / len(queries) if queries else 0.0
+    return result
+
+
+def run_client(scenarios, requests, warmup):
+    from wsgi import app
+    from models import db
+    from utils import QueryCounter
+
+    client = app.test_client()
+    with app.app_context():
+        engine = db.engine
+
+    results = {}
+    for scenario in scenarios:
+        if not scenario.destructive:
+            for i in range(warmup):
+                method, path, body, headers = scenario.make_request(requests + i)
+                client.open(path, method=method, data=body, headers=headers).close()
+        latencies, queries, statuses = [], [], {}
+        started = time.perf_counter()
+        for i in range(requests):
+            method, path, body, headers = scenario.make_request(i)
+            with QueryCounter(engine) as counter:
+                request_started = time.perf_counter()
+                response = client.open(path, method=method, data=body, headers=headers)
+                response.get_data()
+                latencies.append(time.perf_counter() - request_started)
+            response.close()
+            queries.append(counter.count)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        results[scenario.name] = summarize(scenario.name, latencies, time.perf_counter() - started, statuses, queries)
+    return results
+
+
+def http_request(base_url, method, path, body, headers):
+    request = urllib.request.Request(base_url + path, data=body, headers=headers, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def scrape_sql_queries(base_url):
+    # Average queries per request by endpoint, from the /metrics of the worker
+    with urllib.request.urlopen(base_url + "/metrics") as response:
+        text = response.read().decode("utf-8")
+    sums, counts = {}, {}
+    for line in text.splitlines():
+        for suffix, target in (("_sum", sums), ("_count", counts)):
+            prefix = "http_request_sql_queries" + suffix + '{endpoint="'
+            if line.startswith(prefix):
+                endpoint = line[len(prefix):line.index('"', len(prefix))]
+                target[endpoint] = float(line.rsplit(" ", 1)[1])
+    return sums, counts
+
+
+def run_gunicorn(scenarios, requests, warmup, concurrency, database_url, port):
+    env = dict(os.environ, DATABASE_URL=database_url)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC, "-b", f"127.0.0.1:{port}",
+         "-w", "1", "--threads", str(concurrency)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                http_request(base_url, "GET", "/cache/stats", None, {})
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("gunicorn did not start")
+
+        results = {}
+        for scenario in scenarios:
+            if not scenario.destructive:
+                for i in range(warmup):
+                    http_request(base_url, *scenario.make_request(requests + i))
+            sums_before, counts_before = scrape_sql_queries(base_url)
+            latencies, statuses = [], {}
+            lock = threading.Lock()
+            iterations = iter(range(requests))
+
+            def worker():
+                while True:
+                    with lock:
+                        i = next(iterations, None)
+                        if i is None:
+                            return
+                        request = scenario.make_request(i)
+                    request_started = time.perf_counter()
+                    status = http_request(base_url, *request)
+                    elapsed = time.perf_counter() - request_started
+                    with lock:
+                        latencies.append(elapsed)
+                        statuses[status] = statuses.get(status, 0) + 1
+
+            started = time.perf_counter()
+            threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+
+            sums_after, counts_after = scrape_sql_queries(base_url)
+            endpoint = API_BLUEPRINT + scenario.endpoint
+            count = counts_after.get(endpoint, 0) - counts_before.get(endpoint, 0)
+            total = sums_after.get(endpoint, 0) - sums_before.get(endpoint, 0)
+            result = summarize(scenario.name, latencies, elapsed, statuses)
+            result["queries_per_request"] = total / count if count else 0.0
+            results[scenario.name] = result
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def check_coverage(scenarios):
+    from wsgi import app
+    covered = {scenario.endpoint for scenario in scenarios}
+    missing = sorted({rule.endpoint[len(API_BLUEPRINT):] for rule in app.url_map.iter_rules()
+                      if rule.endpoint.startswith(API_BLUEPRINT)} - covered)
+    if missing:
+        print(f"warning: no benchmark scenario for: {', '.join(missing)}")
+
+
+def print_results(mode, results):
+    print(f"\n== {mode} ==")
+    print(f"{'scenario':<20} {'req':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>6}")
+    for name, result in results.items():
+        print(f"{name:<20} {result['requests']:>6} {result['throughput']:>9.1f} {result['p50_ms']:>8.2f} "
+              f"{result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f} {result.get('queries_per_request', 0):>8.1f} "
+              f"{result['errors']:>6}")
+
+
+def compare(current, baseline, tolerance):
+    # A scenario regresses when its p95 grows by more than `tolerance` or it
+    # issues more queries per request than in the baseline
+    regressions = []
+    for mode, results in current.items():
+        for name, result in results.items():
+            previous = baseline.get(mode, {}).get(name)
+            if previous is None:
+                continue
+            if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{mode}/{name}: p95 {previous['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+            if result.get("queries_per_request", 0) > previous.get("queries_per_request", 0) + 0.5:
+                regressions.append(f"{mode}/{name}: queries {previous['queries_per_request']:.1f} -> "
+                                   f"{result['queries_per_request']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["client", "gunicorn", "both"], default="client")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--people", type=int, default=5000)
+    parser.add_argument("--planets", type=int, default=2000)
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--favorites", type=int, default=10000, help="per favorite table")
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads in gunicorn mode")
+    parser.add_argument("--port", type=int, default=5123)
+    parser.add_argument("--database", help="sqlite file to use, a temporary one by default")
+    parser.add_argument("--only", help="comma separated scenario names")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth with --compare")
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    database_url = f"sqlite:///{os.path.abspath(database)}"
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, SRC)
+
+    sizes = {"users": args.users, "people": args.people, "planets": args.planets,
+             "vehicles": args.vehicles, "favorites": args.favorites}
+    modes = ["client", "gunicorn"] if args.mode == "both" else [args.mode]
+
+    current = {}
+    for mode in modes:
+        # Every mode starts from the same freshly seeded database
+        disposable_start = seed(sizes, args.requests)
+        scenarios = build_scenarios(sizes, disposable_start)
+        check_coverage(scenarios)
+        if args.only:
+            selected = set(args.only.split(","))
+            scenarios = [scenario for scenario in scenarios if scenario.name in selected]
+        if mode == "client":
+            current[mode] = run_client(scenarios, args.requests, args.warmup)
+        else:
+            current[mode] = run_gunicorn(scenarios, args.requests, args.warmup, args.concurrency,
+                                         database_url, args.port)
+        print_results(mode, current[mode])
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(BASELINE):
+            with open(BASELINE) as baseline_file:
+                baseline = json.load(baseline_file)
+        baseline.update(current)
+        with open(BASELINE, "w") as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print(f"\nbaseline saved to {BASELINE}")
+
+    if args.compare:
+        with open(BASELINE) as baseline_file:
+            regressions = compare(current, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nregressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\nno regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
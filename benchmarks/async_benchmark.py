@@ -0,0 +1,118 @@
+"""
+Sync (gunicorn + wsgi.py) against async (uvicorn + asgi.py) serving of the
+read endpoints under concurrent load.
+
+    $ python benchmarks/async_benchmark.py
+    $ python benchmarks/async_benchmark.py --latency-ms 20 --concurrency 1,16,64 --workers 2
+
+Seeds a sqlite database (see api_benchmark.py), starts each server with the
+same number of worker processes, the catalog cache disabled and
+SIMULATED_DB_LATENCY_MS added to every statement, to stand in for the round
+trip to a remote database. Reports throughput and p50/p99 latency for every
+concurrency level.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from api_benchmark import SRC, seed, http_request, summarize
+
+SERVERS = {
+    "sync": lambda port, workers: [sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC,
+                                   "-b", f"127.0.0.1:{port}", "-w", str(workers)],
+    "async": lambda port, workers: [sys.executable, "-m", "uvicorn", "asgi:application", "--app-dir", SRC,
+                                    "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+}
+
+PATHS = [
+    lambda i, sizes: f"/people?limit=20&after={i % sizes['people']}",
+    lambda i, sizes: f"/people/{i % sizes['people'] + 1}",
+    lambda i, sizes: "/planets?limit=20&sort=name",
+    lambda i, sizes: f"/user/{i % sizes['users'] + 1}",
+]
+
+
+def load(base_url, sizes, requests, concurrency):
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    iterations = iter(range(requests))
+
+    def worker():
+        while True:
+            with lock:
+                i = next(iterations, None)
+            if i is None:
+                return
+            path = PATHS[i % len(PATHS)](i, sizes)
+            request_started = time.perf_counter()
+            status = http_request(base_url, "GET", path, None, {})
+            elapsed = time.perf_counter() - request_started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize("reads", latencies, time.perf_counter() - started, statuses)
+
+
+def run_server(name, args, sizes, database_url, levels):
+    env = dict(os.environ, DATABASE_URL=database_url, CACHE_TYPE="none",
+               SIMULATED_DB_LATENCY_MS=str(args.latency_ms))
+    server = subprocess.Popen(SERVERS[name](args.port, args.workers), env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        for _ in range(100):
+            try:
+                http_request(base_url, "GET", "/people/1", None, {})
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError(f"{name} server did not start")
+        load(base_url, sizes, args.warmup, 1)
+        return {concurrency: load(base_url, sizes, args.requests, concurrency) for concurrency in levels}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=10, help="simulated latency per SQL statement")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated client thread counts")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    parser.add_argument("--requests", type=int, default=400, help="per concurrency level")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--port", type=int, default=5124)
+    parser.add_argument("--database", help="sqlite file to use, a temporary one by default")
+    args = parser.parse_args()
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), "benchmark.db")
+    database_url = f"sqlite:///{os.path.abspath(database)}"
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, SRC)
+
+    sizes = {"users": 1000, "people": 5000, "planets": 2000, "vehicles": 1000, "favorites": 10000}
+    seed(sizes, 0)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    print(f"{args.workers} worker(s), {args.latency_ms} ms simulated latency per statement")
+    print(f"{'server':<8} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for name in SERVERS:
+        for concurrency, result in run_server(name, args, sizes, database_url, levels).items():
+            print(f"{name:<8} {concurrency:>8} {result['throughput']:>9.1f} {result['p50_ms']:>8.2f} "
+                  f"{result['p99_ms']:>8.2f} {result['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
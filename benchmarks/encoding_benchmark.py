@@ -0,0 +1,92 @@
+"""
+Bytes on the wire and encode time of the list payloads.
+
+    $ python benchmarks/encoding_benchmark.py
+    $ python benchmarks/encoding_benchmark.py --limit 1000 --repeat 50
+
+Seeds a fresh sqlite database (see api_benchmark.py), loads one page of
+/people, /planets and /users and encodes it in every representation (JSON
+objects as jsonify sends them today, ?shape=columns, MessagePack) with every
+Content-Encoding (none, gzip and brotli at a few levels). Reports the body
+size, its ratio to the jsonify body, and the median time to serialize and
+compress the page.
+"""
+import argparse
+import gzip
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from api_benchmark import SRC
+
+PAGES = ["people", "planets", "users"]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        samples.append(time.perf_counter() - started)
+    return result, statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit", type=int, default=100, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'encoding.db')}"
+    sys.path.insert(0, SRC)
+    from api_benchmark import seed
+    from wsgi import app
+    from flask import jsonify
+    from models import People, Planets, User
+    from pagination import keyset_page
+    from loading import user_query, USER_SERIALIZE
+    from encoding import to_columns, msgpack
+
+    seed({"users": 2000, "people": 5000, "planets": 5000, "vehicles": 10, "favorites": 20000}, 0)
+
+    encoders = [
+        ("json", lambda items: jsonify(items).get_data()),
+        ("json columns", lambda items: jsonify(to_columns(items)).get_data()),
+    ]
+    if msgpack is not None:
+        encoders += [
+            ("msgpack", lambda items: msgpack.packb(items)),
+            ("msgpack columns", lambda items: msgpack.packb(to_columns(items))),
+        ]
+    compressors = [("identity", lambda data: data)]
+    compressors += [(f"gzip {level}", lambda data, level=level: gzip.compress(data, level, mtime=0))
+                    for level in (1, 5, 9)]
+    try:
+        import brotli
+        compressors += [(f"br {quality}", lambda data, quality=quality: brotli.compress(data, quality=quality))
+                        for quality in (1, 4, 11)]
+    except ImportError:
+        print("brotli is not installed, skipping br")
+
+    with app.test_request_context():
+        pages = {
+            "people": keyset_page(People, args.limit, 0)[0],
+            "planets": keyset_page(Planets, args.limit, 0)[0],
+            "users": keyset_page(User, args.limit, 0, query=user_query(USER_SERIALIZE))[0],
+        }
+        for page in PAGES:
+            items = pages[page]
+            baseline = len(encoders[0][1](items))
+            print(f"\n/{page} ({len(items)} rows), jsonify body {baseline} bytes")
+            print(f"{'representation':<18}{'encoding':<10}{'bytes':>9}{'ratio':>8}{'encode ms':>11}")
+            for encoder_name, encode in encoders:
+                for compressor_name, compress in compressors:
+                    body, elapsed = timed(lambda: compress(encode(items)), args.repeat)
+                    print(f"{encoder_name:<18}{compressor_name:<10}{len(body):>9}"
+                          f"{len(body) / baseline:>8.2f}{elapsed * 1000:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Cost of the /people/<id>/related and /planets/<id>/related scores.
+
+    $ python benchmarks/related_benchmark.py
+    $ python benchmarks/related_benchmark.py --favorites 200000 --engines sparse,python
+
+Seeds a fresh sqlite database (see api_benchmark.py) with --favorites rows in
+each of favorite_people and favorite_planets (1M by default), builds the
+favorites index, and computes the top-K lists of both kinds with every
+engine: the scipy sparse product (when scipy is installed) and the pure
+Python fallback. Reports the time and the peak memory of every batch, checks
+that the engines agree, then measures the lookups: related_items.related()
+alone and the whole request, for the most and the least favorited items.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from api_benchmark import SRC, percentile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--people", type=int, default=20000)
+    parser.add_argument("--planets", type=int, default=2000)
+    parser.add_argument("--favorites", type=int, default=1000000, help="per favorite table")
+    parser.add_argument("--engines", default="sparse,python")
+    parser.add_argument("--requests", type=int, default=200, help="per lookup")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'related.db')}"
+    sys.path.insert(0, SRC)
+    from api_benchmark import seed
+    from wsgi import app
+    from models import db
+    from utils import QueryCounter
+    from versions import get_table_versions
+    from adjacency import favorites_index, INDEXED_TABLES
+    import related
+
+    started = time.perf_counter()
+    seed({"users": args.users, "people": args.people, "planets": args.planets,
+          "vehicles": 10, "favorites": args.favorites}, 0)
+    print(f"seeded in {time.perf_counter() - started:.1f} s")
+
+    engines = {"sparse": related.cosine_top_k_sparse, "python": related.cosine_top_k_python}
+    names = [name for name in args.engines.split(",") if name]
+    if not related.has_scipy() and "sparse" in names:
+        print("scipy is not installed, skipping the sparse engine")
+        names.remove("sparse")
+    if "sparse" in names:
+        # Imported by the first batch of a worker, not part of the timings
+        import scipy.sparse
+
+    with app.app_context():
+        engine = db.engine
+        started = time.perf_counter()
+        favorites_index.sync(get_table_versions(INDEXED_TABLES)[0])
+        print(f"favorites index built in {time.perf_counter() - started:.1f} s\n")
+
+        print(f"{'kind':<10}{'engine':<10}{'favorites':>11}{'items':>8}{'seconds':>10}{'peak MB':>10}")
+        results = {}
+        for kind in related.RELATED_MODELS:
+            adjacency, _ = favorites_index.snapshot(kind)
+            for name in names:
+                tracemalloc.start()
+                started = time.perf_counter()
+                top = engines[name](adjacency, related.RELATED_TOP_K)
+                elapsed = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results[kind, name] = top
+                print(f"{kind:<10}{name:<10}{len(adjacency):>11}{len(top):>8}{elapsed:>10.2f}{peak / 2 ** 20:>10.1f}")
+            if len(names) == 2 and results[kind, names[0]] != results[kind, names[1]]:
+                print(f"  {kind}: the engines disagree")
+
+        # Lookups, with the scores already computed
+        related.related_items.compute()
+        client = app.test_client()
+        print(f"\n{'lookup':<30}{'fans':>7}{'related() us':>14}{'request p50 ms':>16}{'p95 ms':>9}{'queries':>9}")
+        for kind, model in related.RELATED_MODELS.items():
+            favorite, column = related.INDEXED_FAVORITES[kind]
+            fans = dict(db.session.query(getattr(favorite, column), db.func.count())
+                        .group_by(getattr(favorite, column)).all())
+            version = get_table_versions([related.RELATED_TABLES[kind]])[0][related.RELATED_TABLES[kind]]
+            for label, item_id in (("most favorited", max(fans, key=fans.get)),
+                                   ("least favorited", min(fans, key=fans.get))):
+                started = time.perf_counter()
+                for _ in range(args.requests):
+                    related.related_items.related(kind, item_id, version, app)
+                per_call = (time.perf_counter() - started) / args.requests
+                latencies, queries = [], 0
+                for _ in range(args.requests):
+                    with QueryCounter(engine) as counter:
+                        started = time.perf_counter()
+                        response = client.get(f"/{kind}/{item_id}/related")
+                        response.get_data()
+                        latencies.append(time.perf_counter() - started)
+                    queries = max(queries, counter.count)
+                print(f"{kind + ' ' + label:<30}{fans[item_id]:>7}{per_call * 1e6:>14.1f}"
+                      f"{percentile(latencies, 0.50) * 1000:>16.2f}{percentile(latencies, 0.95) * 1000:>9.2f}{queries:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Latency of the in-memory prefix index used by GET /search.
+
+    $ python benchmarks/search_benchmark.py --names 100000 --queries 20000
+
+Builds the index with random names and runs random prefix queries of 1 to 4
+characters, reporting the build time and the p50/p99/max query latency.
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from search import PrefixIndex  # noqa: E402
+
+
+def random_name(rng):
+    words = rng.randint(1, 3)
+    return " ".join(
+        rng.choice(string.ascii_uppercase) + "".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9)))
+        for _ in range(words))
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = [(item_id, random_name(rng)) for item_id in range(1, args.names + 1)]
+
+    started = time.perf_counter()
+    index = PrefixIndex(names)
+    build_time = time.perf_counter() - started
+
+    prefixes = [rng.choice(names)[1][:rng.randint(1, 4)] for _ in range(args.queries)]
+    latencies = []
+    for prefix in prefixes:
+        started = time.perf_counter()
+        index.search(prefix, args.limit)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+
+    print(f"names: {len(index)}  build: {build_time * 1000:.1f} ms")
+    print(f"queries: {len(latencies)}  limit: {args.limit}")
+    for label, value in (("p50", percentile(latencies, 0.50)), ("p99", percentile(latencies, 0.99)),
+                         ("max", latencies[-1])):
+        print(f"{label}: {value * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
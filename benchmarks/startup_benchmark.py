@@ -0,0 +1,95 @@
+"""
+Time to first request of the full app and of the lean API_ONLY app.
+
+    $ python benchmarks/startup_benchmark.py
+    $ python benchmarks/startup_benchmark.py --runs 10 --gunicorn
+
+Every run starts a fresh Python process that imports app.py, calls
+create_app() and serves GET /people?limit=1 through the test client, and
+reports the time from the process start to the response. --gunicorn also
+starts `gunicorn wsgi` and measures the time until its first successful
+response.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from api_benchmark import SRC
+
+MODES = {"full": "false", "lean": "true"}
+
+FIRST_REQUEST = """
+import time
+started = time.perf_counter()
+from app import create_app
+app = create_app()
+app.test_client().get("/people?limit=1").get_data()
+print(time.perf_counter() - started)
+"""
+
+
+def run_process(env):
+    # Returns (seconds from spawn to the first response, seconds spent in
+    # import + create_app + request inside the process)
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", FIRST_REQUEST], cwd=SRC, env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return time.perf_counter() - started, float(output.strip().splitlines()[-1])
+
+
+def run_gunicorn(env, port):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "wsgi", "--chdir", SRC, "-b", f"127.0.0.1:{port}", "-w", "1"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < 30:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/people?limit=1", timeout=5) as response:
+                    response.read()
+                    return time.perf_counter() - started
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError("gunicorn did not start")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summary(samples):
+    return (f"median {statistics.median(samples) * 1000:7.1f} ms   "
+            f"min {min(samples) * 1000:7.1f} ms   max {max(samples) * 1000:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--gunicorn", action="store_true", help="also measure a gunicorn worker")
+    parser.add_argument("--port", type=int, default=5125)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), "startup.db")
+    database_url = f"sqlite:///{database}"
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, SRC)
+    from api_benchmark import seed
+    seed({"users": 10, "people": 10, "planets": 10, "vehicles": 10, "favorites": 10}, 0)
+
+    for mode, api_only in MODES.items():
+        env = dict(os.environ, DATABASE_URL=database_url, API_ONLY=api_only)
+        runs = [run_process(env) for _ in range(args.runs)]
+        print(f"{mode:<5} process start to first response   {summary([total for total, _ in runs])}")
+        print(f"{mode:<5} import + create_app + request      {summary([inner for _, inner in runs])}")
+        if args.gunicorn:
+            print(f"{mode:<5} gunicorn start to first response  "
+                  f"{summary([run_gunicorn(env, args.port) for _ in range(args.runs)])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# Loaded automatically by gunicorn from the directory it is started in
+# (see Procfile).
+import sys
+
+
+def post_fork(server, worker):
+    # With --preload the app (and its engine) is created in the master, make
+    # sure every worker opens its own database connections
+    module = sys.modules.get("wsgi") or sys.modules.get("asgi")
+    if module is not None:
+        from models import db
+        from database import dispose_engine
+        from adjacency import favorites_index
+        from related import related_items
+        from search import name_search
+        dispose_engine(module.app, db)
+        # Ready before the first GET /user/<id>/favorites (see adjacency.py)
+        favorites_index.warm_up(module.app)
+        # Prefix index of /search (see search.py)
+        name_search.warm_up(module.app)
+        # Scores of /people/<id>/related and /planets/<id>/related (see related.py)
+        related_items.warm_up(module.app)
+
+
+def worker_exit(server, worker):
+    # Write the favorites still queued by this worker (see writebehind.py)
+    if "writebehind" in sys.modules:
+        from writebehind import favorites_queue
+        favorites_queue.close()
@@ -0,0 +1,39 @@
+"""add table_version
+
+Revision ID: a3c91e5d7b20
+Revises: f98a47c3360e
+Create Date: 2026-10-18 12:50:12.118204
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c91e5d7b20'
+down_revision = 'f98a47c3360e'
+branch_labels = None
+depends_on = None
+
+TRACKED_TABLES = ['user', 'people', 'planets', 'vehicles',
+                  'favorite_people', 'favorite_planets', 'favorite_vehicles']
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=80), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    # One row per table so that concurrent writers only ever UPDATE it
+    op.bulk_insert(table_version, [
+        {'table_name': name, 'version': 0, 'updated_at': datetime.utcnow()}
+        for name in TRACKED_TABLES
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
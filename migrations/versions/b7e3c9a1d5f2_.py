@@ -0,0 +1,36 @@
+"""add favorite_count table for the popularity leaderboards
+
+Revision ID: b7e3c9a1d5f2
+Revises: f2a9d8c1b3e6
+Create Date: 2026-10-18 15:02:47.318902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3c9a1d5f2'
+down_revision = 'f2a9d8c1b3e6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('favorite_count',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'item_id')
+    )
+    op.create_index('ix_favorite_count_kind_count_item_id', 'favorite_count', ['kind', 'count', 'item_id'], unique=False)
+    # Counts of the favorites that already exist
+    op.execute("INSERT INTO favorite_count (kind, item_id, count) "
+               "SELECT 'people', people_id, COUNT(*) FROM favorite_people WHERE people_id IS NOT NULL GROUP BY people_id")
+    op.execute("INSERT INTO favorite_count (kind, item_id, count) "
+               "SELECT 'planets', planet_id, COUNT(*) FROM favorite_planets WHERE planet_id IS NOT NULL GROUP BY planet_id")
+
+
+def downgrade():
+    op.drop_index('ix_favorite_count_kind_count_item_id', table_name='favorite_count')
+    op.drop_table('favorite_count')
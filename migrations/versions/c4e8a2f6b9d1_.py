@@ -0,0 +1,32 @@
+"""add trigram indexes for the admin search on postgres
+
+Revision ID: c4e8a2f6b9d1
+Revises: b7e3c9a1d5f2
+Create Date: 2026-10-18 19:05:12.408317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2f6b9d1'
+down_revision = 'b7e3c9a1d5f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The admin search on people and planets uses the indexes of f2a9d8c1b3e6
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_user_email_trgm ON "user" USING gin (email gin_trgm_ops)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_vehicles_name_trgm ON vehicles USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_vehicles_name_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_user_email_trgm')
@@ -0,0 +1,54 @@
+"""add serialized column to people and planets
+
+Revision ID: c5d83f0a91e4
+Revises: a3c91e5d7b20
+Create Date: 2026-10-18 13:05:41.602377
+
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d83f0a91e4'
+down_revision = 'a3c91e5d7b20'
+branch_labels = None
+depends_on = None
+
+# Same fields (minus the id) as People.serialize() and Planets.serialize()
+SERIALIZED_FIELDS = {
+    'people': ['name', 'gender', 'hair_color', 'eye_color'],
+    'planets': ['name', 'population', 'terrain'],
+}
+
+
+def upgrade():
+    with op.batch_alter_table('people', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('serialized', sa.Text(), nullable=True))
+
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('serialized', sa.Text(), nullable=True))
+
+    # Backfill the existing rows
+    connection = op.get_bind()
+    for table_name, fields in SERIALIZED_FIELDS.items():
+        table = sa.table(table_name, sa.column('id'), sa.column('serialized'),
+                         *[sa.column(field) for field in fields])
+        rows = connection.execute(sa.select(table.c.id, *[table.c[field] for field in fields])).fetchall()
+        updates = [{'row_id': row[0], 'serialized': json.dumps(dict(zip(fields, row[1:])))[1:-1]}
+                   for row in rows]
+        if updates:
+            connection.execute(
+                table.update().where(table.c.id == sa.bindparam('row_id'))
+                .values(serialized=sa.bindparam('serialized')),
+                updates)
+
+
+def downgrade():
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.drop_column('serialized')
+
+    with op.batch_alter_table('people', schema=None) as batch_op:
+        batch_op.drop_column('serialized')
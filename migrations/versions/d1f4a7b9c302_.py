@@ -0,0 +1,44 @@
+"""add indexes and unique constraints to the favorite tables
+
+Revision ID: d1f4a7b9c302
+Revises: c5d83f0a91e4
+Create Date: 2026-10-18 13:24:08.530916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1f4a7b9c302'
+down_revision = 'c5d83f0a91e4'
+branch_labels = None
+depends_on = None
+
+FAVORITE_TABLES = [
+    ('favorite_people', 'people_id'),
+    ('favorite_planets', 'planet_id'),
+    ('favorite_vehicles', 'vehicle_id'),
+]
+
+
+def upgrade():
+    for table_name, target_column in FAVORITE_TABLES:
+        # Remove duplicated favorites, keeping the oldest row, otherwise the
+        # unique constraint cannot be created
+        op.execute(
+            f'DELETE FROM {table_name} WHERE id NOT IN '
+            f'(SELECT MIN(id) FROM {table_name} GROUP BY user_id, {target_column})')
+
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.create_unique_constraint(
+                f'uq_{table_name}_user_id_{target_column}', ['user_id', target_column])
+            batch_op.create_index(
+                f'ix_{table_name}_{target_column}', [target_column], unique=False)
+
+
+def downgrade():
+    for table_name, target_column in reversed(FAVORITE_TABLES):
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table_name}_{target_column}')
+            batch_op.drop_constraint(f'uq_{table_name}_user_id_{target_column}', type_='unique')
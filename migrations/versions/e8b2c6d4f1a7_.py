@@ -0,0 +1,37 @@
+"""add filter and sort indexes to the catalog tables
+
+Revision ID: e8b2c6d4f1a7
+Revises: d1f4a7b9c302
+Create Date: 2026-10-18 13:52:19.004615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b2c6d4f1a7'
+down_revision = 'd1f4a7b9c302'
+branch_labels = None
+depends_on = None
+
+# (table, column): every index is on (column, id) so that equality/range
+# filters, ORDER BY column, id and the keyset condition share it
+FILTER_INDEXES = [
+    ('people', 'gender'),
+    ('people', 'hair_color'),
+    ('people', 'eye_color'),
+    ('planets', 'population'),
+    ('planets', 'terrain'),
+    ('vehicles', 'capacity'),
+]
+
+
+def upgrade():
+    for table_name, column in FILTER_INDEXES:
+        op.create_index(f'ix_{table_name}_{column}_id', table_name, [column, 'id'], unique=False)
+
+
+def downgrade():
+    for table_name, column in reversed(FILTER_INDEXES):
+        op.drop_index(f'ix_{table_name}_{column}_id', table_name=table_name)
@@ -0,0 +1,33 @@
+"""add trigram indexes for name search on postgres
+
+Revision ID: f2a9d8c1b3e6
+Revises: e8b2c6d4f1a7
+Create Date: 2026-10-18 14:20:33.871420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a9d8c1b3e6'
+down_revision = 'e8b2c6d4f1a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Only used by SEARCH_BACKEND=postgres, other databases use the
+    # in-memory index
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_people_name_trgm ON people USING gin (name gin_trgm_ops)')
+    op.execute('CREATE INDEX IF NOT EXISTS ix_planets_name_trgm ON planets USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('DROP INDEX IF EXISTS ix_planets_name_trgm')
+    op.execute('DROP INDEX IF EXISTS ix_people_name_trgm')
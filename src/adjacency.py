@@ -0,0 +1,283 @@
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from models import db, User, FavoritePeople, FavoritePlanets, FavoriteVehicles
+from versions import get_table_versions, on_tables_committed
+
+# In-process index of the favorites of every user, for
+# GET /user/<id>/favorites and the membership checks ("is X a favorite of U").
+#
+#     FAVORITES_INDEX_REFRESH_SECONDS=1   longest time a change made by another
+#                                         worker can go unnoticed, 0 checks
+#                                         the table versions on every request
+#
+# For every kind the favorites are kept in three arrays of 32-bit ints (CSR
+# layout): the sorted ids of the users with favorites, the offset of each
+# user in `items`, and the sorted item ids of every user one after the other,
+# about 4 bytes per favorite. The arrays are built in bulk with one query per
+# kind (in the background when a gunicorn worker starts, see gunicorn.conf.py,
+# otherwise on first use) and are never modified afterwards: the users whose
+# favorites changed since the build get their own array in `overlay`, which
+# is merged into the base arrays when it grows past OVERLAY_LIMIT users.
+#
+# The favorites endpoints (favorites.py, writebehind.py) record the favorites
+# they add and remove, and the index applies them once the transaction
+# commits. Every other write to the favorite tables (other workers, the
+# delete endpoints, flask-admin) is detected with the table versions (see
+# versions.py): the index remembers the versions it was built from, plus one
+# per transaction it applied, and is rebuilt when they differ from the
+# versions read from the database.
+#
+# The index also keeps the sorted ids of every user, so the endpoints answer
+# "user not found" without a query. The versions are read (one query) at most
+# every FAVORITES_INDEX_REFRESH_SECONDS, and on the next request after this
+# worker commits a write to `user` or a favorite table. A change of `user`
+# alone only reloads the user ids. In between, the requests are answered from
+# memory.
+FAVORITES_INDEX_REFRESH_SECONDS = float(os.getenv("FAVORITES_INDEX_REFRESH_SECONDS", 1))
+OVERLAY_LIMIT = 1000
+
+# kind -> (association model, item column)
+INDEXED_FAVORITES = {
+    "people": (FavoritePeople, "people_id"),
+    "planets": (FavoritePlanets, "planet_id"),
+    "vehicles": (FavoriteVehicles, "vehicle_id"),
+}
+INDEXED_TABLES = tuple(model.__tablename__ for model, _ in INDEXED_FAVORITES.values())
+# Versions the index follows
+VERSION_TABLES = (User.__tablename__,) + INDEXED_TABLES
+
+EMPTY = array("I")
+
+
+class Adjacency:
+    # user id -> sorted item ids for one kind
+    def __init__(self, pairs=()):
+        # pairs are (user_id, item_id) sorted by user_id, then item_id
+        self.users = array("I")
+        self.offsets = array("I", [0])
+        self.items = array("I")
+        self.overlay = {}
+        for user_id, item_id in pairs:
+            if not self.users or self.users[-1] != user_id:
+                if self.users:
+                    self.offsets.append(len(self.items))
+                self.users.append(user_id)
+            self.items.append(item_id)
+        if self.users:
+            self.offsets.append(len(self.items))
+
+    def __len__(self):
+        return len(self.items) + sum(len(items) for items in self.overlay.values())
+
+    def get(self, user_id):
+        items = self.overlay.get(user_id)
+        if items is not None:
+            return items
+        position = bisect_left(self.users, user_id)
+        if position == len(self.users) or self.users[position] != user_id:
+            return EMPTY
+        return self.items[self.offsets[position]:self.offsets[position + 1]]
+
+    def contains(self, user_id, item_id):
+        items = self.get(user_id)
+        position = bisect_left(items, item_id)
+        return position < len(items) and items[position] == item_id
+
+    def update(self, user_id, added=(), removed=()):
+        items = set(self.get(user_id))
+        items.update(added)
+        items.difference_update(removed)
+        self.overlay[user_id] = array("I", sorted(items))
+        if len(self.overlay) > OVERLAY_LIMIT:
+            self.compact()
+
+    def compact(self):
+        overlay, self.overlay = self.overlay, {}
+        users = sorted(set(self.users) | set(overlay))
+        merged = Adjacency((user_id, item_id) for user_id in users
+                           for item_id in (overlay[user_id] if user_id in overlay else self.get(user_id)))
+        self.users, self.offsets, self.items = merged.users, merged.offsets, merged.items
+
+
+class FavoritesIndex:
+    def __init__(self):
+        self.kinds = None
+        self.users = EMPTY
+        self.versions = None
+        self.generation = 0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+
+    def build(self):
+        with self.build_lock:
+            self._build()
+
+    def _build(self):
+        # The versions are read first: a write committed in between makes
+        # them older than the data, and the next sync rebuilds again
+        versions, _ = get_table_versions(VERSION_TABLES)
+        kinds = {}
+        for kind, (model, column) in INDEXED_FAVORITES.items():
+            item_column = getattr(model, column)
+            kinds[kind] = Adjacency(db.session.execute(
+                select(model.user_id, item_column)
+                .where(model.user_id.isnot(None), item_column.isnot(None))
+                .order_by(model.user_id, item_column)))
+        users = load_user_ids()
+        with self.lock:
+            self.kinds = kinds
+            self.users = users
+            self.versions = versions
+            self.generation += 1
+
+    def _load_users(self):
+        # Same order as _build, versions first
+        versions, _ = get_table_versions((User.__tablename__,))
+        users = load_user_ids()
+        with self.lock:
+            self.users = users
+            self.versions.update(versions)
+
+    def is_current(self, versions, tables=INDEXED_TABLES):
+        # The index versions never get ahead of the database, they are at
+        # least `versions` when the index has every change up to them
+        with self.lock:
+            return self.kinds is not None and all(
+                self.versions[table] >= versions[table] for table in tables if table in versions)
+
+    def sync(self, versions):
+        # versions are the {table: version} of INDEXED_TABLES, and optionally
+        # `user`, read from the database
+        if not self.is_current(versions):
+            with self.build_lock:
+                # Another request may have rebuilt it meanwhile
+                if not self.is_current(versions):
+                    self._build()
+        if not self.is_current(versions, (User.__tablename__,)):
+            with self.build_lock:
+                if not self.is_current(versions, (User.__tablename__,)):
+                    self._load_users()
+
+    def refresh(self):
+        # Runs in an app context. Syncs the index when it is due for a check
+        # (see above) and returns the {table: version} of VERSION_TABLES it
+        # answers from.
+        if self.kinds is None or time.monotonic() - self.checked_at >= FAVORITES_INDEX_REFRESH_SECONDS:
+            # Set before reading: a commit that expires the check meanwhile
+            # is either seen by this read or checked by the next request
+            self.checked_at = time.monotonic()
+            self.sync(get_table_versions(VERSION_TABLES)[0])
+        with self.lock:
+            return dict(self.versions)
+
+    def expire(self):
+        # The next refresh reads the versions
+        self.checked_at = 0.0
+
+    def apply(self, generation, changes):
+        # changes are (kind, user_id, item_id, add) tuples written by one
+        # committed transaction that started recording at `generation`. When
+        # the index was rebuilt since, the changes are in it or the versions
+        # make the next sync rebuild it again.
+        with self.lock:
+            if self.kinds is None or generation != self.generation:
+                return
+            updates = {}
+            for kind, user_id, item_id, add in changes:
+                added, removed = updates.setdefault((kind, user_id), (set(), set()))
+                (added if add else removed).add(item_id)
+                (removed if add else added).discard(item_id)
+            for (kind, user_id), (added, removed) in updates.items():
+                self.kinds[kind].update(user_id, added, removed)
+            # One version bump per written table and transaction
+            for kind in {kind for kind, _ in updates}:
+                self.versions[INDEXED_FAVORITES[kind][0].__tablename__] += 1
+
+    def favorites(self, user_id):
+        # {kind: [item ids]}, without touching the database
+        with self.lock:
+            return {kind: list(adjacency.get(user_id)) for kind, adjacency in self.kinds.items()}
+
+    def contains(self, kind, user_id, item_id):
+        with self.lock:
+            return self.kinds[kind].contains(user_id, item_id)
+
+    def has_user(self, user_id):
+        with self.lock:
+            position = bisect_left(self.users, user_id)
+            return position < len(self.users) and self.users[position] == user_id
+
+    def warm_up(self, app):
+        # Builds the index in the background, e.g. when a worker starts
+        def run():
+            try:
+                with app.app_context():
+                    self.build()
+            except Exception:
+                app.logger.exception("Building the favorites index failed, it is built on first use")
+        threading.Thread(target=run, name="favorites-index", daemon=True).start()
+
+    def snapshot(self, kind):
+        # (Adjacency with no overlay, version of its table), the arrays are
+        # replaced and never modified so they can be read without the lock
+        with self.lock:
+            adjacency = self.kinds[kind]
+            if adjacency.overlay:
+                adjacency.compact()
+            snapshot = Adjacency()
+            snapshot.users, snapshot.offsets, snapshot.items = adjacency.users, adjacency.offsets, adjacency.items
+            return snapshot, self.versions[INDEXED_FAVORITES[kind][0].__tablename__]
+
+    def stats(self):
+        with self.lock:
+            kinds = {kind: {"favorites": len(adjacency), "overlay_users": len(adjacency.overlay)}
+                     for kind, adjacency in (self.kinds or {}).items()}
+            return {"builds": self.generation, "users": len(self.users), "kinds": kinds}
+
+
+favorites_index = FavoritesIndex()
+
+
+def load_user_ids():
+    return array("I", db.session.execute(select(User.id).order_by(User.id)).scalars())
+
+
+@on_tables_committed
+def _expire_favorites_index(tables):
+    # Writes of this worker are seen by the next request. The changes of the
+    # favorites endpoints are already applied (see below), the check then
+    # only reads the versions.
+    if not tables.isdisjoint(VERSION_TABLES):
+        favorites_index.expire()
+
+
+# Incremental updates: the favorites endpoints record what they write and the
+# changes are applied once the transaction commits
+
+INDEX_CHANGES_KEY = "favorites_index_changes"
+
+
+def record_favorite_changes(session, changes):
+    # changes are (kind, user_id, item_id, add) tuples, only the favorites
+    # really added or removed
+    if changes:
+        recorded = session.info.setdefault(INDEX_CHANGES_KEY, (favorites_index.generation, []))
+        recorded[1].extend(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_favorite_changes(session):
+    recorded = session.info.pop(INDEX_CHANGES_KEY, None)
+    if recorded:
+        favorites_index.apply(*recorded)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_favorite_changes(session):
+    session.info.pop(INDEX_CHANGES_KEY, None)
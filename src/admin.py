@@ -1,18 +1,130 @@
 import os
+from flask import g
 from flask_admin import Admin
-from models import db, User, Planets, People
+from sqlalchemy import text
+from models import db, User, Planets, People, Vehicles
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.filters import FilterEqual, IntEqualFilter, IntGreaterFilter, IntSmallerFilter
+
+# List pages of big tables.
+#
+#     ADMIN_PAGE_SIZE=50              rows per list page, also the most that
+#                                     ?page_size= can ask for
+#     ADMIN_EXACT_COUNT_LIMIT=100000  tables with more rows show an estimated
+#                                     count (pg_class.reltuples, max(id) on sqlite)
+#
+# Only indexed columns can be sorted and filtered (equality, and ranges on the
+# integer columns), the default order is the primary key. The search box uses
+# ILIKE '%term%' on the name / email, served by the trigram indexes on postgres.
+# Relationships are not listed, and are edited with ajax lookups instead of a
+# select with every row of the other table.
+ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", 50))
+ADMIN_EXACT_COUNT_LIMIT = int(os.getenv("ADMIN_EXACT_COUNT_LIMIT", 100000))
+
+
+def estimated_count(model):
+    # Cheap row count of the whole table, None when the database has none
+    table = model.__table__.name
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        # -1 until the table was analyzed once
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": '"%s"' % table}).scalar()
+        return estimate if estimate is not None and estimate >= 0 else None
+    if dialect == "sqlite":
+        # Served by the primary key, an upper bound once rows were deleted
+        return db.session.query(db.func.max(model.id)).scalar() or 0
+    return None
+
+
+def ajax_ref(*fields):
+    return {"fields": fields, "page_size": 10}
+
+
+class TunedModelView(ModelView):
+    page_size = ADMIN_PAGE_SIZE
+    can_set_page_size = False
+    column_display_all_relations = False
+    column_default_sort = "id"
+
+    def get_count_query(self):
+        if g.get("admin_estimated_count") is not None:
+            return None
+        return super().get_count_query()
+
+    def get_list(self, page, sort_column, sort_desc, search, filters, execute=True, page_size=None):
+        # ?page_size= is read from the URL even with can_set_page_size off
+        page_size = min(page_size or self.page_size, self.page_size)
+        g.admin_estimated_count = None
+        if not search and not filters:
+            estimate = estimated_count(self.model)
+            if estimate is not None and estimate >= ADMIN_EXACT_COUNT_LIMIT:
+                g.admin_estimated_count = estimate
+        try:
+            count, query = super().get_list(page, sort_column, sort_desc, search, filters,
+                                            execute=execute, page_size=page_size)
+        finally:
+            estimate, g.admin_estimated_count = g.admin_estimated_count, None
+        return (estimate if count is None else count), query
+
+
+class UserModelView(TunedModelView):
+    column_list = ("id", "email", "is_active")
+    column_sortable_list = ("id", "email")
+    column_searchable_list = ("email",)
+    form_ajax_refs = {
+        "fav_people": ajax_ref("name"),
+        "fav_planets": ajax_ref("name"),
+        "fav_vehicles": ajax_ref("name"),
+    }
+
+
+class PeopleModelView(TunedModelView):
+    column_list = ("id", "name", "gender", "hair_color", "eye_color")
+    column_sortable_list = ("id", "name", "gender", "hair_color", "eye_color")
+    column_searchable_list = ("name",)
+    column_filters = (
+        FilterEqual(People.gender, "Gender"),
+        FilterEqual(People.hair_color, "Hair color"),
+        FilterEqual(People.eye_color, "Eye color"),
+    )
+    # The pre-encoded JSON is maintained by the mapper events, not edited by hand
+    form_excluded_columns = ("serialized",)
+    form_ajax_refs = {"users": ajax_ref("email")}
+
+
+class PlanetsModelView(TunedModelView):
+    column_list = ("id", "name", "population", "terrain")
+    column_sortable_list = ("id", "name", "population", "terrain")
+    column_searchable_list = ("name",)
+    column_filters = (
+        IntEqualFilter(Planets.population, "Population"),
+        IntGreaterFilter(Planets.population, "Population"),
+        IntSmallerFilter(Planets.population, "Population"),
+        IntEqualFilter(Planets.terrain, "Terrain"),
+    )
+    form_excluded_columns = ("serialized",)
+    form_ajax_refs = {"user_fav": ajax_ref("email")}
+
+
+class VehiclesModelView(TunedModelView):
+    column_list = ("id", "name", "capacity")
+    column_sortable_list = ("id", "name", "capacity")
+    column_searchable_list = ("name",)
+    column_filters = (
+        IntEqualFilter(Vehicles.capacity, "Capacity"),
+        IntGreaterFilter(Vehicles.capacity, "Capacity"),
+        IntSmallerFilter(Vehicles.capacity, "Capacity"),
+    )
+    form_ajax_refs = {"user_fav": ajax_ref("email")}
 
 
 def setup_admin(app):
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
     admin = Admin(app, name='Admin', template_mode='bootstrap3')
-
-    # Add your models here, for example this is how we add a the User model to the admin
-    admin.add_view(ModelView(User, db.session))
-    admin.add_view(ModelView(People, db.session))
-    admin.add_view(ModelView(Planets, db.session))
-
-    # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
+    admin.add_view(UserModelView(User, db.session))
+    admin.add_view(PeopleModelView(People, db.session))
+    admin.add_view(PlanetsModelView(Planets, db.session))
+    admin.add_view(VehiclesModelView(Vehicles, db.session))
@@ -1,48 +1,143 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
+import json
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from flask import Flask, Blueprint, current_app, g, request, jsonify, url_for, Response, stream_with_context
 from flask_cors import CORS
 from utils import APIException, generate_sitemap
-from admin import setup_admin
-from models import db, User, People, Planets
+from models import db, User, People, Planets, Vehicles, FavoriteCount
+from pagination import parse_page_args, parse_fields, keyset_page, keyset_page_json, add_next_link, page_cache_key
+from loading import user_query, USER_SERIALIZE, USER_FAVORITES
+from favorites import add_favorites_by_name, remove_favorites_by_name, current_favorites
+from bulk import BULK_ENTITIES, bulk_create, iter_json_array, iter_ndjson, stream_results
+from cache import catalog_cache
+from etag import conditional_get, make_etag, not_modified
+from filters import parse_filters, parse_sort
+from search import name_search, SEARCHABLE, MAX_SEARCH_RESULTS
+from metrics import registry, init_metrics
+from encoding import SERIALIZED_JSON_STORE, configure_json, parse_shape, shaped, default_representation, list_response
+from compression import init_compression
+from database import engine_options, collect_pool_stats
+from replicas import replica_binds, read_replica, init_replicas, replica_set
+from writebehind import FAVORITES_WRITE_BEHIND, favorites_queue, read_your_writes
+from popularity import POPULAR, popular_page
+from deletes import DELETE_ENTITIES, delete_where, delete_by_ids, delete_by_filters
+from export import EXPORT_ENTITIES, EXPORT_FORMATS, export_entity
+from batch import parse_ids, batch_get
+from adjacency import INDEXED_FAVORITES, favorites_index
+from related import RELATED_MODELS, RELATED_TABLES, related_items
+from versions import get_table_versions
 # from models import Person
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace(
-        "postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+# All the endpoints, registered on the app by create_app()
+api = Blueprint("api", __name__)
+
+
+def create_app(config=None):
+    # Builds the app. `config` is a dict that overrides the defaults below.
+    #
+    # API_ONLY=true (or {"API_ONLY": True}) builds a lean app for the API
+    # workers, without flask-admin, Flask-Migrate and the CLI commands. Their
+    # imports are the slowest part of the startup, so they are only imported
+    # by the full app (see benchmarks/startup_benchmark.py).
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace(
+            "postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['API_ONLY'] = os.getenv("API_ONLY", "false").lower() in ("1", "true", "yes")
+    app.config.update(config or {})
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    app.config.setdefault('SQLALCHEMY_BINDS', replica_binds())
+
+    db.init_app(app)
+    init_replicas(app, db)
+    favorites_queue.init_app(app)
+    CORS(app)
+    configure_json(app)
+    init_metrics(app)
+    init_compression(app)
+    app.register_blueprint(api)
+
+    if not app.config['API_ONLY']:
+        from flask_migrate import Migrate
+        from admin import setup_admin
+        from commands import setup_commands
+        Migrate(app, db)
+        setup_admin(app)
+        setup_commands(app)
+    return app
+
+
+# Tables read by User.serialize(), used to compute the ETag of the user endpoints
+USER_TABLES = ("user", "favorite_people", "favorite_planets", "planets")
 
 # Handle/serialize errors like a JSON object
 
 
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
 # generate sitemap with all your endpoints
 
 
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return generate_sitemap(current_app)
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus scrape endpoint with the metrics of this worker
+    return Response(registry.export(), mimetype="text/plain; version=0.0.4"), 200
+
+
+@registry.add_collector
+def collect_cache_stats(registry):
+    stats = catalog_cache.stats()
+    registry.gauge("cache_hits", "Catalog cache hits.").set((), stats["hits"])
+    registry.gauge("cache_misses", "Catalog cache misses.").set((), stats["misses"])
+
+
+@registry.add_collector
+def collect_database_pool_stats(registry):
+    collect_pool_stats(registry, db.engine)
+    replica_up = registry.gauge("db_replica_up", "1 when the read replica is in rotation.")
+    for key, healthy in replica_set.status().items():
+        replica_up.set((("replica", key),), int(healthy))
+
+
+@registry.add_collector
+def collect_favorites_queue_stats(registry):
+    stats = favorites_queue.stats()
+    registry.gauge("favorites_queue_pending", "Favorite changes waiting to be written.").set((), stats["pending"])
+    registry.gauge("favorites_queue_flushed", "Favorite changes written by the queue.").set((), stats["flushed"])
+    registry.gauge("favorites_queue_failures", "Failed writes of the favorites queue.").set((), stats["failures"])
+
+
+@registry.add_collector
+def collect_favorites_index_stats(registry):
+    stats = favorites_index.stats()
+    registry.gauge("favorites_index_builds", "Bulk builds of the favorites index.").set((), stats["builds"])
+    size = registry.gauge("favorites_index_favorites", "Favorites in the favorites index.")
+    for kind, kind_stats in stats["kinds"].items():
+        size.set((("kind", kind),), kind_stats["favorites"])
+
 
+@api.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    # Hit/miss counters of the catalog cache in this worker
+    return jsonify(catalog_cache.stats()), 200
 
-@app.route('/create_user', methods=['POST'])
+
+@api.route('/create_user', methods=['POST'])
 def create_user():
     request_data = request.get_json(force=True)
     # expected request_data form:
@@ -64,43 +159,58 @@ def create_user():
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/user/<int:id>', methods=['GET'])
+@api.route('/user/<int:id>', methods=['GET'])
+@read_replica
+@read_your_writes
+@conditional_get(*USER_TABLES)
 def get_user_details_by_id(id):
     # Get the details of an user by the id
     try:
-        user = User.query.get_or_404(id)
+        user = user_query(USER_SERIALIZE).get_or_404(id)
         serialized_user = user.serialize()
-        for person in user.fav_people:
-            print(person.id)
         return jsonify(serialized_user), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@read_replica
+@read_your_writes
+@conditional_get(*USER_TABLES)
 def get_all_users():
-    # Get all the users in the database
+    # Get the users in the database, one page at a time
+    # ?limit=100&after=<last id>&fields=id,email
+    # Representations, see encoding.py: ?shape=columns, Accept: application/msgpack
+    # ?ids=3,1,2 returns these users in this order, see batch.py
+    shape = parse_shape(request.args)
+    if "ids" in request.args:
+        users, missing = batch_get(User, parse_ids(request.args["ids"]), query=user_query(USER_SERIALIZE))
+        return list_response({"users": shaped(users, shape), "missing": missing}), 200
+    limit, after = parse_page_args(request.args)
+    fields = parse_fields(request.args, User.public_fields)
     try:
-        users = User.query.all()
-        serialized_users = [user.serialize() for user in users]
-        return jsonify(serialized_users), 200
+        serialized_users, next_cursor = keyset_page(
+            User, limit, after, fields, query=user_query(USER_SERIALIZE))
+        response = list_response(shaped(serialized_users, shape))
+        return add_next_link(response, next_cursor, request.base_url, request.args), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/delete/<int:id>', methods=['DELETE'])
+@api.route('/delete/<int:id>', methods=['DELETE'])
 def delete_user_by_id(id):
-    # Remove one user by id from the database
+    # Remove one user by id from the database, with its favorites
     try:
-        user = User.query.get_or_404(id)
-        db.session.delete(user)
+        if not delete_where("users", User.id == id):
+            return jsonify({"msg": "User not found"}), 404
         db.session.commit()
         return jsonify({"msg": "User successfully deleted"}), 200
     except Exception as e:
+        db.session.rollback()
         return jsonify({"msg": f"Error: {str(e)}"}), 500
 
 
-@app.route('/update/<int:id>', methods=['PATCH'])
+@api.route('/update/<int:id>', methods=['PATCH'])
 def update_user_by_id(id):
     # Update the details concerning a certain user, given its id.
     user_data_to_update = request.get_json(force=True)
@@ -117,27 +227,55 @@ def update_user_by_id(id):
         return jsonify({"msg": f"Error: {str(e)}"}), 500
 
 
-@app.route('/people', methods=['GET'])
+@api.route('/people', methods=['GET'])
+@read_replica
+@conditional_get("people")
 def get_all_people():
-    # Get all people (characters) that is in the database
-    people = People.query.all()
-    people_serialized = [person.serialize() for person in people]
-    return jsonify({"msg": "People succesfully accessed", "people": people_serialized}), 200
-
-
-@app.route('/people/<int:people_id>', methods=['GET'])
+    # Get people (characters) that are in the database, one page at a time
+    # ?limit=100&after=<next>&fields=name,gender
+    # Filters and sort, see filters.py: ?eye_color__in=blue,red&sort=name
+    # Representations, see encoding.py: ?shape=columns, Accept: application/msgpack
+    # ?ids=3,1,2 returns these people in this order, see batch.py
+    shape = parse_shape(request.args)
+    if "ids" in request.args:
+        people, missing = batch_get(People, parse_ids(request.args["ids"]), cache_table="people")
+        return list_response({"people": shaped(people, shape), "missing": missing}), 200
+    filters = parse_filters(People, request.args)
+    sort = parse_sort(People, request.args)
+    limit, after = parse_page_args(request.args, sort)
+    fields = parse_fields(request.args, People.public_fields)
+    if SERIALIZED_JSON_STORE and not fields and default_representation(request.args):
+        people_json, next_cursor = catalog_cache.get_or_set(
+            "people", page_cache_key(request.args) + ":json",
+            lambda: keyset_page_json(People, limit, after, filters, sort))
+        response = Response(
+            '{"msg": "People succesfully accessed", "next": %s, "people": %s}' % (json.dumps(next_cursor), people_json),
+            mimetype="application/json")
+        response.vary.add("Accept")
+        return add_next_link(response, next_cursor, request.base_url, request.args), 200
+    people_serialized, next_cursor = catalog_cache.get_or_set(
+        "people", page_cache_key(request.args),
+        lambda: keyset_page(People, limit, after, fields, filters=filters, sort=sort))
+    response = list_response({"msg": "People succesfully accessed",
+                              "people": shaped(people_serialized, shape), "next": next_cursor})
+    return add_next_link(response, next_cursor, request.base_url, request.args), 200
+
+
+@api.route('/people/<int:people_id>', methods=['GET'])
+@read_replica
+@conditional_get("people")
 def get_people_by_id(people_id):
     # Get the details of a certain character by the id
     try:
-        people_selected = People.query.get_or_404(people_id)
-        serialized_people = people_selected.serialize()
+        serialized_people = catalog_cache.get_or_set(
+            "people", f"item:{people_id}",
+            lambda: People.query.get_or_404(people_id).serialize())
         return jsonify(serialized_people), 200
     except Exception as e:
-        s
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/create_people', methods=['POST'])
+@api.route('/create_people', methods=['POST'])
 def create_people():
     # Create a new character
     request_data = request.get_json(force=True)
@@ -171,7 +309,7 @@ def create_people():
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/create_planet', methods=['POST'])
+@api.route('/create_planet', methods=['POST'])
 def create_planet():
     # Create planet with the request body as follows:
     # {
@@ -202,27 +340,260 @@ def create_planet():
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/planets', methods=['GET'])
+@api.route('/bulk/<entity>', methods=['POST'])
+def bulk_create_entity(entity):
+    # Create many people, planets or vehicles in one request. The body is a
+    # JSON array of objects with the same fields as /create_people and
+    # /create_planet, or one object per line with
+    # Content-Type: application/x-ndjson
+    # ?on_conflict=update updates the rows whose name already exists instead
+    # of reporting them as duplicates.
+    if entity not in BULK_ENTITIES:
+        raise APIException(f"Unknown entity '{entity}'", status_code=404)
+    update_existing = request.args.get("on_conflict") == "update"
+    ndjson = request.mimetype in ("application/x-ndjson", "application/jsonlines")
+    if ndjson:
+        items = iter_ndjson(request.stream)
+    else:
+        items = iter_json_array(request.stream)
+
+    results = bulk_create(entity, items, update_existing)
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    return Response(stream_with_context(stream_results(results, ndjson)), mimetype=mimetype)
+
+
+@api.route('/bulk/<entity>', methods=['DELETE'])
+def bulk_delete_entity(entity):
+    # Delete many users, people, planets or vehicles with their favorites:
+    # ?ids=3,1,2 or the filters of the list endpoints (see filters.py), e.g.
+    # DELETE /bulk/people?eye_color=red. Users can only be deleted by id.
+    if entity not in DELETE_ENTITIES:
+        raise APIException(f"Unknown entity '{entity}'", status_code=404)
+    model = DELETE_ENTITIES[entity][0]
+    if "ids" in request.args:
+        ids = parse_ids(request.args["ids"])
+        filters = None
+    elif entity == "users":
+        raise APIException("Users can only be deleted by id, use ?ids=", status_code=400)
+    else:
+        filters = parse_filters(model, request.args)
+        if not filters:
+            raise APIException("A filter or ?ids= is required", status_code=400)
+    try:
+        if filters is None:
+            deleted, missing = delete_by_ids(entity, ids)
+        else:
+            deleted, missing = delete_by_filters(entity, filters), []
+        db.session.commit()
+        return jsonify({"deleted": deleted, "missing": missing}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+
+@api.route('/planets', methods=['GET'])
+@read_replica
+@conditional_get("planets")
 def get_all_planets():
+    # ?limit=100&after=<next>&fields=name,terrain
+    # Filters and sort, see filters.py: ?population__gte=1000&sort=-population
+    # Representations, see encoding.py: ?shape=columns, Accept: application/msgpack
+    # ?ids=3,1,2 returns these planets in this order, see batch.py
+    shape = parse_shape(request.args)
+    if "ids" in request.args:
+        planets, missing = batch_get(Planets, parse_ids(request.args["ids"]), cache_table="planets")
+        return list_response({"planets": shaped(planets, shape), "missing": missing}), 200
+    filters = parse_filters(Planets, request.args)
+    sort = parse_sort(Planets, request.args)
+    limit, after = parse_page_args(request.args, sort)
+    fields = parse_fields(request.args, Planets.public_fields)
     try:
-        planets = Planets.query.all()
-        serialized_planets = [planet.serialize() for planet in planets]
-        return jsonify(serialized_planets), 200
+        if SERIALIZED_JSON_STORE and not fields and default_representation(request.args):
+            planets_json, next_cursor = catalog_cache.get_or_set(
+                "planets", page_cache_key(request.args) + ":json",
+                lambda: keyset_page_json(Planets, limit, after, filters, sort))
+            response = Response(planets_json, mimetype="application/json")
+            response.vary.add("Accept")
+            return add_next_link(response, next_cursor, request.base_url, request.args), 200
+        serialized_planets, next_cursor = catalog_cache.get_or_set(
+            "planets", page_cache_key(request.args),
+            lambda: keyset_page(Planets, limit, after, fields, filters=filters, sort=sort))
+        response = list_response(shaped(serialized_planets, shape))
+        return add_next_link(response, next_cursor, request.base_url, request.args), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/planets/<int:planet_id>', methods=['GET'])
+@api.route('/planets/<int:planet_id>', methods=['GET'])
+@read_replica
+@conditional_get("planets")
 def get_planet_by_id(planet_id):
     try:
-        planet_selected = Planets.query.get_or_404(planet_id)
-        serialized_planet = planet_selected.serialize()
+        serialized_planet = catalog_cache.get_or_set(
+            "planets", f"item:{planet_id}",
+            lambda: Planets.query.get_or_404(planet_id).serialize())
         return jsonify(serialized_planet), 200
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
 
-@app.route('/user/<int:id>/favorites', methods=['POST'])
+@api.route('/search', methods=['GET'])
+def search_names():
+    # Autocomplete over the names of people and planets
+    # ?q=lu&type=people&limit=10
+    # type is people or planets (both when omitted), match is prefix
+    # (default) or contains (only with SEARCH_BACKEND=postgres)
+    query = request.args.get("q", "").strip()
+    if not query:
+        raise APIException("q is required", status_code=400)
+    kind = request.args.get("type")
+    if kind is not None and kind not in SEARCHABLE:
+        raise APIException(f"type must be one of: {', '.join(SEARCHABLE)}", status_code=400)
+    kinds = [kind] if kind else list(SEARCHABLE)
+    try:
+        limit = min(int(request.args.get("limit", 10)), MAX_SEARCH_RESULTS)
+    except ValueError:
+        raise APIException("limit must be an integer", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+    match = request.args.get("match", "prefix")
+
+    try:
+        results = name_search.search(query, kinds, limit, match)
+    except ValueError as e:
+        raise APIException(str(e), status_code=400)
+    return jsonify({"results": results}), 200
+
+
+@api.route('/vehicles', methods=['GET'])
+@conditional_get("vehicles")
+def get_all_vehicles():
+    # Same query parameters as /planets: ?capacity__gte=10&sort=-capacity
+    filters = parse_filters(Vehicles, request.args)
+    sort = parse_sort(Vehicles, request.args)
+    limit, after = parse_page_args(request.args, sort)
+    fields = parse_fields(request.args, Vehicles.public_fields)
+    shape = parse_shape(request.args)
+    try:
+        serialized_vehicles, next_cursor = catalog_cache.get_or_set(
+            "vehicles", page_cache_key(request.args),
+            lambda: keyset_page(Vehicles, limit, after, fields, filters=filters, sort=sort))
+        response = list_response(shaped(serialized_vehicles, shape))
+        return add_next_link(response, next_cursor, request.base_url, request.args), 200
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+
+@api.route('/export/<entity>', methods=['GET'])
+@read_replica
+def export_all(entity):
+    # Every row of people, planets or vehicles, streamed (see export.py):
+    # ?format=ndjson (default) or ?format=csv, gzipped when the client
+    # sends Accept-Encoding: gzip
+    if entity not in EXPORT_ENTITIES:
+        raise APIException(f"Unknown entity '{entity}'", status_code=404)
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        raise APIException(f"Unknown format '{export_format}', use one of: {', '.join(EXPORT_FORMATS)}",
+                           status_code=400)
+    gzip = request.accept_encodings["gzip"] > 0
+    response = Response(stream_with_context(export_entity(entity, export_format, gzip)),
+                        mimetype=EXPORT_FORMATS[export_format])
+    response.headers["Content-Disposition"] = f"attachment; filename={entity}.{export_format}"
+    response.vary.add("Accept-Encoding")
+    if gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@api.route('/popular/<kind>', methods=['GET'])
+@read_replica
+@conditional_get("favorite_count", "people", "planets")
+def get_popular(kind):
+    # Most favorited people or planets, with their number of fans:
+    # /popular/people?limit=10, next pages with ?after=<next cursor>
+    if kind not in POPULAR:
+        raise APIException(f"Unknown kind '{kind}'", status_code=404)
+    # The cursor is [fans, id]
+    limit, after = parse_page_args(request.args, sort=[(FavoriteCount.count, True)])
+    try:
+        items, next_cursor = popular_page(kind, limit, after)
+        response = jsonify(items)
+        return add_next_link(response, next_cursor, request.base_url, request.args), 200
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+
+@api.route('/people/<int:people_id>/related', methods=['GET'])
+def get_related_people(people_id):
+    # People favorited by the users who favorited this person, best first
+    # with their similarity score (see related.py)
+    return related_response("people", people_id)
+
+
+@api.route('/planets/<int:planet_id>/related', methods=['GET'])
+def get_related_planets(planet_id):
+    return related_response("planets", planet_id)
+
+
+def related_response(kind, item_id):
+    # The scores come from the favorites index, which follows the primary,
+    # so these routes are not sent to the replicas. The ETag changes with the
+    # items and with every new batch of scores.
+    table = RELATED_TABLES[kind]
+    versions, _ = get_table_versions((kind, table))
+    # Also the version of the cached items (see cache.py)
+    g.table_versions = versions
+    generation, related_ids, scores = related_items.related(kind, item_id, versions[table], current_app._get_current_object())
+    etag = make_etag({kind: versions[kind], "related": generation}, request.full_path)
+    if not_modified(etag, None):
+        response = current_app.response_class(status=304)
+    else:
+        items, missing = batch_get(RELATED_MODELS[kind], [item_id, *related_ids], cache_table=kind)
+        if item_id in missing:
+            raise APIException(f"{kind} {item_id} not found", status_code=404)
+        score_of = dict(zip(related_ids, scores))
+        response = jsonify([dict(item, score=round(score_of[item["id"]], 4)) for item in items[1:]])
+    response.set_etag(etag)
+    return response
+
+
+@api.route('/user/<int:id>/favorites', methods=['GET'])
+@read_your_writes
+def get_user_favorites(id):
+    # Ids of the favorite people, planets and vehicles of a user, served by
+    # the in-process index (see adjacency.py), usually without any query.
+    # Not routed to the replicas: the index follows the versions of the
+    # primary.
+    return index_response(id, lambda: favorites_index.favorites(id))
+
+
+@api.route('/user/<int:id>/favorites/<kind>/<int:item_id>', methods=['GET'])
+@read_your_writes
+def is_user_favorite(id, kind, item_id):
+    # {"favorite": true} when item_id is a favorite people / planet /
+    # vehicle of the user
+    if kind not in INDEXED_FAVORITES:
+        raise APIException(f"Unknown kind '{kind}'", status_code=404)
+    return index_response(id, lambda: {"favorite": favorites_index.contains(kind, id, item_id)})
+
+
+def index_response(user_id, payload):
+    # Like @conditional_get, with the versions the favorites index answers
+    # from instead of the ones in the database
+    versions = favorites_index.refresh()
+    if not favorites_index.has_user(user_id):
+        raise APIException("User not found", status_code=404)
+    etag = make_etag(versions, request.full_path)
+    if not_modified(etag, None):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(payload())
+    response.set_etag(etag)
+    return response
+
+
+@api.route('/user/<int:id>/favorites', methods=['POST'])
 def add_fav_to_user(id):
     # When a user select a character or a planet as favorite by its name, the info will be send as follows
     # {
@@ -230,58 +601,68 @@ def add_fav_to_user(id):
     #     "planets": ["planet2"]
     # }
 
-    # also it can be changed to id instead of name and the code refactorized
+    # Names are resolved with one IN query per entity type and all the new
+    # favorites are stored in a single transaction. The response includes
+    # the status of every name: added / already present / unknown.
+    # With FAVORITES_WRITE_BEHIND the changes are queued (see writebehind.py)
+    # and the response is a 202: the changes are accepted, reads served by
+    # this worker see them at once, other workers within
+    # FAVORITES_FLUSH_INTERVAL_MS.
+    return update_user_favorites(id, add_favorites_by_name, 'Favorites have been updated')
+
+
+@api.route('/user/<int:id>/favorites', methods=['DELETE'])
+def remove_fav_from_user(id):
+    # Same body as the POST, the status of every name is removed / not
+    # present / unknown
+    return update_user_favorites(id, remove_favorites_by_name, 'Favorites have been removed')
+
+
+def update_user_favorites(id, update, message):
     fav_dictionary = request.get_json(force=True)
-    user_to_add_fav = User.query.get_or_404(id)
+    user_to_add_fav = user_query(USER_FAVORITES).get_or_404(id)
+    queue = favorites_queue if FAVORITES_WRITE_BEHIND else None
 
     try:
-        if 'people' in fav_dictionary:
-            people_names = fav_dictionary['people']
-            people_ids = []
-            for name in people_names:
-                person = People.query.filter_by(name=name).first()
-                if person:
-                    people_ids.append(person)
-            user_to_add_fav.fav_people.extend(people_ids)
+        status = update(user_to_add_fav, fav_dictionary, queue)
+        if queue is None:
             db.session.commit()
-        if 'planets' in fav_dictionary:
-            planets_names = fav_dictionary['planets']
-            planets_ids = []
-            for name in planets_names:
-                planet = Planets.query.filter_by(name=name).first()
-                if planet:
-                    planets_ids.append(planet)
-            user_to_add_fav.fav_planets.extend(planets_ids)
-            db.session.commit()
-
-        return jsonify({"message": 'Favorites have been updated', "fav_people": [person.serialize() for person in user_to_add_fav.fav_people], "fav_planets": [planet.serialize() for planet in user_to_add_fav.fav_planets]}), 200
+        favorites = current_favorites(user_to_add_fav, queue)
+        return jsonify({"message": message, "status": status, "fav_people": [person.serialize() for person in favorites["people"]], "fav_planets": [planet.serialize() for planet in favorites["planets"]]}), 200 if queue is None else 202
+    except APIException:
+        db.session.rollback()
+        raise
     except Exception as e:
+        db.session.rollback()
         return jsonify({"message": f"Error: {str(e)} mal"}), 500
 
 
-@app.route('/delete/people/<int:id>', methods=['DELETE'])
+@api.route('/delete/people/<int:id>', methods=['DELETE'])
 def delete_people_by_id(id):
+    # The person is removed from the favorites of every user as well
     try:
-        person = People.query.get_or_404(id)
-        db.session.delete(person)
+        if not delete_where("people", People.id == id):
+            return jsonify({"msg": "Person not found"}), 404
         db.session.commit()
         return jsonify({"msg": "Person successfully deleted"}), 200
     except Exception as e:
+        db.session.rollback()
         return jsonify({"msg": f"Error: {str(e)}"}), 500
 
 
-@app.route('/delete/planet/<int:id>', methods=['DELETE'])
+@api.route('/delete/planet/<int:id>', methods=['DELETE'])
 def delete_planet_by_id(id):
     try:
-        planet = Planets.query.get_or_404(id)
-        db.session.delete(planet)
+        if not delete_where("planets", Planets.id == id):
+            return jsonify({"msg": "Planet not found"}), 404
         db.session.commit()
         return jsonify({"msg": "Planet successfully deleted"}), 200
     except Exception as e:
+        db.session.rollback()
         return jsonify({"msg": f"Error: {str(e)}"}), 500
 
 
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=PORT, debug=False)
+    create_app().run(host='0.0.0.0', port=PORT, debug=False)
@@ -0,0 +1,249 @@
+# ASGI entry point, an alternative to wsgi.py for I/O bound deployments:
+#
+#     uvicorn asgi:application --app-dir src
+#     gunicorn asgi:application -k uvicorn.workers.UvicornWorker --chdir ./src/
+#
+# The read endpoints (GET /people, /planets, /vehicles, /users and their
+# item routes) are served here on an async SQLAlchemy engine (aiosqlite
+# locally, asyncpg in production) with the models of models.py, so a slow
+# query does not block the worker. Everything else is passed to the Flask
+# app in app.py, which runs in a thread pool.
+#
+# Needs asgiref, uvicorn, greenlet (sqlalchemy[asyncio]) and aiosqlite or
+# asyncpg, all in the Pipfile. Start it locally with `pipenv run start-asgi`.
+# ASYNC_DATABASE_URL overrides the URL derived from DATABASE_URL.
+#
+# Responses are compressed as in the Flask app (see compression.py). The
+# ?shape=columns and MessagePack representations (see encoding.py) and the
+# ?ids= batch lookups (see batch.py) are left to the Flask app.
+
+import asyncio
+import json
+import os
+import re
+from urllib.parse import parse_qsl
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import http_date, parse_accept_header, parse_date, parse_etags
+from app import create_app, USER_TABLES
+from models import User, People, Planets, Vehicles, TableVersion
+from utils import APIException
+from pagination import parse_page_args, parse_fields, split_page, next_link_headers
+from filters import parse_filters, parse_sort, after_clause, order_by_clauses
+from loading import USER_SERIALIZE
+from etag import make_etag, is_not_modified
+from versions import versions_from_rows
+from encoding import prefers_msgpack
+from compression import COMPRESSION, COMPRESS_MIN_SIZE, choose_encoding, compress
+from writebehind import favorites_queue
+from database import (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+                      DB_POOL_PRE_PING, DB_STATEMENT_TIMEOUT, SIMULATED_DB_LATENCY)
+
+
+def async_database_url(url):
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:"):
+        return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+    return url
+
+
+def async_engine_options(url):
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.startswith("sqlite"):
+        return options
+    options.update({
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    })
+    if DB_STATEMENT_TIMEOUT and url.startswith("postgresql"):
+        options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}}
+    return options
+
+
+app = create_app()
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_database_url(
+    app.config["SQLALCHEMY_DATABASE_URI"])
+
+engine = create_async_engine(ASYNC_DATABASE_URL, **async_engine_options(ASYNC_DATABASE_URL))
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+flask_application = WsgiToAsgi(app)
+
+
+async def execute(session, statement):
+    if SIMULATED_DB_LATENCY:
+        await asyncio.sleep(SIMULATED_DB_LATENCY)
+    return await session.execute(statement)
+
+
+class Request:
+    def __init__(self, scope):
+        self.scope = scope
+        self.path = scope["path"]
+        self.query_string = scope["query_string"].decode("latin-1")
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.headers = Headers([(key.decode("latin-1"), value.decode("latin-1"))
+                                for key, value in scope["headers"]])
+
+    @property
+    def base_url(self):
+        scheme = self.scope.get("scheme", "http")
+        host = self.headers.get("Host", "localhost")
+        return f"{scheme}://{host}{self.path}"
+
+    @property
+    def full_path(self):
+        # Same value as flask.request.full_path, used in the ETag
+        return f"{self.path}?{self.query_string}"
+
+
+async def send_response(send, status, body=b"", headers=None, method="GET"):
+    headers = dict(headers or {})
+    raw_headers = [(key.lower().encode("latin-1"), str(value).encode("latin-1")) for key, value in headers.items()]
+    raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": b"" if method == "HEAD" else body})
+
+
+def json_body(value):
+    return json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8") + b"\n"
+
+
+async def keyset_page(session, model, args, filterable=True, options=()):
+    # Async version of pagination.keyset_page() with the same parameters
+    filters = parse_filters(model, args) if filterable else []
+    sort = parse_sort(model, args) if filterable else []
+    limit, after = parse_page_args(args, sort)
+    fields = parse_fields(args, model.public_fields)
+
+    if fields:
+        extra = [column.key for column, _ in sort if column.key not in fields]
+        statement = select(*[getattr(model, field) for field in fields + extra])
+    else:
+        statement = select(model).options(*options)
+    if after is not None:
+        statement = statement.where(after_clause(model, sort, after))
+    statement = statement.where(*filters).order_by(*order_by_clauses(model, sort)).limit(limit + 1)
+
+    result = await execute(session, statement)
+    rows = result.all() if fields else result.scalars().all()
+    rows, next_cursor = split_page(rows, limit, sort)
+    if fields:
+        return [{field: getattr(row, field) for field in fields} for row in rows], next_cursor
+    return [row.serialize() for row in rows], next_cursor
+
+
+async def list_people(session, request):
+    people, next_cursor = await keyset_page(session, People, request.args)
+    return {"msg": "People succesfully accessed", "people": people, "next": next_cursor}, next_cursor
+
+
+async def list_planets(session, request):
+    return await keyset_page(session, Planets, request.args)
+
+
+async def list_vehicles(session, request):
+    return await keyset_page(session, Vehicles, request.args)
+
+
+async def list_users(session, request):
+    return await keyset_page(session, User, request.args, filterable=False, options=USER_SERIALIZE)
+
+
+async def get_item(session, model, item_id, options=()):
+    result = await execute(session, select(model).options(*options).where(model.id == item_id))
+    item = result.scalars().first()
+    if item is None:
+        raise APIException("Not found", status_code=404)
+    return item.serialize(), None
+
+
+# (pattern, tables read, handler) handler(session, request, *groups) returns
+# (body, next_cursor)
+ROUTES = [
+    (re.compile(r"^/people/?$"), ("people",), list_people),
+    (re.compile(r"^/people/(\d+)/?$"), ("people",),
+     lambda session, request, item_id: get_item(session, People, int(item_id))),
+    (re.compile(r"^/planets/?$"), ("planets",), list_planets),
+    (re.compile(r"^/planets/(\d+)/?$"), ("planets",),
+     lambda session, request, item_id: get_item(session, Planets, int(item_id))),
+    (re.compile(r"^/vehicles/?$"), ("vehicles",), list_vehicles),
+    (re.compile(r"^/users/?$"), USER_TABLES, list_users),
+    (re.compile(r"^/user/(\d+)/?$"), USER_TABLES,
+     lambda session, request, item_id: get_item(session, User, int(item_id), USER_SERIALIZE)),
+]
+
+
+def default_representation(request):
+    return (request.args.get("shape", "objects") == "objects"
+            and not prefers_msgpack(parse_accept_header(request.headers.get("Accept"), MIMEAccept)))
+
+
+async def handle_read(scope, receive, send, tables, handler, groups):
+    request = Request(scope)
+    method = scope["method"]
+    if "ids" in request.args or not default_representation(request):
+        return await flask_application(scope, receive, send)
+    # Read your writes, as @read_your_writes in app.py
+    if tables == USER_TABLES and favorites_queue.has_pending(int(groups[0]) if groups else None):
+        await asyncio.to_thread(favorites_queue.flush)
+    async with Session() as session:
+        try:
+            # Conditional GET, same ETag as the Flask app (see etag.py)
+            result = await execute(session, select(TableVersion).where(TableVersion.table_name.in_(list(tables))))
+            versions, last_modified = versions_from_rows(tables, result.scalars().all())
+            etag = make_etag(versions, request.full_path)
+            headers = {"ETag": f'"{etag}"', "Access-Control-Allow-Origin": "*"}
+            if last_modified is not None:
+                headers["Last-Modified"] = http_date(last_modified)
+
+            if_none_match = parse_etags(request.headers.get("If-None-Match"))
+            if_modified_since = parse_date(request.headers.get("If-Modified-Since"))
+            if is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+                return await send_response(send, 304, headers=headers, method=method)
+
+            body, next_cursor = await handler(session, request, *groups)
+        except APIException as error:
+            return await send_response(send, error.status_code, json_body(error.to_dict()),
+                                       {"Content-Type": "application/json"}, method)
+
+    headers["Content-Type"] = "application/json"
+    headers.update(next_link_headers(next_cursor, request.base_url, request.args))
+    body = json_body(body)
+    headers["Vary"] = "Accept, Accept-Encoding" if COMPRESSION else "Accept"
+    if COMPRESSION:
+        encoding = choose_encoding(parse_accept_header(request.headers.get("Accept-Encoding")))
+        if encoding is not None and len(body) >= COMPRESS_MIN_SIZE:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["ETag"] = "W/" + headers["ETag"]
+    await send_response(send, 200, body, headers, method)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await engine.dispose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+        for pattern, tables, handler in ROUTES:
+            match = pattern.match(scope["path"])
+            if match:
+                return await handle_read(scope, receive, send, tables, handler, match.groups())
+    return await flask_application(scope, receive, send)
@@ -0,0 +1,57 @@
+import os
+from utils import APIException
+from cache import catalog_cache
+from favorites import chunked
+
+# Batch lookup by id for the list endpoints: /people?ids=3,1,2 returns the
+# same items as /people/3, /people/1 and /people/2 in one request.
+#
+#     BATCH_MAX_IDS=1000   most ids per request
+#
+# The ids are loaded with one IN query per chunk of IN_CHUNK_SIZE ids. Catalog
+# items go through the same cache entries as the item routes ("item:<id>"),
+# so a batch reuses the items cached by single lookups and the other way
+# around.
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", 1000))
+
+
+def parse_ids(value):
+    # "3,1,2,1" -> [3, 1, 2], duplicates are dropped and the order is kept
+    try:
+        ids = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        raise APIException("ids must be a comma separated list of integers", status_code=400)
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise APIException("ids must not be empty", status_code=400)
+    if len(ids) > BATCH_MAX_IDS:
+        raise APIException(f"At most {BATCH_MAX_IDS} ids can be requested at once", status_code=400)
+    return ids
+
+
+def load_by_ids(model, ids, query=None):
+    # {id: serialized item} of the ids that exist
+    query = model.query if query is None else query
+    found = {}
+    for chunk in chunked(ids):
+        for item in query.filter(model.id.in_(chunk)):
+            found[item.id] = item.serialize()
+    return found
+
+
+def batch_get(model, ids, query=None, cache_table=None):
+    # Returns (items in the order of `ids`, ids that do not exist)
+    if cache_table is None:
+        found = load_by_ids(model, ids, query)
+    else:
+        suffixes = {f"item:{item_id}": item_id for item_id in ids}
+
+        def load(missing):
+            loaded = load_by_ids(model, [suffixes[suffix] for suffix in missing], query)
+            return {f"item:{item_id}": item for item_id, item in loaded.items()}
+
+        cached = catalog_cache.get_many_or_set(cache_table, list(suffixes), load)
+        found = {suffixes[suffix]: item for suffix, item in cached.items()}
+    items = [found[item_id] for item_id in ids if item_id in found]
+    missing = [item_id for item_id in ids if item_id not in found]
+    return items, missing
@@ -0,0 +1,212 @@
+import codecs
+import json
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, People, Planets, Vehicles
+from encoding import STORED_MODELS, encode_fragment
+
+# Bulk creation of catalog rows from a JSON array or an NDJSON stream.
+# Input is decoded incrementally and written in chunks, and the per-row
+# results are streamed back, so memory use does not depend on the size of
+# the payload.
+BULK_CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+
+REQUIRED = object()
+
+# Columns accepted for every entity with their type and default value
+BULK_ENTITIES = {
+    "people": (People, {
+        "gender": (str, "n/a"),
+        "hair_color": (str, "n/a"),
+        "eye_color": (str, "n/a"),
+    }),
+    "planets": (Planets, {
+        "population": (int, REQUIRED),
+        "terrain": (int, REQUIRED),
+    }),
+    "vehicles": (Vehicles, {
+        "capacity": (int, REQUIRED),
+    }),
+}
+
+CREATED = "created"
+UPDATED = "updated"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+
+def iter_ndjson(stream):
+    # One JSON object per line, blank lines are skipped
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for line in stream:
+        line = decoder.decode(line).strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+
+def iter_json_array(stream, read_size=READ_SIZE):
+    # Decodes the items of a top-level JSON array one at a time without
+    # loading the whole body
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    started = False
+    eof = False
+    while True:
+        buffer = buffer.lstrip()
+        if buffer:
+            if not started:
+                if buffer[0] != "[":
+                    raise ValueError("Expected a JSON array")
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer[0] == "]":
+                return
+            if buffer[0] == ",":
+                buffer = buffer[1:]
+                continue
+            try:
+                item, end = decoder.raw_decode(buffer)
+                buffer = buffer[end:]
+                yield item
+                continue
+            except ValueError:
+                # Incomplete item, read more unless the body is over
+                if eof:
+                    raise
+        elif eof:
+            raise ValueError("Unexpected end of JSON array")
+
+        chunk = stream.read(read_size)
+        if not chunk:
+            eof = True
+        buffer += text_decoder.decode(chunk, final=eof)
+
+
+def build_row(columns, data):
+    if not isinstance(data, dict):
+        raise ValueError("Each row must be a JSON object")
+    name = data.get("name")
+    if not isinstance(name, str) or not name:
+        raise ValueError("name is required")
+    row = {"name": name}
+    for column, (column_type, default) in columns.items():
+        value = data.get(column, default)
+        if value is REQUIRED:
+            raise ValueError(f"{column} is required")
+        if column_type is int:
+            if isinstance(value, bool):
+                raise ValueError(f"{column} must be an integer")
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{column} must be an integer")
+        elif not isinstance(value, str):
+            raise ValueError(f"{column} must be a string")
+        row[column] = value
+    return row
+
+
+def insert_statement(model, update_existing):
+    # ON CONFLICT on name guards against rows inserted concurrently between
+    # the duplicate check and the insert. Other dialects use a plain insert.
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(model)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(model)
+    else:
+        return insert(model)
+    if update_existing:
+        return statement.on_conflict_do_update(
+            index_elements=[model.name],
+            set_={column.name: statement.excluded[column.name]
+                  for column in model.__table__.columns if column.name not in ("id", "name")})
+    return statement.on_conflict_do_nothing(index_elements=[model.name])
+
+
+def write_chunk(model, columns, chunk, update_existing):
+    # chunk is a list of (index, data) pairs. Returns the result of every row.
+    results = []
+    rows = {}
+    for index, data in chunk:
+        try:
+            if isinstance(data, Exception):
+                raise data
+            row = build_row(columns, data)
+        except ValueError as e:
+            results.append({"index": index, "status": INVALID, "error": str(e)})
+            continue
+        if row["name"] in rows:
+            results.append({"index": index, "name": row["name"], "status": DUPLICATE})
+            continue
+        rows[row["name"]] = (index, row)
+
+    # One set-based query for the names already in the table
+    existing = set()
+    if rows:
+        existing = {name for (name,) in db.session.query(model.name).filter(model.name.in_(list(rows)))}
+
+    values = []
+    for name, (index, row) in rows.items():
+        if name in existing and not update_existing:
+            results.append({"index": index, "name": name, "status": DUPLICATE})
+            continue
+        if model in STORED_MODELS:
+            row["serialized"] = encode_fragment(model, row)
+        values.append(row)
+        results.append({"index": index, "name": name,
+                        "status": UPDATED if name in existing else CREATED})
+
+    if values:
+        db.session.execute(insert_statement(model, update_existing), values)
+    db.session.commit()
+    results.sort(key=lambda result: result["index"])
+    return results
+
+
+def bulk_create(entity, items, update_existing=False, chunk_size=BULK_CHUNK_SIZE):
+    # Generator of per-row results. `items` is any iterable of decoded rows
+    # (or exceptions for rows that could not be decoded).
+    model, columns = BULK_ENTITIES[entity]
+    chunk = []
+    for index, data in enumerate(items):
+        chunk.append((index, data))
+        if len(chunk) >= chunk_size:
+            yield from write_chunk(model, columns, chunk, update_existing)
+            chunk = []
+    if chunk:
+        yield from write_chunk(model, columns, chunk, update_existing)
+
+
+def stream_results(results, ndjson):
+    # Serializes the results as they are produced, followed by a summary.
+    # NDJSON input gets one result per line, JSON input gets
+    # {"results": [...], "summary": {...}}.
+    summary = {CREATED: 0, UPDATED: 0, DUPLICATE: 0, INVALID: 0}
+    error = None
+    first = True
+    if not ndjson:
+        yield '{"results": ['
+    try:
+        for result in results:
+            summary[result["status"]] += 1
+            if ndjson:
+                yield json.dumps(result) + "\n"
+            else:
+                yield ("" if first else ", ") + json.dumps(result)
+            first = False
+    except Exception as e:
+        # The status code has already been sent, report the error in the body
+        db.session.rollback()
+        error = str(e)
+    if ndjson:
+        yield json.dumps({"summary": summary, "error": error}) + "\n"
+    else:
+        yield "], " + json.dumps({"summary": summary, "error": error})[1:]
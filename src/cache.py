@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_app_context
+from versions import get_table_versions
+
+# Read-through cache for the catalog endpoints.
+#
+# Every key is prefixed with the version of the table it was read from, as
+# stored in `table_version` (versions.py). Any committed write to the table
+# bumps that version, whichever worker made it, so all the cached pages and
+# items of that table become unreachable at once and are evicted by the LRU
+# or by the TTL. The version is the one conditional_get (etag.py) read for
+# the request, so a cached value always matches the ETag sent with it.
+#
+# CACHE_TYPE=lru (default) keeps the entries in process, CACHE_TYPE=redis
+# shares them between workers using CACHE_URL, CACHE_TYPE=none disables
+# caching.
+CACHE_TYPE = os.getenv("CACHE_TYPE", "lru")
+CACHE_URL = os.getenv("CACHE_URL", "redis://localhost:6379/0")
+CACHE_TTL = int(os.getenv("CACHE_TTL", 60))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", 10000))
+
+MISSING = object()
+
+
+class LRUBackend:
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[key]
+                return MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def set_many(self, values):
+        for key, value in values.items():
+            self.set(key, value)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisBackend:
+    def __init__(self, url=CACHE_URL, ttl=CACHE_TTL):
+        # redis is an optional dependency, only needed for this backend
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get("cache:" + key)
+        if value is None:
+            return MISSING
+        return json.loads(value)
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        values = self.client.mget(["cache:" + key for key in keys])
+        return [MISSING if value is None else json.loads(value) for value in values]
+
+    def set(self, key, value):
+        self.client.set("cache:" + key, json.dumps(value), ex=self.ttl)
+
+    def set_many(self, values):
+        pipeline = self.client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipeline.set("cache:" + key, json.dumps(value), ex=self.ttl)
+        pipeline.execute()
+
+    def clear(self):
+        for key in self.client.scan_iter("cache:*"):
+            self.client.delete(key)
+
+
+class NullBackend:
+    def get(self, key):
+        return MISSING
+
+    def get_many(self, keys):
+        return [MISSING] * len(keys)
+
+    def set(self, key, value):
+        pass
+
+    def set_many(self, values):
+        pass
+
+    def clear(self):
+        pass
+
+
+class Cache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, table, suffix):
+        return f"{table}:{self.version(table)}:{suffix}"
+
+    def get_or_set(self, table, suffix, loader):
+        # Values must be JSON serializable so that every backend can store them
+        key = self.key(table, suffix)
+        value = self.backend.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = loader()
+        self.backend.set(key, value)
+        return value
+
+    def get_many_or_set(self, table, suffixes, loader):
+        # loader(missing suffixes) returns {suffix: value} for the values that
+        # exist, the others are not cached. Returns {suffix: value}.
+        version = self.version(table)
+        keys = {suffix: f"{table}:{version}:{suffix}" for suffix in suffixes}
+        values = {}
+        missing = []
+        for suffix, value in zip(keys, self.backend.get_many(list(keys.values()))):
+            if value is MISSING:
+                missing.append(suffix)
+            else:
+                values[suffix] = value
+        self.hits += len(values)
+        self.misses += len(missing)
+        if missing:
+            loaded = loader(missing)
+            self.backend.set_many({keys[suffix]: value for suffix, value in loaded.items()})
+            values.update(loaded)
+        return values
+
+    def version(self, table):
+        # The version read by conditional_get for this request, otherwise
+        # one query
+        versions = g.get("table_versions") if has_app_context() else None
+        if versions is not None and table in versions:
+            return versions[table]
+        return get_table_versions([table])[0][table]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+def create_backend(cache_type=CACHE_TYPE):
+    if cache_type == "redis":
+        return RedisBackend()
+    if cache_type == "none":
+        return NullBackend()
+    return LRUBackend()
+
+
+catalog_cache = Cache(create_backend())
@@ -0,0 +1,15 @@
+import click
+from popularity import reconcile_favorite_counts
+
+# Flask CLI commands, run them with `flask <command>` (FLASK_APP=src/app.py)
+
+
+def setup_commands(app):
+
+    @app.cli.command("reconcile-favorite-counts")
+    def reconcile_favorite_counts_command():
+        # Rebuilds the /popular counts from the favorite tables, for example
+        # after favorites were edited with flask-admin or plain SQL
+        corrected = reconcile_favorite_counts()
+        for kind, count in corrected.items():
+            click.echo(f"{kind}: {count} counts corrected")
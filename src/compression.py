@@ -0,0 +1,70 @@
+import gzip
+import os
+from flask import request
+
+# Compressed responses, negotiated with Accept-Encoding.
+#
+#     COMPRESSION=true            compress the responses of the API
+#     COMPRESS_MIN_SIZE=1024      smaller bodies are sent as they are
+#     COMPRESS_GZIP_LEVEL=5       zlib level, 6 is the zlib default
+#     COMPRESS_BROTLI_QUALITY=4   0..11, the default 11 is far too slow per request
+#
+# br is offered when `brotli` (in the Pipfile) is installed, and wins
+# over gzip when the client accepts both with the same quality. The levels
+# are picked for CPU (see benchmarks/encoding_benchmark.py): on the list pages
+# gzip 5 is within 5% of the size of gzip 9 at about half the time, brotli 4
+# is smaller than gzip 5 and about as fast, brotli 11 is 40 to 60 times slower.
+#
+# A compressed response gets a weak ETag: it is the same representation as
+# the uncompressed one, byte for byte once decoded. Streamed responses are
+# not buffered to be compressed, /export compresses its own stream.
+COMPRESSION = os.getenv("COMPRESSION", "true").lower() in ("1", "true", "yes")
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", 5))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+
+COMPRESS_MIMETYPES = {"application/json", "application/msgpack", "application/x-ndjson",
+                      "text/csv", "text/plain", "text/html"}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def choose_encoding(accept_encodings):
+    # accept_encodings is a werkzeug Accept, None when nothing acceptable
+    return accept_encodings.best_match(ENCODINGS)
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response):
+    # after_request hook
+    if (response.mimetype not in COMPRESS_MIMETYPES or response.is_streamed
+            or response.direct_passthrough or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None or (response.content_length or 0) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    if COMPRESSION:
+        app.after_request(compress_response)
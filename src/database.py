@@ -0,0 +1,88 @@
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from metrics import registry, LATENCY_BUCKETS
+
+# Engine and connection pool configuration from environment variables.
+#
+#     DB_POOL_SIZE=5            connections kept open per worker
+#     DB_MAX_OVERFLOW=10        extra connections allowed under load
+#     DB_POOL_TIMEOUT=30        seconds to wait for a free connection
+#     DB_POOL_RECYCLE=1800      seconds before a connection is replaced
+#     DB_POOL_PRE_PING=true     test connections on checkout (survives db restarts)
+#     DB_STATEMENT_TIMEOUT=0    milliseconds, postgres only, 0 disables it
+#
+# The pool options are ignored for sqlite, which does not use a QueuePool.
+#
+# SIMULATED_DB_LATENCY_MS adds a delay before every statement, to reproduce a
+# remote database in benchmarks (see benchmarks/async_benchmark.py). Never
+# set it in production.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", 0))
+SIMULATED_DB_LATENCY = float(os.getenv("SIMULATED_DB_LATENCY_MS", 0)) / 1000
+
+pool_checkout_wait = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.", LATENCY_BUCKETS)
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long every checkout waited for a connection
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            with registry.lock:
+                pool_checkout_wait.observe((), time.perf_counter() - started)
+
+
+if SIMULATED_DB_LATENCY:
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _simulate_latency(conn, cursor, statement, parameters, context, executemany):
+        # The async engine (asgi.py) awaits the delay instead of blocking
+        if not conn.dialect.is_async:
+            time.sleep(SIMULATED_DB_LATENCY)
+
+
+def engine_options(database_uri):
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if database_uri.startswith("sqlite"):
+        return options
+    options.update({
+        "poolclass": TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    })
+    if DB_STATEMENT_TIMEOUT and database_uri.startswith("postgresql"):
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"}
+    return options
+
+
+def collect_pool_stats(registry, engine):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+    capacity = pool.size() + DB_MAX_OVERFLOW
+    checked_out = pool.checkedout()
+    registry.gauge("db_pool_size", "Configured size of the connection pool.").set((), pool.size())
+    registry.gauge("db_pool_checked_out", "Connections currently in use.").set((), checked_out)
+    registry.gauge("db_pool_overflow", "Connections open beyond the pool size.").set((), max(pool.overflow(), 0))
+    registry.gauge("db_pool_saturation", "Connections in use over the pool capacity.").set(
+        (), checked_out / capacity if capacity else 0.0)
+
+
+def dispose_engine(app, db):
+    # Called in every worker right after the fork (see gunicorn.conf.py): the
+    # connections inherited from the master must not be shared, so the child
+    # forgets them without closing them and opens its own.
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
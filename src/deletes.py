@@ -0,0 +1,65 @@
+from sqlalchemy import and_, delete, func, select
+from models import db, User, People, Planets, Vehicles, FavoritePeople, FavoritePlanets, FavoriteVehicles
+from favorites import chunked
+from popularity import POPULAR, adjust_favorite_counts, forget_favorite_counts
+
+# Set-based deletes for the delete endpoints and DELETE /bulk/<entity>.
+#
+# Nothing is loaded through the ORM: for every chunk of ids (or for the whole
+# filter) the favorite counts are fixed first, then the favorite rows pointing
+# at the targets are deleted, then the targets themselves, one statement each.
+# The caller commits, so a delete is all or nothing. The deleted rows are
+# never loaded, so the session is not synchronized with them.
+
+# entity -> (model, [(association model, column referencing the model)])
+DELETE_ENTITIES = {
+    "users": (User, [(FavoritePeople, "user_id"), (FavoritePlanets, "user_id"),
+                     (FavoriteVehicles, "user_id")]),
+    "people": (People, [(FavoritePeople, "people_id")]),
+    "planets": (Planets, [(FavoritePlanets, "planet_id")]),
+    "vehicles": (Vehicles, [(FavoriteVehicles, "vehicle_id")]),
+}
+
+
+def forget_favorites_of_users(user_ids):
+    # The counts of the items the deleted users had as favorite, one grouped
+    # query per kind. `user_ids` is a list or a SELECT of ids.
+    for kind, (_, favorite, column) in POPULAR.items():
+        item_column = getattr(favorite, column)
+        deltas = db.session.execute(
+            select(item_column, func.count())
+            .where(favorite.user_id.in_(user_ids), item_column.isnot(None))
+            .group_by(item_column))
+        adjust_favorite_counts(kind, {item_id: -count for item_id, count in deltas})
+
+
+def delete_where(entity, clause):
+    # Deletes the rows of `entity` matching `clause` with everything that
+    # references them. Returns the number of deleted rows.
+    model, associations = DELETE_ENTITIES[entity]
+    target_ids = select(model.id).where(clause).scalar_subquery()
+    if entity == "users":
+        forget_favorites_of_users(target_ids)
+    elif entity in POPULAR:
+        forget_favorite_counts(entity, target_ids)
+    for association, column in associations:
+        db.session.execute(delete(association).where(getattr(association, column).in_(target_ids))
+                           .execution_options(synchronize_session=False))
+    return db.session.execute(delete(model).where(clause).execution_options(synchronize_session=False)).rowcount
+
+
+def delete_by_ids(entity, ids):
+    # Returns (number of deleted rows, ids that did not exist)
+    model = DELETE_ENTITIES[entity][0]
+    deleted = 0
+    missing = []
+    for chunk in chunked(ids):
+        found = {item_id for (item_id,) in db.session.execute(select(model.id).where(model.id.in_(chunk)))}
+        missing.extend(item_id for item_id in chunk if item_id not in found)
+        if found:
+            deleted += delete_where(entity, model.id.in_(sorted(found)))
+    return deleted, missing
+
+
+def delete_by_filters(entity, filters):
+    return delete_where(entity, and_(*filters))
@@ -0,0 +1,148 @@
+import json
+import os
+from flask import request, jsonify, Response
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from models import People, Planets
+from utils import APIException
+from metrics import timed_serialization
+
+# Pre-encoded JSON for catalog rows.
+#
+# People and Planets keep their serialized JSON (without the id, which is
+# not known before the INSERT) in the `serialized` column. It is refreshed
+# by the mapper events below on every ORM insert/update and by the bulk
+# endpoint for Core inserts. With SERIALIZED_JSON_STORE=true the list
+# endpoints build their response by concatenating these fragments instead
+# of calling serialize() and jsonify for every row.
+SERIALIZED_JSON_STORE = os.getenv("SERIALIZED_JSON_STORE", "false").lower() in ("1", "true", "yes")
+
+# JSON_PROVIDER=orjson uses orjson for jsonify/request.get_json when installed
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "default")
+
+STORED_MODELS = (People, Planets)
+
+
+def encode_fragment(model, values):
+    # `values` is a model instance or a dict of column values
+    get = values.get if isinstance(values, dict) else lambda field: getattr(values, field)
+    fields = {field: get(field) for field in model.public_fields if field != "id"}
+    return json.dumps(fields)[1:-1]
+
+
+def encode_row(row_id, fragment):
+    return f'{{"id": {row_id}, {fragment}}}'
+
+
+@timed_serialization
+def encode_array(encoded_rows):
+    return "[" + ", ".join(encoded_rows) + "]"
+
+
+def _refresh_fragment(mapper, connection, target):
+    target.serialized = encode_fragment(type(target), target)
+
+
+for stored_model in STORED_MODELS:
+    event.listen(stored_model, "before_insert", _refresh_fragment)
+    event.listen(stored_model, "before_update", _refresh_fragment)
+
+
+def encoded_columns(model):
+    # Columns to select for encoded_rows()
+    return [model.serialized] + [getattr(model, field) for field in model.public_fields]
+
+
+@timed_serialization
+def encoded_rows(model, rows):
+    # rows have the encoded_columns() of the model. Rows written before the
+    # column existed (serialized is NULL) are encoded from their columns,
+    # the next ORM update of the row stores their fragment.
+    return [encode_row(row.id, encode_fragment(model, row._mapping) if row.serialized is None else row.serialized)
+            for row in rows]
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    def __init__(self, app):
+        # orjson is an optional dependency, only needed for this provider
+        import orjson
+        self.orjson = orjson
+        super().__init__(app)
+
+    def dumps(self, obj, **kwargs):
+        option = self.orjson.OPT_NON_STR_KEYS
+        if kwargs.get("sort_keys", self.sort_keys):
+            option |= self.orjson.OPT_SORT_KEYS
+        return self.orjson.dumps(obj, default=self.default, option=option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return self.orjson.loads(s)
+
+
+def configure_json(app, provider=JSON_PROVIDER):
+    if provider == "orjson":
+        app.json = OrjsonProvider(app)
+
+
+# Representations of the list endpoints (/people, /planets, /users).
+#
+# ?shape=columns sends the column names once and the rows as arrays,
+# {"columns": ["id", "name"], "rows": [[1, "Luke"], ...]}, instead of one
+# object per row. Accept: application/msgpack sends the same payload as
+# MessagePack. `msgpack` is in the Pipfile; an install without it answers
+# with JSON.
+MSGPACK_MIMETYPE = "application/msgpack"
+LIST_SHAPES = ("objects", "columns")
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def parse_shape(args):
+    shape = args.get("shape", "objects")
+    if shape not in LIST_SHAPES:
+        raise APIException(f"Unknown shape '{shape}', use one of: {', '.join(LIST_SHAPES)}", status_code=400)
+    return shape
+
+
+def to_columns(items):
+    # items are dicts with the same keys, in the same order
+    columns = list(items[0]) if items else []
+    return {"columns": columns, "rows": [[item[column] for column in columns] for item in items]}
+
+
+def shaped(items, shape):
+    return to_columns(items) if shape == "columns" else items
+
+
+def prefers_msgpack(accept_mimetypes):
+    # accept_mimetypes is a werkzeug MIMEAccept, JSON wins ties
+    if msgpack is None:
+        return False
+    return accept_mimetypes.best_match(["application/json", MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE
+
+
+def wants_msgpack():
+    return prefers_msgpack(request.accept_mimetypes)
+
+
+def default_representation(args):
+    # JSON objects, the only shape the pre-encoded JSON can serve
+    return parse_shape(args) == "objects" and not wants_msgpack()
+
+
+@timed_serialization
+def pack(payload):
+    return msgpack.packb(payload)
+
+
+def list_response(payload):
+    # jsonify(payload), or its MessagePack encoding
+    if wants_msgpack():
+        response = Response(pack(payload), mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(payload)
+    response.vary.add("Accept")
+    return response
@@ -0,0 +1,55 @@
+import hashlib
+from functools import wraps
+from flask import g, request, make_response
+from versions import get_table_versions
+from encoding import wants_msgpack
+
+# Conditional GET for read endpoints. The ETag is derived from the versions
+# of the tables the endpoint reads (kept in `table_version`) and the request
+# URL, so checking it costs one small query and no serialization.
+
+
+def make_etag(versions, url):
+    key = url + "|" + ",".join(f"{table}:{version}" for table, version in sorted(versions.items()))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def is_not_modified(etag, last_modified, if_none_match, if_modified_since):
+    # if_none_match is a werkzeug ETags, if_modified_since a datetime or None
+    if if_none_match:
+        # Weak comparison, compressed responses have a weak ETag
+        return if_none_match.contains_weak(etag)
+    if if_modified_since and last_modified is not None:
+        # HTTP dates have a resolution of one second
+        return last_modified.replace(microsecond=0) <= if_modified_since
+    return False
+
+
+def not_modified(etag, last_modified):
+    return is_not_modified(etag, last_modified, request.if_none_match, request.if_modified_since)
+
+
+def conditional_get(*tables):
+    # Usage: @conditional_get("people") on a view that only reads `people`
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions, last_modified = get_table_versions(tables)
+            # Also available to the view
+            g.table_versions = versions
+            # The MessagePack and the JSON response of a URL are different
+            # representations (see encoding.py)
+            etag = make_etag(versions, request.full_path + ("|msgpack" if wants_msgpack() else ""))
+
+            if not_modified(etag, last_modified):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            return response
+        return wrapper
+    return decorator
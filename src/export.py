@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import os
+import zlib
+from sqlalchemy import select
+from models import db, People, Planets, Vehicles
+
+# Full dump of a catalog table for GET /export/<entity>.
+#
+#     EXPORT_BATCH_SIZE=1000   rows fetched from the cursor at a time
+#
+# The rows are read with a server-side cursor (stream_results, on sqlite the
+# cursor is always incremental) one batch at a time, encoded and sent with
+# chunked transfer encoding, so memory use does not depend on the size of
+# the table. The whole export is one SELECT, a consistent snapshot of the
+# table on postgres.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+EXPORT_ENTITIES = {"people": People, "planets": Planets, "vehicles": Vehicles}
+
+# format -> mimetype
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def export_batches(model, batch_size=EXPORT_BATCH_SIZE):
+    # Lists of rows with the public columns, in id order
+    columns = [model.__table__.c[field] for field in model.public_fields]
+    statement = select(*columns).order_by(model.id).execution_options(stream_results=True)
+    result = db.session.execute(statement).yield_per(batch_size)
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def encode_ndjson(fields, batches):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(fields, row))) + "\n" for row in rows)
+
+
+def encode_csv(fields, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzip_chunks(chunks):
+    # The gzip stream is produced as the chunks come
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_entity(entity, export_format, gzip=False, batch_size=EXPORT_BATCH_SIZE):
+    model = EXPORT_ENTITIES[entity]
+    encode = encode_csv if export_format == "csv" else encode_ndjson
+    chunks = encode(model.public_fields, export_batches(model, batch_size))
+    if gzip:
+        return gzip_chunks(chunks)
+    return (chunk.encode("utf-8") for chunk in chunks)
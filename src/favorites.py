@@ -0,0 +1,128 @@
+import json
+from utils import APIException
+from models import db, People, Planets
+from popularity import adjust_favorite_counts
+from adjacency import record_favorite_changes
+
+# Keep IN lists below the bound-parameter limit of sqlite (999)
+IN_CHUNK_SIZE = 500
+
+ADDED = "added"
+ALREADY_PRESENT = "already present"
+UNKNOWN = "unknown"
+REMOVED = "removed"
+NOT_PRESENT = "not present"
+
+# Request key -> model, User.fav_<key> is the collection
+FAVORITE_MODELS = {"people": People, "planets": Planets}
+
+
+def chunked(items, size=IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def resolve_names(model, names):
+    # Resolve many names with one IN query per chunk instead of one query per name
+    found = {}
+    for chunk in chunked(list(dict.fromkeys(names))):
+        for item in model.query.filter(model.name.in_(chunk)):
+            found[item.name] = item
+    return found
+
+
+def update_by_name(names, found, current_ids, add):
+    # Returns the status of every name and the items to add (or remove),
+    # current_ids is updated in place
+    key_status = {}
+    changed = []
+    for name in names:
+        item = found.get(name)
+        if item is None:
+            key_status[name] = UNKNOWN
+        elif (item.id in current_ids) == add:
+            key_status[name] = key_status.get(name, ALREADY_PRESENT if add else NOT_PRESENT)
+        else:
+            changed.append(item)
+            if add:
+                current_ids.add(item.id)
+            else:
+                current_ids.discard(item.id)
+            key_status[name] = ADDED if add else REMOVED
+    return key_status, changed
+
+
+def check_names(fav_dictionary):
+    # Every name must be a string, the error lists the other entries
+    if not isinstance(fav_dictionary, dict):
+        raise APIException("The body must be an object with lists of names", status_code=400)
+    for key in FAVORITE_MODELS:
+        names = fav_dictionary.get(key, [])
+        if not isinstance(names, list):
+            raise APIException(f"'{key}' must be a list of names", status_code=400)
+        invalid = [name for name in names if not isinstance(name, str)]
+        if invalid:
+            raise APIException(f"'{key}' must be a list of names, invalid entries: {json.dumps(invalid)}",
+                               status_code=400)
+
+
+def update_favorites_by_name(user, fav_dictionary, add=True, queue=None):
+    # fav_dictionary is the request body of POST/DELETE /user/<id>/favorites:
+    # {
+    #     "people": ["Luke Skywalker"],
+    #     "planets": ["Tatooine"]
+    # }
+    # Returns the status of every name: added / already present / unknown,
+    # or removed / not present / unknown.
+    # Without a queue everything is written in a single transaction by the
+    # caller's commit. With a queue (writebehind.py) the changes are queued
+    # and the status takes the changes still in the queue into account.
+    check_names(fav_dictionary)
+    status = {}
+    operations = []
+    for key, model in FAVORITE_MODELS.items():
+        if key not in fav_dictionary:
+            continue
+        names = fav_dictionary[key]
+        found = resolve_names(model, names)
+        favorites = getattr(user, "fav_" + key)
+        current_ids = {item.id for item in favorites}
+        if queue is not None:
+            current_ids = queue.apply_pending(key, user.id, current_ids)
+        status[key], changed = update_by_name(names, found, current_ids, add)
+
+        if queue is not None:
+            operations.extend((key, user.id, item.id, add) for item in changed)
+            continue
+        if add:
+            # The association rows are flushed together as one executemany
+            favorites.extend(changed)
+        else:
+            for item in changed:
+                favorites.remove(item)
+        adjust_favorite_counts(key, {item.id: 1 if add else -1 for item in changed})
+        record_favorite_changes(db.session, [(key, user.id, item.id, add) for item in changed])
+    if queue is not None:
+        queue.put(operations)
+    return status
+
+
+def add_favorites_by_name(user, fav_dictionary, queue=None):
+    return update_favorites_by_name(user, fav_dictionary, True, queue)
+
+
+def remove_favorites_by_name(user, fav_dictionary, queue=None):
+    return update_favorites_by_name(user, fav_dictionary, False, queue)
+
+
+def current_favorites(user, queue=None):
+    # {"people": [...], "planets": [...]} of the user, including the changes
+    # still waiting in the queue
+    if queue is None:
+        return {key: list(getattr(user, "fav_" + key)) for key in FAVORITE_MODELS}
+    favorites = {}
+    for key, model in FAVORITE_MODELS.items():
+        ids = queue.apply_pending(key, user.id, {item.id for item in getattr(user, "fav_" + key)})
+        favorites[key] = [item for chunk in chunked(sorted(ids))
+                          for item in model.query.filter(model.id.in_(chunk)).order_by(model.id)]
+    return favorites
@@ -0,0 +1,101 @@
+from sqlalchemy import and_, or_
+from utils import APIException
+
+# Declarative filtering and sorting from the query string.
+#
+#     /planets?terrain=3&population__gte=1000&sort=-population
+#     /people?eye_color__in=blue,brown&name__prefix=Lu
+#
+# Every model lists the columns that can be filtered (`filter_fields`) and
+# sorted (`sort_fields`). Those columns are indexed together with the id (see
+# migration e8b2c6d4f1a7), so the generated WHERE / ORDER BY plus the keyset
+# condition are served from an index.
+
+# Query string parameters that are not filters
+RESERVED_ARGS = {"limit", "after", "fields", "sort", "shape", "ids"}
+
+OPERATORS = ("eq", "in", "gt", "gte", "lt", "lte", "prefix")
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+
+def convert(model, field, value):
+    python_type = getattr(model, field).type.python_type
+    if python_type is int:
+        try:
+            return int(value)
+        except ValueError:
+            raise APIException(f"{field} must be an integer", status_code=400)
+    return value
+
+
+def build_clause(model, field, operator, value):
+    column = getattr(model, field)
+    if operator == "in":
+        values = [convert(model, field, item) for item in value.split(",") if item != ""]
+        return column.in_(values)
+    if operator == "prefix":
+        if column.type.python_type is not str:
+            raise APIException("prefix is only supported on text fields", status_code=400)
+        return column.startswith(value, autoescape=True)
+    if operator in RANGE_OPERATORS and column.type.python_type is str:
+        raise APIException(f"{operator} is only supported on numeric fields", status_code=400)
+    value = convert(model, field, value)
+    return {
+        "eq": column == value,
+        "gt": column > value,
+        "gte": column >= value,
+        "lt": column < value,
+        "lte": column <= value,
+    }[operator]
+
+
+def parse_filters(model, args, reserved=RESERVED_ARGS):
+    # Returns a list of SQL clauses, `field=value` is the same as `field__eq=value`
+    clauses = []
+    for key, value in args.items(multi=True):
+        if key in reserved:
+            continue
+        field, _, operator = key.partition("__")
+        operator = operator or "eq"
+        if field not in model.filter_fields:
+            raise APIException(f"Cannot filter by '{field}'", status_code=400)
+        if operator not in OPERATORS:
+            raise APIException(f"Unknown operator '{operator}'", status_code=400)
+        clauses.append(build_clause(model, field, operator, value))
+    return clauses
+
+
+def parse_sort(model, args):
+    # ?sort=-population,name returns [(Planets.population, True), (Planets.name, False)]
+    sort = args.get("sort")
+    if not sort:
+        return []
+    order = []
+    for field in sort.split(","):
+        field = field.strip()
+        descending = field.startswith("-")
+        field = field.lstrip("-")
+        if field not in model.sort_fields:
+            raise APIException(f"Cannot sort by '{field}'", status_code=400)
+        order.append((getattr(model, field), descending))
+    return order
+
+
+def order_by_clauses(model, sort):
+    # The id is always the last sort key so that the order is total
+    clauses = [column.desc() if descending else column.asc() for column, descending in sort]
+    return clauses + [model.id.asc()]
+
+
+def after_clause(model, sort, cursor):
+    # Keyset condition for "rows after `cursor`" in the given order. `cursor`
+    # holds the values of the sort columns and the id of the last row seen.
+    if not sort:
+        return model.id > cursor
+    keys = [(column, descending) for column, descending in sort] + [(model.id, False)]
+    alternatives = []
+    for index, (column, descending) in enumerate(keys):
+        equal = [keys[previous][0] == cursor[previous] for previous in range(index)]
+        after = column < cursor[index] if descending else column > cursor[index]
+        alternatives.append(and_(*equal, after))
+    return or_(*alternatives)
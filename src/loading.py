@@ -0,0 +1,24 @@
+from sqlalchemy.orm import selectinload, configure_mappers
+from models import User
+
+# The User.fav_* attributes are backrefs, they only exist once the mappers
+# have been configured
+configure_mappers()
+
+# Eager-loading strategies per endpoint. Relationships on the models are all
+# lazy, so each endpoint states up front what it is going to serialize and
+# gets it in a fixed number of queries instead of one per row.
+
+# User.serialize() walks the favorite people and planets. selectin loads
+# them for a whole page of users with one query per relationship.
+USER_SERIALIZE = (
+    selectinload(User.fav_people),
+    selectinload(User.fav_planets),
+)
+
+# The favorites endpoint serializes the same relationships
+USER_FAVORITES = USER_SERIALIZE
+
+
+def user_query(options):
+    return User.query.options(*options)
@@ -0,0 +1,208 @@
+import os
+import threading
+import time
+from functools import wraps
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-endpoint request metrics in the Prometheus text format.
+#
+# For every request we record the latency, the number of SQL statements and
+# the time spent running them (engine events), the time spent encoding the
+# body (jsonify, the pre-encoded JSON pages and MessagePack, see
+# timed_serialization) and the size of the response as sent, after
+# compression. The values are kept per process: with several gunicorn
+# workers every worker exposes its own series.
+#
+# Counts that only grow but are read from another component (cache hits,
+# queue flushes) are exported as gauges, without the _total suffix that
+# Prometheus keeps for counters.
+#
+# SERVER_TIMING=true also adds a Server-Timing header to every response, so
+# the breakdown shows up in the browser developer tools.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Metric:
+    def __init__(self, name, help_text, kind, buckets=None):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        histogram = self.series.get(labels)
+        if histogram is None:
+            histogram = self.series[labels] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def set(self, labels, value):
+        self.series[labels] = value
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in pairs) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def metric(self, name, help_text, kind, buckets=None):
+        if name not in self.metrics:
+            self.metrics[name] = Metric(name, help_text, kind, buckets)
+        return self.metrics[name]
+
+    def counter(self, name, help_text):
+        return self.metric(name, help_text, "counter")
+
+    def gauge(self, name, help_text):
+        return self.metric(name, help_text, "gauge")
+
+    def histogram(self, name, help_text, buckets):
+        return self.metric(name, help_text, "histogram", buckets)
+
+    def add_collector(self, collector):
+        # collector(registry) is called before every export to refresh gauges
+        self.collectors.append(collector)
+        return collector
+
+    def export(self):
+        for collector in self.collectors:
+            collector(self)
+        lines = []
+        with self.lock:
+            for metric in self.metrics.values():
+                lines.append(f"# HELP {metric.name} {metric.help_text}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+                for labels, value in sorted(metric.series.items()):
+                    if metric.kind != "histogram":
+                        lines.append(f"{metric.name}{format_labels(labels)} {value}")
+                        continue
+                    for bound, count in zip(value.buckets, value.counts):
+                        lines.append(f"{metric.name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+                    lines.append(f"{metric.name}_bucket{format_labels(labels, [('le', '+Inf')])} {value.total}")
+                    lines.append(f"{metric.name}_sum{format_labels(labels)} {value.sum}")
+                    lines.append(f"{metric.name}_count{format_labels(labels)} {value.total}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+requests_total = registry.counter(
+    "http_requests_total", "Requests by endpoint, method and status code.")
+request_duration = registry.histogram(
+    "http_request_duration_seconds", "Request latency by endpoint.", LATENCY_BUCKETS)
+request_sql_queries = registry.histogram(
+    "http_request_sql_queries", "SQL statements executed per request.", COUNT_BUCKETS)
+request_sql_duration = registry.histogram(
+    "http_request_sql_duration_seconds", "Time spent running SQL per request.", LATENCY_BUCKETS)
+request_serialization_duration = registry.histogram(
+    "http_request_serialization_seconds", "Time spent encoding the body per request.", LATENCY_BUCKETS)
+response_size = registry.histogram(
+    "http_response_size_bytes", "Size of the response body as sent, after compression.", SIZE_BUCKETS)
+
+
+# SQL statements are attributed to the request running on the current thread
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "metrics_started" in g:
+        g.metrics_sql_count += 1
+        g.metrics_sql_time += time.perf_counter() - context.metrics_started
+
+
+def record_serialization(seconds):
+    if has_request_context() and "metrics_started" in g:
+        g.metrics_serialization_time += seconds
+
+
+def timed_serialization(encode):
+    # Usage: @timed_serialization on a function that encodes a response body,
+    # its time is added to http_request_serialization_seconds
+    @wraps(encode)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return encode(*args, **kwargs)
+        finally:
+            record_serialization(time.perf_counter() - started)
+    return wrapper
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_sql_count = 0
+    g.metrics_sql_time = 0.0
+    g.metrics_serialization_time = 0.0
+
+
+def _after_request(response):
+    if "metrics_started" not in g:
+        return response
+    duration = time.perf_counter() - g.metrics_started
+    endpoint = (("endpoint", request.endpoint or "unknown"),)
+    with registry.lock:
+        requests_total.inc(endpoint + (("method", request.method), ("status", response.status_code)))
+        request_duration.observe(endpoint, duration)
+        request_sql_queries.observe(endpoint, g.metrics_sql_count)
+        request_sql_duration.observe(endpoint, g.metrics_sql_time)
+        request_serialization_duration.observe(endpoint, g.metrics_serialization_time)
+        # Streamed responses have no known length
+        if response.content_length is not None:
+            response_size.observe(endpoint, response.content_length)
+
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = ", ".join([
+            f"app;dur={duration * 1000:.2f}",
+            f'db;dur={g.metrics_sql_time * 1000:.2f};desc="{g.metrics_sql_count} queries"',
+            f"serialize;dur={g.metrics_serialization_time * 1000:.2f}",
+        ])
+    return response
+
+
+def init_metrics(app):
+    # Call it before init_compression: Flask runs the after_request hooks in
+    # the reverse order, so the size is recorded once the body is compressed
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    # Time every JSON encoding done through jsonify / app.json
+    app.json.dumps = timed_serialization(app.json.dumps)
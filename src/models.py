@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class User(db.Model):
@@ -9,6 +10,9 @@ class User(db.Model):
     password = db.Column(db.String(80), unique=False, nullable=False)
     is_active = db.Column(db.Boolean(), unique=False, nullable=False)
 
+    # Columns that can be requested with ?fields= (never the password)
+    public_fields = ("id", "email", "is_active")
+
     # fav_people = db.relationship('People', secondary='favorite_people',
     #                          lazy='subquery', backref='user_id')
     # fav_planets = db.relationship('Planets', secondary='favorite_planets',
@@ -31,14 +35,31 @@ class User(db.Model):
 
 
 class People(db.Model):
+    # Filter and sort columns, indexed with the id for keyset pagination
+    __table_args__ = (
+        db.Index('ix_people_gender_id', 'gender', 'id'),
+        db.Index('ix_people_hair_color_id', 'hair_color', 'id'),
+        db.Index('ix_people_eye_color_id', 'eye_color', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), unique=True, nullable=False)
     gender = db.Column(db.String(250), nullable=True)
     hair_color = db.Column(db.String(250), nullable=False)
     eye_color = db.Column(db.String(250), nullable=False)
 
+    # Pre-encoded JSON of the row without the id, see encoding.py
+    serialized = db.Column(db.Text, nullable=True)
+
+    public_fields = ("id", "name", "gender", "hair_color", "eye_color")
+    filter_fields = ("name", "gender", "hair_color", "eye_color")
+    # Only non nullable columns can be used in the keyset order
+    sort_fields = ("name", "hair_color", "eye_color")
+
+    # Loaded only when accessed; endpoints that need it pick an eager
+    # strategy explicitly (see loading.py)
     users = db.relationship('User', secondary='favorite_people',
-                            lazy='subquery', backref='fav_people')
+                            lazy='select', backref='fav_people')
 
     def __repr__(self):
         return '<People %r>' % self.name
@@ -54,13 +75,25 @@ class People(db.Model):
 
 
 class Planets(db.Model):
+    __table_args__ = (
+        db.Index('ix_planets_population_id', 'population', 'id'),
+        db.Index('ix_planets_terrain_id', 'terrain', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(80), unique=True, nullable=False)
     population = db.Column(db.Integer, nullable=False)
     terrain = db.Column(db.Integer, nullable=False)
 
+    # Pre-encoded JSON of the row without the id, see encoding.py
+    serialized = db.Column(db.Text, nullable=True)
+
+    public_fields = ("id", "name", "population", "terrain")
+    filter_fields = ("name", "population", "terrain")
+    sort_fields = ("name", "population", "terrain")
+
     user_fav = db.relationship('User', secondary='favorite_planets',
-                               lazy='subquery', backref='fav_planets')
+                               lazy='select', backref='fav_planets')
 
     def serialize(self):
         return {
@@ -72,12 +105,20 @@ class Planets(db.Model):
 
 
 class Vehicles(db.Model):
+    __table_args__ = (
+        db.Index('ix_vehicles_capacity_id', 'capacity', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(250), unique=True, nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
 
+    public_fields = ("id", "name", "capacity")
+    filter_fields = ("name", "capacity")
+    sort_fields = ("name", "capacity")
+
     user_fav = db.relationship('User', secondary='favorite_vehicles',
-                               lazy='subquery', backref='fav_vehicles')
+                               lazy='select', backref='fav_vehicles')
 
     def serialize(self):
         return {
@@ -89,6 +130,13 @@ class Vehicles(db.Model):
 
 class FavoritePeople(db.Model):
     __tablename__ = 'favorite_people'
+    # One row per (user, people). The unique index also serves the lookups
+    # by user_id, the second index the lookups by people_id. The other
+    # favorite tables follow the same layout.
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'people_id', name='uq_favorite_people_user_id_people_id'),
+        db.Index('ix_favorite_people_people_id', 'people_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     people_id = db.Column(db.Integer, db.ForeignKey('people.id'))
@@ -96,6 +144,10 @@ class FavoritePeople(db.Model):
 
 class FavoriteVehicles(db.Model):
     __tablename__ = 'favorite_vehicles'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'vehicle_id', name='uq_favorite_vehicles_user_id_vehicle_id'),
+        db.Index('ix_favorite_vehicles_vehicle_id', 'vehicle_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicles.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -103,6 +155,32 @@ class FavoriteVehicles(db.Model):
 
 class FavoritePlanets(db.Model):
     __tablename__ = 'favorite_planets'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'planet_id', name='uq_favorite_planets_user_id_planet_id'),
+        db.Index('ix_favorite_planets_planet_id', 'planet_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     planet_id = db.Column(db.Integer, db.ForeignKey('planets.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+
+
+class FavoriteCount(db.Model):
+    # Number of users that have every people / planet as favorite, kept up to
+    # date by the favorites and delete handlers (see popularity.py). The
+    # index serves the /popular leaderboards.
+    __tablename__ = 'favorite_count'
+    __table_args__ = (
+        db.Index('ix_favorite_count_kind_count_item_id', 'kind', 'count', 'item_id'),
+    )
+    kind = db.Column(db.String(20), primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class TableVersion(db.Model):
+    # Incremented on every committed write to `table_name` (see versions.py),
+    # used to build ETags without serializing the response
+    __tablename__ = 'table_version'
+    table_name = db.Column(db.String(80), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False)
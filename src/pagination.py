@@ -0,0 +1,143 @@
+import base64
+import json
+import os
+from urllib.parse import urlencode
+from utils import APIException
+from models import db
+from encoding import encode_array, encoded_columns, encoded_rows
+from filters import after_clause, order_by_clauses
+
+# Keyset (cursor) pagination. Instead of OFFSET, every page asks for the rows
+# after the last one seen ("id > last id" in the default order), so the cost
+# of a page does not depend on how deep into the table the client is.
+DEFAULT_PAGE_SIZE = int(os.getenv("PAGE_SIZE", 100))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 1000))
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token, types):
+    # `types` are the python types of the values, e.g. [str, int] for the
+    # name and the id of ?sort=name
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except ValueError:
+        raise APIException("Invalid cursor", status_code=400)
+    if not isinstance(values, list) or len(values) != len(types) or not all(
+            isinstance(value, python_type) and not isinstance(value, bool)
+            for value, python_type in zip(values, types)):
+        raise APIException("Invalid cursor", status_code=400)
+    return values
+
+
+def parse_page_args(args, sort=None):
+    # expected query string: ?limit=50&after=120
+    # When the results are sorted (see filters.py) `after` is the opaque
+    # cursor returned as `next` by the previous page, with the values of the
+    # sort columns and the id of the last row.
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise APIException("limit must be an integer", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+
+    if sort:
+        after = args.get("after")
+        types = [column.type.python_type for column, _ in sort] + [int]
+        after = decode_cursor(after, types) if after else None
+    else:
+        try:
+            after = int(args.get("after", 0))
+        except ValueError:
+            raise APIException("after must be an integer", status_code=400)
+    return min(limit, MAX_PAGE_SIZE), after
+
+
+def parse_fields(args, allowed_fields):
+    # expected query string: ?fields=name,gender
+    # The id is always returned because it is the pagination cursor
+    fields = args.get("fields")
+    if not fields:
+        return None
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed_fields]
+    if unknown:
+        raise APIException(f"Unknown fields: {', '.join(unknown)}", status_code=400)
+    if "id" not in requested:
+        requested.insert(0, "id")
+    return requested
+
+
+def keyset_rows(query, model, limit, after, filters=(), sort=()):
+    # Applies filters, order and keyset condition. Returns (rows, next_cursor)
+    # where rows have the sort columns and the id available by attribute name.
+    if after is not None:
+        query = query.filter(after_clause(model, sort, after))
+    rows = query.filter(*filters).order_by(*order_by_clauses(model, sort)).limit(limit + 1).all()
+    return split_page(rows, limit, sort)
+
+
+def split_page(rows, limit, sort=()):
+    # `rows` were fetched with limit + 1, the extra row tells if there is a
+    # next page. Returns (rows of this page, next_cursor).
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if sort:
+            next_cursor = encode_cursor([getattr(last, column.key) for column, _ in sort] + [last.id])
+        else:
+            next_cursor = last.id
+    return rows, next_cursor
+
+
+def keyset_page(model, limit, after, fields=None, query=None, filters=(), sort=()):
+    # Returns (items, next_cursor). Only the requested columns are selected
+    # when `fields` is given, otherwise the full `serialize()` is used.
+    if fields:
+        extra = [column.key for column, _ in sort if column.key not in fields]
+        query = db.session.query(*[getattr(model, field) for field in fields + extra])
+    elif query is None:
+        query = model.query
+    rows, next_cursor = keyset_rows(query, model, limit, after, filters, sort)
+
+    if fields:
+        items = [{field: getattr(row, field) for field in fields} for row in rows]
+    else:
+        items = [row.serialize() for row in rows]
+    return items, next_cursor
+
+
+def keyset_page_json(model, limit, after, filters=(), sort=()):
+    # Same as keyset_page() without fields, but returns the page already
+    # encoded as a JSON array from the pre-encoded rows (see encoding.py)
+    columns = encoded_columns(model) + [column for column, _ in sort if column.key not in model.public_fields]
+    rows, next_cursor = keyset_rows(db.session.query(*columns), model, limit, after, filters, sort)
+    return encode_array(encoded_rows(model, rows)), next_cursor
+
+
+def page_cache_key(args):
+    # Every combination of page, fields, filters and sort is cached
+    # separately. ?shape= is applied to the cached rows (see encoding.py).
+    return "page:" + urlencode(sorted((key, value) for key, value in args.items(multi=True) if key != "shape"))
+
+
+def next_link_headers(next_cursor, base_url, args):
+    # Exposes the cursor as headers so list endpoints that return a bare
+    # JSON array can paginate too.
+    if next_cursor is None:
+        return {}
+    params = {key: value for key, value in args.items() if key != "after"}
+    params["after"] = next_cursor
+    return {
+        "X-Next-Cursor": str(next_cursor),
+        "Link": f'<{base_url}?{urlencode(params)}>; rel="next"',
+    }
+
+
+def add_next_link(response, next_cursor, base_url, args):
+    response.headers.update(next_link_headers(next_cursor, base_url, args))
+    return response
@@ -0,0 +1,104 @@
+from sqlalchemy import delete, func, insert, select, update, or_, and_
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, People, Planets, FavoritePeople, FavoritePlanets, FavoriteCount
+from pagination import encode_cursor
+
+# Number of fans of every people / planet, for the /popular leaderboards.
+#
+# The counts live in `favorite_count` (kind, item_id, count) instead of being
+# computed over the favorite tables on every request. They are changed in the
+# same transaction as the favorites by the handlers that write them: the
+# favorites endpoints (favorites.py and writebehind.py) and the delete
+# endpoints (deletes.py). Other writers (flask-admin, direct SQL) are
+# not tracked, `flask reconcile-favorite-counts` rebuilds every count from
+# the favorite tables.
+
+# kind -> (item model, association model, item column)
+POPULAR = {
+    "people": (People, FavoritePeople, "people_id"),
+    "planets": (Planets, FavoritePlanets, "planet_id"),
+}
+
+
+def upsert_statement():
+    # INSERT (kind, item_id, count) that adds `count` to the existing row
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(FavoriteCount)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(FavoriteCount)
+    else:
+        return None
+    return statement.on_conflict_do_update(
+        index_elements=[FavoriteCount.kind, FavoriteCount.item_id],
+        set_={"count": FavoriteCount.count + statement.excluded["count"]})
+
+
+def adjust_favorite_counts(kind, deltas):
+    # deltas is {item_id: change}, e.g. {4: 1, 7: -1}
+    rows = [{"kind": kind, "item_id": item_id, "count": delta}
+            for item_id, delta in deltas.items() if delta]
+    if not rows:
+        return
+    statement = upsert_statement()
+    if statement is not None:
+        db.session.execute(statement, rows)
+        return
+    for row in rows:
+        result = db.session.execute(
+            update(FavoriteCount)
+            .where(FavoriteCount.kind == kind, FavoriteCount.item_id == row["item_id"])
+            .values(count=FavoriteCount.count + row["count"]))
+        if result.rowcount == 0:
+            db.session.execute(insert(FavoriteCount).values(**row))
+
+
+def forget_favorite_counts(kind, item_ids):
+    # Called when the items themselves are deleted (see deletes.py),
+    # `item_ids` is a list or a SELECT of ids
+    db.session.execute(delete(FavoriteCount).where(
+        FavoriteCount.kind == kind, FavoriteCount.item_id.in_(item_ids))
+        .execution_options(synchronize_session=False))
+
+
+def popular_page(kind, limit, after=None):
+    # Items of `kind` by number of fans, most popular first, ties by id
+    # descending so that the whole order is served by the index.
+    # `after` is the [count, id] cursor of the previous page.
+    model = POPULAR[kind][0]
+    query = (db.session.query(model, FavoriteCount.count)
+             .join(FavoriteCount, and_(FavoriteCount.kind == kind, FavoriteCount.item_id == model.id))
+             .filter(FavoriteCount.kind == kind, FavoriteCount.count > 0))
+    if after is not None:
+        count, item_id = after
+        query = query.filter(or_(FavoriteCount.count < count,
+                                 and_(FavoriteCount.count == count, FavoriteCount.item_id < item_id)))
+    rows = query.order_by(FavoriteCount.count.desc(), FavoriteCount.item_id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        item, count = rows[-1]
+        next_cursor = encode_cursor([count, item.id])
+    return [dict(item.serialize(), fans=count) for item, count in rows], next_cursor
+
+
+def reconcile_favorite_counts():
+    # Rebuilds every count from the favorite tables with one INSERT .. SELECT
+    # per kind. Returns {kind: number of counts that were wrong}.
+    corrected = {}
+    for kind, (model, favorite, column) in POPULAR.items():
+        item_column = getattr(favorite, column)
+        actual = (select(db.literal(kind), item_column, func.count())
+                  .where(item_column.isnot(None))
+                  .group_by(item_column))
+        stored = dict(db.session.query(FavoriteCount.item_id, FavoriteCount.count)
+                      .filter(FavoriteCount.kind == kind, FavoriteCount.count != 0))
+        expected = {item_id: count for _, item_id, count in db.session.execute(actual)}
+        corrected[kind] = sum(1 for item_id in stored.keys() | expected.keys()
+                              if stored.get(item_id, 0) != expected.get(item_id, 0))
+
+        db.session.execute(delete(FavoriteCount).where(FavoriteCount.kind == kind))
+        db.session.execute(insert(FavoriteCount.__table__).from_select(["kind", "item_id", "count"], actual))
+    db.session.commit()
+    return corrected
@@ -0,0 +1,173 @@
+import heapq
+import importlib.util
+import math
+import os
+import threading
+import time
+from array import array
+from collections import Counter
+from models import People, Planets
+from adjacency import favorites_index, INDEXED_FAVORITES, INDEXED_TABLES
+from versions import get_table_versions
+
+# "Users who favorited this also favorited": /people/<id>/related and
+# /planets/<id>/related.
+#
+#     RELATED_TOP_K=10               related items kept per item
+#     RELATED_REFRESH_SECONDS=300    longest time new favorites are ignored
+#
+# The similarity of two items is the cosine of their fan sets, the number of
+# users with both as favorite divided by sqrt(fans of one * fans of the
+# other). The scores of every pair are computed in one batch from the arrays
+# of the favorites index (see adjacency.py): with scipy, as the sparse
+# product Xt.X of the user x item matrix, otherwise item by item in Python.
+# numpy and scipy are only imported by the batch, they are slow to import.
+# Only the top RELATED_TOP_K of every item are kept, in a dict, so a lookup
+# does not depend on the number of favorites.
+#
+# The batch is computed on first use (in the background when a gunicorn
+# worker starts) and again, in the background, once the favorite table has
+# changed and the previous batch is older than RELATED_REFRESH_SECONDS. The
+# previous results are served meanwhile.
+RELATED_TOP_K = int(os.getenv("RELATED_TOP_K", 10))
+RELATED_REFRESH_SECONDS = float(os.getenv("RELATED_REFRESH_SECONDS", 300))
+
+# Items per block of the sparse product
+BLOCK_ROWS = 2048
+
+RELATED_MODELS = {"people": People, "planets": Planets}
+# kind -> favorite table the scores are computed from
+RELATED_TABLES = {kind: INDEXED_FAVORITES[kind][0].__tablename__ for kind in RELATED_MODELS}
+
+
+def cosine_top_k_sparse(adjacency, k):
+    # The CSR arrays of the index are the rows of the user x item matrix X.
+    # Xt.X is computed by blocks of BLOCK_ROWS items to bound the memory.
+    import numpy
+    from scipy import sparse
+    if not adjacency.items:
+        return {}
+    items = numpy.frombuffer(adjacency.items, dtype=numpy.uint32).astype(numpy.int32)
+    offsets = numpy.frombuffer(adjacency.offsets, dtype=numpy.uint32).astype(numpy.int64)
+    matrix = sparse.csr_matrix((numpy.ones(len(items)), items, offsets),
+                               shape=(len(adjacency.users), int(items.max()) + 1))
+    transposed = matrix.T.tocsr()
+    fans = numpy.diff(transposed.indptr)
+    norms = numpy.zeros(len(fans))
+    norms[fans > 0] = 1 / numpy.sqrt(fans[fans > 0])
+
+    top = {}
+    for block in range(0, len(fans), BLOCK_ROWS):
+        rows = slice(block, min(block + BLOCK_ROWS, len(fans)))
+        scores = sparse.diags(norms[rows]) @ (transposed[rows] @ matrix) @ sparse.diags(norms)
+        scores = scores.tocsr()
+        for row in numpy.flatnonzero(numpy.diff(scores.indptr)):
+            item_id = block + int(row)
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            related, row_scores = scores.indices[start:end], scores.data[start:end]
+            keep = related != item_id
+            related, row_scores = related[keep], row_scores[keep]
+            if len(related):
+                # Best scores first, ties by id
+                order = numpy.lexsort((related, -row_scores))[:k]
+                top[item_id] = (array("I", related[order].tolist()), array("f", row_scores[order].tolist()))
+    return top
+
+
+def cosine_top_k_python(adjacency, k):
+    fans_of = {}
+    for position, user_id in enumerate(adjacency.users):
+        for item_id in adjacency.items[adjacency.offsets[position]:adjacency.offsets[position + 1]]:
+            fans_of.setdefault(item_id, []).append(position)
+    norm_of = {item_id: 1 / math.sqrt(len(fans)) for item_id, fans in fans_of.items()}
+    top = {}
+    for item_id, fans in fans_of.items():
+        cooccurrences = Counter()
+        for position in fans:
+            cooccurrences.update(adjacency.items[adjacency.offsets[position]:adjacency.offsets[position + 1]])
+        del cooccurrences[item_id]
+        # Same arithmetic as the sparse product, so both give the same order
+        scored = ((norm_of[item_id] * count * norm_of[other], other) for other, count in cooccurrences.items())
+        best = heapq.nsmallest(k, scored, key=lambda pair: (-pair[0], pair[1]))
+        if best:
+            top[item_id] = (array("I", [other for _, other in best]), array("f", [score for score, _ in best]))
+    return top
+
+
+def has_scipy():
+    return importlib.util.find_spec("scipy") is not None
+
+
+def cosine_top_k(adjacency, k):
+    # {item_id: (related item ids, scores)}, best first
+    if has_scipy():
+        return cosine_top_k_sparse(adjacency, k)
+    return cosine_top_k_python(adjacency, k)
+
+
+class RelatedItems:
+    def __init__(self):
+        # kind -> {item_id: (related item ids, scores)}
+        self.top = {}
+        # kind -> version of the favorite table the results come from
+        self.versions = {}
+        self.generation = 0
+        self.computed_at = 0.0
+        self.lock = threading.Lock()
+        self.compute_lock = threading.Lock()
+        self.refreshing = False
+
+    def compute(self):
+        # Runs in an app context
+        versions, _ = get_table_versions(INDEXED_TABLES)
+        favorites_index.sync(versions)
+        top, computed_versions = {}, {}
+        for kind in RELATED_MODELS:
+            adjacency, version = favorites_index.snapshot(kind)
+            top[kind] = cosine_top_k(adjacency, RELATED_TOP_K)
+            computed_versions[kind] = version
+        with self.lock:
+            self.top = top
+            self.versions = computed_versions
+            self.generation += 1
+            self.computed_at = time.monotonic()
+
+    def is_stale(self, kind, version):
+        return self.versions.get(kind) != version and \
+            time.monotonic() - self.computed_at >= RELATED_REFRESH_SECONDS
+
+    def refresh_in_background(self, app):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+
+        def run():
+            try:
+                with app.app_context(), self.compute_lock:
+                    self.compute()
+            except Exception:
+                app.logger.exception("Computing the related items failed")
+            finally:
+                self.refreshing = False
+        threading.Thread(target=run, name="related-items", daemon=True).start()
+
+    def related(self, kind, item_id, version, app):
+        # Returns (generation, related item ids, scores). `version` is the
+        # current version of the favorite table of `kind`.
+        if not self.top:
+            # First use, waits for the warm-up when it is running
+            with self.compute_lock:
+                if not self.top:
+                    self.compute()
+        elif self.is_stale(kind, version):
+            self.refresh_in_background(app)
+        with self.lock:
+            related_ids, scores = self.top[kind].get(item_id, (array("I"), array("f")))
+            return self.generation, related_ids, scores
+
+    def warm_up(self, app):
+        self.refresh_in_background(app)
+
+
+related_items = RelatedItems()
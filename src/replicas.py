@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+from functools import wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import event, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm import Session
+from database import engine_options
+
+# Read replicas for the GET endpoints.
+#
+#     DATABASE_REPLICA_URLS=postgresql://replica1/db,postgresql://replica2/db
+#     REPLICA_CHECK_SECONDS=5     how often a replica in rotation is checked
+#     REPLICA_RETRY_SECONDS=30    how long a failed replica stays out of rotation
+#
+# Every replica is a Flask-SQLAlchemy bind ("replica_0", "replica_1", ...).
+# Views decorated with @read_replica run their queries on one of them, picked
+# round robin among the healthy ones and kept for the rest of the request.
+# As soon as the request writes (a flush or a Core INSERT/UPDATE/DELETE) the
+# session goes back to the primary, so it reads its own writes. When every
+# replica is down the reads go to the primary as well.
+#
+# A replica is taken out of rotation when a query on it fails with a
+# connection error or when the periodic check fails. The check also reads
+# `table_version`, so a replica without the schema is never used.
+#
+# Replicas lag behind the primary: a client may not see its own write in the
+# next request, and the catalog cache can keep such a stale page until
+# CACHE_TTL expires.
+REPLICA_URLS = [url.strip().replace("postgres://", "postgresql://")
+                for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", 5))
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", 30))
+
+REPLICA_KEYS = [f"replica_{index}" for index in range(len(REPLICA_URLS))]
+HEALTH_CHECK = text("SELECT 1 FROM table_version LIMIT 1")
+
+PRIMARY_KEY = "use_primary"
+REPLICA_KEY = "replica"
+
+
+def replica_binds():
+    # Value for SQLALCHEMY_BINDS
+    return {key: dict(engine_options(url), url=url) for key, url in zip(REPLICA_KEYS, REPLICA_URLS)}
+
+
+class ReplicaSet:
+    def __init__(self, keys):
+        self.keys = list(keys)
+        self.down_until = {}
+        self.checked_at = {}
+        self.position = 0
+        self.lock = threading.Lock()
+
+    def mark_down(self, key):
+        with self.lock:
+            self.down_until[key] = time.monotonic() + REPLICA_RETRY_SECONDS
+
+    def is_healthy(self, key, engine):
+        now = time.monotonic()
+        with self.lock:
+            if self.down_until.get(key, 0) > now:
+                return False
+            if now - self.checked_at.get(key, 0) < REPLICA_CHECK_SECONDS:
+                return True
+            self.checked_at[key] = now
+        try:
+            with engine.connect() as connection:
+                connection.execute(HEALTH_CHECK)
+        except DBAPIError:
+            self.mark_down(key)
+            return False
+        with self.lock:
+            self.down_until.pop(key, None)
+        return True
+
+    def choose(self, engines):
+        # Round robin over the healthy replicas, None when they are all down
+        for _ in range(len(self.keys)):
+            with self.lock:
+                key = self.keys[self.position % len(self.keys)]
+                self.position += 1
+            if self.is_healthy(key, engines[key]):
+                return key
+        return None
+
+    def status(self):
+        now = time.monotonic()
+        return {key: self.down_until.get(key, 0) <= now for key in self.keys}
+
+
+replica_set = ReplicaSet(REPLICA_KEYS)
+
+
+class RoutingSession(FlaskSession):
+    # db.session class (see models.py), sends the reads of @read_replica views
+    # to a replica
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.reads_from_replica():
+            key = self.info.get(REPLICA_KEY) or replica_set.choose(self._db.engines)
+            if key is not None:
+                self.info[REPLICA_KEY] = key
+                return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def reads_from_replica(self):
+        return (bool(REPLICA_KEYS) and not self._flushing and not self.info.get(PRIMARY_KEY)
+                and has_app_context() and g.get("read_replica", False))
+
+
+@event.listens_for(Session, "after_flush")
+def _use_primary_after_flush(session, flush_context):
+    session.info[PRIMARY_KEY] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _use_primary_for_writes(orm_execute_state):
+    # Anything but a SELECT (Core DML, text statements) goes to the primary,
+    # and so does everything after it
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info[PRIMARY_KEY] = True
+
+
+def use_primary(session):
+    # The rest of the request reads from the primary
+    session.info[PRIMARY_KEY] = True
+
+
+def read_replica(view):
+    # Usage: @read_replica on a GET view, below @app.route
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_replicas(app, db):
+    # Takes a replica out of rotation as soon as a query on it fails to connect
+    with app.app_context():
+        for key in REPLICA_KEYS:
+            def mark_down(context, key=key):
+                if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+                    replica_set.mark_down(key)
+            event.listen(db.engines[key], "handle_error", mark_down)
@@ -0,0 +1,231 @@
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import db, People, Planets
+from versions import get_table_versions
+
+# Prefix search over People.name and Planets.name for autocomplete.
+#
+# The default backend keeps, per entity, a sorted array of
+# (lowercased name, id) keys: a prefix query is a binary search followed by
+# a short scan, O(log n + limit). The index is built in bulk when a gunicorn
+# worker starts (see gunicorn.conf.py), otherwise on the first search, and
+# kept in sync incrementally with the rows inserted, renamed and deleted
+# through the ORM in this process. The index remembers the table versions it
+# was built from, plus one per transaction it applied, so writes made by
+# other workers (or by Core statements such as the bulk endpoint) are picked
+# up by comparing the table versions every SEARCH_REFRESH_SECONDS and
+# rebuilding.
+#
+# SEARCH_BACKEND=postgres sends the queries to the database instead, using
+# the pg_trgm indexes created by migration f2a9d8c1b3e6. It also supports
+# substring matches (?match=contains).
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory")
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", 5))
+MAX_SEARCH_RESULTS = 50
+
+SEARCHABLE = {"people": People, "planets": Planets}
+
+
+class PrefixIndex:
+    def __init__(self, items=()):
+        # items are (id, name) pairs
+        self.keys = sorted((name.lower(), item_id) for item_id, name in items)
+        self.names = {item_id: name for item_id, name in items}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, item_id, name):
+        if item_id in self.names:
+            self.remove(item_id)
+        insort(self.keys, (name.lower(), item_id))
+        self.names[item_id] = name
+
+    def remove(self, item_id):
+        name = self.names.pop(item_id, None)
+        if name is None:
+            return
+        key = (name.lower(), item_id)
+        position = bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def search(self, prefix, limit):
+        # Returns up to `limit` (id, name) pairs whose name starts with prefix
+        prefix = prefix.lower()
+        results = []
+        position = bisect_left(self.keys, (prefix,))
+        while position < len(self.keys) and len(results) < limit:
+            key, item_id = self.keys[position]
+            if not key.startswith(prefix):
+                break
+            results.append((item_id, self.names[item_id]))
+            position += 1
+        return results
+
+
+class MemorySearch:
+    def __init__(self):
+        self.indexes = None
+        self.versions = None
+        self.generation = 0
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+
+    def build(self):
+        versions, _ = get_table_versions(list(SEARCHABLE))
+        indexes = {kind: PrefixIndex(db.session.query(model.id, model.name).all())
+                   for kind, model in SEARCHABLE.items()}
+        with self.lock:
+            self.indexes = indexes
+            self.versions = versions
+            self.generation += 1
+            self.checked_at = time.monotonic()
+
+    def refresh(self):
+        # Rebuild when the table versions changed since the last build
+        if self.indexes is None:
+            # Waits for the warm-up when it is running
+            with self.build_lock:
+                if self.indexes is None:
+                    self.build()
+        elif time.monotonic() - self.checked_at > SEARCH_REFRESH_SECONDS:
+            self.checked_at = time.monotonic()
+            versions, _ = get_table_versions(list(SEARCHABLE))
+            if versions != self.versions:
+                self.build()
+
+    def apply(self, generation, changes):
+        # changes are (kind, id, name) tuples written by one committed
+        # transaction that started recording at `generation`, name is None
+        # for deletes. When the index was rebuilt since, the changes are in
+        # it or the versions make the next refresh rebuild it again.
+        with self.lock:
+            if self.indexes is None or generation != self.generation:
+                return
+            for kind, item_id, name in changes:
+                if name is None:
+                    self.indexes[kind].remove(item_id)
+                else:
+                    self.indexes[kind].add(item_id, name)
+            # One version bump per written table and transaction
+            if self.versions is not None:
+                for kind in {kind for kind, _, _ in changes}:
+                    self.versions[kind] += 1
+
+    def warm_up(self, app):
+        # Builds the index in the background, e.g. when a worker starts
+        def run():
+            try:
+                with app.app_context(), self.build_lock:
+                    self.build()
+            except Exception:
+                app.logger.exception("Building the search index failed, it is built on first search")
+        threading.Thread(target=run, name="search-index", daemon=True).start()
+
+    def invalidate(self):
+        self.versions = None
+        self.checked_at = 0.0
+
+    def search(self, query, kinds, limit, match="prefix"):
+        if match != "prefix":
+            raise ValueError("The memory search backend only supports prefix matches")
+        self.refresh()
+        results = []
+        with self.lock:
+            for kind in kinds:
+                results.extend({"type": kind, "id": item_id, "name": name}
+                               for item_id, name in self.indexes[kind].search(query, limit))
+        results.sort(key=lambda result: result["name"].lower())
+        return results[:limit]
+
+
+class PostgresSearch:
+    generation = 0
+
+    def search(self, query, kinds, limit, match="prefix"):
+        pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        pattern = pattern + "%" if match == "prefix" else "%" + pattern + "%"
+        results = []
+        for kind in kinds:
+            model = SEARCHABLE[kind]
+            rows = (db.session.query(model.id, model.name)
+                    .filter(model.name.ilike(pattern, escape="\\"))
+                    .order_by(model.name).limit(limit).all())
+            results.extend({"type": kind, "id": item_id, "name": name} for item_id, name in rows)
+        results.sort(key=lambda result: result["name"].lower())
+        return results[:limit]
+
+    def apply(self, generation, changes):
+        pass
+
+    def invalidate(self):
+        pass
+
+    def warm_up(self, app):
+        pass
+
+
+def create_search_backend(backend=SEARCH_BACKEND):
+    if backend == "postgres":
+        return PostgresSearch()
+    return MemorySearch()
+
+
+name_search = create_search_backend()
+
+
+# Incremental updates: collect the ORM changes of every flush and apply them
+# to the index once the transaction commits
+
+SEARCH_CHANGES_KEY = "search_changes"
+SEARCH_STALE_KEY = "search_stale"
+SEARCH_KINDS = {model: kind for kind, model in SEARCHABLE.items()}
+
+
+def _record_change(session, target, name):
+    recorded = session.info.setdefault(SEARCH_CHANGES_KEY, (name_search.generation, []))
+    recorded[1].append((SEARCH_KINDS[type(target)], target.id, name))
+
+
+def _record_save(mapper, connection, target):
+    _record_change(Session.object_session(target), target, target.name)
+
+
+def _record_delete(mapper, connection, target):
+    _record_change(Session.object_session(target), target, None)
+
+
+for searchable_model in SEARCHABLE.values():
+    event.listen(searchable_model, "after_insert", _record_save)
+    event.listen(searchable_model, "after_update", _record_save)
+    event.listen(searchable_model, "after_delete", _record_delete)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_on_core_writes(orm_execute_state):
+    # Core INSERT/UPDATE/DELETE do not go through the mapper events
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in SEARCHABLE:
+            orm_execute_state.session.info[SEARCH_STALE_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_search_changes(session):
+    recorded = session.info.pop(SEARCH_CHANGES_KEY, None)
+    if recorded:
+        name_search.apply(*recorded)
+    if session.info.pop(SEARCH_STALE_KEY, False):
+        name_search.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_search_changes(session):
+    session.info.pop(SEARCH_CHANGES_KEY, None)
+    session.info.pop(SEARCH_STALE_KEY, None)
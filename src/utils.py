@@ -1,4 +1,5 @@
 from flask import jsonify, url_for
+from sqlalchemy import event
 
 class APIException(Exception):
     status_code = 400
@@ -21,7 +22,8 @@ def has_no_empty_params(rule):
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    # The lean app (API_ONLY) has no admin
+    links = ['/admin/'] if 'admin.index' in app.view_functions else []
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -39,3 +41,43 @@ def generate_sitemap(app):
         <p>Start working on your proyect by following the <a href="https://start.4geeksacademy.com/starters/flask" target="_blank">Quick Start</a></p>
         <p>Remember to specify a real endpoint path like: </p>
         <ul style="text-align: left;">"""+links_html+"</ul></div>"
+
+class QueryCounter:
+    # Counts the SQL statements executed on an engine while active:
+    #     with QueryCounter(db.engine) as counter:
+    #         client.get('/users')
+    #     assert counter.count == 3
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return False
+
+def assert_num_queries(engine, expected):
+    # Pins a block of code to an exact number of SQL statements
+    return _AssertNumQueries(engine, expected)
+
+class _AssertNumQueries(QueryCounter):
+    def __init__(self, engine, expected):
+        QueryCounter.__init__(self, engine)
+        self.expected = expected
+
+    def __exit__(self, *exc):
+        QueryCounter.__exit__(self, *exc)
+        if exc[0] is None and self.count != self.expected:
+            raise AssertionError(
+                f"Expected {self.expected} queries, got {self.count}:\n" + "\n".join(self.statements))
+        return False
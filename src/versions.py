@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+from sqlalchemy import event, inspect, update, insert
+from sqlalchemy.orm import Session
+from models import db, TableVersion
+
+# Tracks which tables every transaction writes to.
+#
+# The tables touched by a flush (including the association tables changed
+# through relationship collections) or by a Core INSERT/UPDATE/DELETE run
+# through the session are collected while the transaction is open. Before
+# the commit their row in `table_version` is incremented in the same
+# transaction, so every worker sees the same version, and after the commit
+# the registered callbacks (e.g. the cache invalidation) are called.
+
+PENDING_KEY = "changed_tables"
+
+commit_callbacks = []
+
+
+def on_tables_committed(callback):
+    # callback(tables) is called after every commit that changed `tables`
+    commit_callbacks.append(callback)
+    return callback
+
+
+def _pending_tables(session):
+    return session.info.setdefault(PENDING_KEY, set())
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session, flush_context):
+    pending = _pending_tables(session)
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        state = inspect(instance)
+        # A change to a many-to-many collection only writes the association
+        # table, the row itself is unchanged
+        if instance not in session.dirty or session.is_modified(instance, include_collections=False):
+            pending.add(state.mapper.local_table.name)
+        for relationship in state.mapper.relationships:
+            if relationship.secondary is None:
+                continue
+            if instance in session.deleted or state.attrs[relationship.key].history.has_changes():
+                pending.add(relationship.secondary.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_executed_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name != TableVersion.__tablename__:
+            _pending_tables(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_table_versions(session):
+    # Flush first so that the changes made by this commit are collected
+    session.flush()
+    pending = session.info.get(PENDING_KEY)
+    if not pending:
+        return
+    connection = session.connection()
+    now = datetime.utcnow()
+    for table in sorted(pending):
+        result = connection.execute(
+            update(TableVersion.__table__)
+            .where(TableVersion.__table__.c.table_name == table)
+            .values(version=TableVersion.__table__.c.version + 1, updated_at=now))
+        if result.rowcount == 0:
+            connection.execute(insert(TableVersion.__table__).values(
+                table_name=table, version=1, updated_at=now))
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed_tables(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        for callback in commit_callbacks:
+            callback(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_tables(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def get_table_versions(tables):
+    # Returns ({table: version}, last modification time) with a single query.
+    # Tables that were never written have version 0.
+    rows = db.session.query(TableVersion).filter(TableVersion.table_name.in_(list(tables))).all()
+    return versions_from_rows(tables, rows)
+
+
+def versions_from_rows(tables, rows):
+    versions = {table: 0 for table in tables}
+    last_modified = None
+    for row in rows:
+        versions[row.table_name] = row.version
+        updated_at = row.updated_at.replace(tzinfo=timezone.utc)
+        if last_modified is None or updated_at > last_modified:
+            last_modified = updated_at
+    return versions, last_modified
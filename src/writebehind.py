@@ -0,0 +1,262 @@
+import atexit
+import os
+import threading
+import time
+from functools import wraps
+from sqlalchemy import delete, insert, select, tuple_
+from utils import APIException
+from models import db, User, People, Planets, FavoritePeople, FavoritePlanets
+from favorites import chunked, IN_CHUNK_SIZE
+from replicas import use_primary
+from popularity import adjust_favorite_counts
+from adjacency import record_favorite_changes
+
+# Write-behind queue for the favorites endpoints (opt-in).
+#
+#     FAVORITES_WRITE_BEHIND=true      enable it
+#     FAVORITES_FLUSH_INTERVAL_MS=200  longest time a change waits in the queue
+#     FAVORITES_QUEUE_SIZE=10000       pending changes before requests have to wait
+#     FAVORITES_QUEUE_TIMEOUT=2        seconds a request waits for room, then 503
+#
+# POST/DELETE /user/<id>/favorites only queue the changes. Changes to the same
+# (user, item) pair are coalesced, the last one wins, and a background thread
+# writes everything queued by all the requests of the worker in one
+# transaction every interval. When the queue is full the thread is woken up
+# and the request waits for the flush, or gets a 503 after the timeout.
+#
+# A flush removes with one tuple IN DELETE per chunk, and adds with a plain
+# INSERT of the pairs missing when it read them, not INSERT .. ON CONFLICT
+# DO NOTHING: a pair inserted meanwhile by another worker fails the unique
+# constraint and the whole batch is retried, so every favorite is counted
+# once (see popularity.py).
+#
+# The user endpoints are decorated with @read_your_writes: when the user read
+# has changes in the queue, the queue is flushed before the read so the
+# response (and its ETag) includes them.
+#
+# The queue belongs to the worker process. Read-your-writes only holds for
+# reads served by the worker that accepted the change. With several gunicorn
+# workers, a read that lands on another worker sees the change after that
+# worker's flush, up to FAVORITES_FLUSH_INTERVAL_MS later. Clients that need
+# their write on the next read, whatever the worker, should keep
+# FAVORITES_WRITE_BEHIND off (the default) or run a single worker.
+#
+# The queue is also flushed when the
+# process exits (atexit and the gunicorn worker_exit hook). A hard kill loses
+# at most one interval of changes.
+FAVORITES_WRITE_BEHIND = os.getenv("FAVORITES_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+FAVORITES_FLUSH_INTERVAL = float(os.getenv("FAVORITES_FLUSH_INTERVAL_MS", 200)) / 1000
+FAVORITES_QUEUE_SIZE = int(os.getenv("FAVORITES_QUEUE_SIZE", 10000))
+FAVORITES_QUEUE_TIMEOUT = float(os.getenv("FAVORITES_QUEUE_TIMEOUT", 2))
+
+# Queue key -> (association table, item column, item model)
+FAVORITE_TABLES = {
+    "people": (FavoritePeople.__table__, "people_id", People),
+    "planets": (FavoritePlanets.__table__, "planet_id", Planets),
+}
+
+
+def existing_ids(model, ids):
+    found = set()
+    for chunk in chunked(sorted(ids)):
+        found.update(item_id for (item_id,) in db.session.query(model.id).filter(model.id.in_(chunk)))
+    return found
+
+
+class StaleBatch(Exception):
+    # Another transaction changed the same favorites, the batch is retried
+    pass
+
+
+def existing_pairs(table, column, pairs):
+    found = set()
+    pair_columns = tuple_(table.c.user_id, table.c[column])
+    # Two bound parameters per pair
+    for chunk in chunked(sorted(pairs), IN_CHUNK_SIZE // 2):
+        found.update(tuple(row) for row in db.session.execute(
+            select(table.c.user_id, table.c[column]).where(pair_columns.in_(chunk))))
+    return found
+
+
+def write_favorites(batch):
+    # batch is {(key, user_id): {item_id: add}}, written in one transaction
+    # together with the favorite counts (see popularity.py)
+    for key, (table, column, model) in FAVORITE_TABLES.items():
+        changes = {(user_id, item_id): add for (batch_key, user_id), items in batch.items()
+                   if batch_key == key for item_id, add in items.items()}
+        if not changes:
+            continue
+        # Only the pairs that really change are written and counted
+        existing = existing_pairs(table, column, changes)
+        removed = [pair for pair, add in changes.items() if not add and pair in existing]
+        added = [pair for pair, add in changes.items() if add and pair not in existing]
+        deltas = {}
+
+        for chunk in chunked(removed, IN_CHUNK_SIZE // 2):
+            result = db.session.execute(
+                delete(table).where(tuple_(table.c.user_id, table.c[column]).in_(chunk)))
+            if result.rowcount != len(chunk):
+                raise StaleBatch()
+        for _, item_id in removed:
+            deltas[item_id] = deltas.get(item_id, 0) - 1
+
+        rows = []
+        if added:
+            # Users and items deleted since the change was queued are skipped.
+            # A pair inserted meanwhile by another worker fails the unique
+            # constraint and the batch is retried.
+            users = existing_ids(User, {user_id for user_id, _ in added})
+            items = existing_ids(model, {item_id for _, item_id in added})
+            rows = [{"user_id": user_id, column: item_id} for user_id, item_id in added
+                    if user_id in users and item_id in items]
+            if rows:
+                db.session.execute(insert(table), rows)
+            for row in rows:
+                deltas[row[column]] = deltas.get(row[column], 0) + 1
+        adjust_favorite_counts(key, deltas)
+        record_favorite_changes(db.session, [(key, user_id, item_id, False) for user_id, item_id in removed]
+                                + [(key, row["user_id"], row[column], True) for row in rows])
+    db.session.commit()
+
+
+class FavoritesQueue:
+    def __init__(self, interval=FAVORITES_FLUSH_INTERVAL, maxsize=FAVORITES_QUEUE_SIZE,
+                 timeout=FAVORITES_QUEUE_TIMEOUT):
+        self.interval = interval
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.app = None
+        # {(key, user_id): {item_id: add}}, `in_flight` is being written
+        self.pending = {}
+        self.in_flight = {}
+        self.size = 0
+        self.flushed = 0
+        self.failures = 0
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.closed = False
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.close)
+
+    def new_changes(self, operations):
+        return len({(key, user_id, item_id) for key, user_id, item_id, _ in operations
+                    if item_id not in self.pending.get((key, user_id), {})})
+
+    def put(self, operations):
+        # operations are (key, user_id, item_id, add) tuples
+        if not operations:
+            return
+        if len(operations) > self.maxsize:
+            raise APIException(f"At most {self.maxsize} favorites can be changed at once", status_code=400)
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            # Backpressure: wait for the flush to make room
+            while self.size + self.new_changes(operations) > self.maxsize:
+                self.wakeup.set()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise APIException("Too many pending favorite changes, try again later", status_code=503)
+                self.condition.wait(remaining)
+            for key, user_id, item_id, add in operations:
+                changes = self.pending.setdefault((key, user_id), {})
+                if item_id not in changes:
+                    self.size += 1
+                changes[item_id] = add
+        self.start()
+
+    def apply_pending(self, key, user_id, ids):
+        # ids of the user's favorites once the queued changes are written
+        ids = set(ids)
+        with self.condition:
+            for queue in (self.in_flight, self.pending):
+                for item_id, add in queue.get((key, user_id), {}).items():
+                    if add:
+                        ids.add(item_id)
+                    else:
+                        ids.discard(item_id)
+        return ids
+
+    def has_pending(self, user_id=None):
+        with self.condition:
+            if user_id is None:
+                return bool(self.pending or self.in_flight)
+            return any((key, user_id) in self.pending or (key, user_id) in self.in_flight
+                       for key in FAVORITE_TABLES)
+
+    def flush(self):
+        # Writes everything queued so far, returns the number of changes
+        with self.flush_lock:
+            with self.condition:
+                if not self.pending:
+                    return 0
+                self.in_flight, self.pending = self.pending, {}
+                count, self.size = self.size, 0
+            try:
+                # Own app context, so its own session even inside a request
+                with self.app.app_context():
+                    write_favorites(self.in_flight)
+            except Exception:
+                # Put the batch back, newer changes to the same pairs win
+                with self.condition:
+                    for queue_key, changes in self.in_flight.items():
+                        pending = self.pending.setdefault(queue_key, {})
+                        for item_id, add in changes.items():
+                            if item_id not in pending:
+                                pending[item_id] = add
+                                self.size += 1
+                    self.failures += 1
+                raise
+            finally:
+                with self.condition:
+                    self.in_flight = {}
+                    self.condition.notify_all()
+            self.flushed += count
+            return count
+
+    def start(self):
+        # The thread is started on first use, so in every gunicorn worker
+        if self.thread is None or not self.thread.is_alive():
+            with self.condition:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(target=self.run, name="favorites-queue", daemon=True)
+                    self.thread.start()
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Writing the queued favorites failed, retrying")
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        if self.app is not None:
+            self.flush()
+
+    def stats(self):
+        with self.condition:
+            return {"pending": self.size, "flushed": self.flushed, "failures": self.failures}
+
+
+favorites_queue = FavoritesQueue()
+
+
+def read_your_writes(view):
+    # Usage: @read_your_writes on a view reading User.fav_*, above
+    # @conditional_get. Views with an `id` argument only wait for the
+    # changes of that user. Only the queue of this worker is checked.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if favorites_queue.has_pending(kwargs.get("id")):
+            favorites_queue.flush()
+            # The replicas may not have the flushed changes yet
+            use_primary(db.session)
+        return view(*args, **kwargs)
+    return wrapper
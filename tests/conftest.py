@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads DATABASE_URL when it is created, and its modules are imported
+# from src/ like gunicorn does (--chdir ./src/)
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tests.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from wsgi import app
+    return app
+
+
+@pytest.fixture
+def db(app):
+    # Empty tables for every test. The table versions start again at 0, so
+    # the entries cached and the indexes built by previous tests are dropped
+    # too. No app context stays pushed: every test client request gets its
+    # own, with its own `g` and session, like in production.
+    from models import db
+    from cache import catalog_cache
+    from search import name_search
+    from adjacency import favorites_index
+    from related import related_items
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        catalog_cache.backend.clear()
+        name_search.invalidate()
+        favorites_index.kinds = None
+        related_items.top = {}
+    return db
+
+
+@pytest.fixture
+def context(app, db):
+    # For tests that use the models directly. Requests made while it is
+    # pushed would share its `g` and session, use `with app.app_context()`
+    # blocks instead in tests that also use the client.
+    with app.app_context():
+        yield
+        db.session.remove()
+
+
+@pytest.fixture
+def engine(app, db):
+    # For QueryCounter / assert_num_queries around client requests
+    with app.app_context():
+        return db.engine
+
+
+@pytest.fixture
+def client(app, db):
+    return app.test_client()
+
+
+@pytest.fixture
+def seeded(app, db):
+    # 5 users, 20 people, 20 planets and 5 vehicles. User 1 has people 1-3,
+    # planets 1-2 and vehicle 1 as favorites.
+    from sqlalchemy import insert
+    from models import User, People, Planets, Vehicles, FavoritePeople, FavoritePlanets, FavoriteVehicles
+    from encoding import encode_fragment
+    from popularity import reconcile_favorite_counts
+
+    with app.app_context():
+        db.session.execute(insert(User), [{"email": f"user{i}@example.com", "password": "x", "is_active": True}
+                                          for i in range(1, 6)])
+        people = [{"name": f"Person {i}", "gender": "n/a", "hair_color": "brown", "eye_color": "blue"}
+                  for i in range(1, 21)]
+        planets = [{"name": f"Planet {i}", "population": i * 1000, "terrain": i % 3} for i in range(1, 21)]
+        for model, rows in ((People, people), (Planets, planets)):
+            for row in rows:
+                row["serialized"] = encode_fragment(model, row)
+            db.session.execute(insert(model), rows)
+        db.session.execute(insert(Vehicles), [{"name": f"Vehicle {i}", "capacity": i} for i in range(1, 6)])
+        db.session.execute(insert(FavoritePeople), [{"user_id": 1, "people_id": i} for i in (1, 2, 3)])
+        db.session.execute(insert(FavoritePlanets), [{"user_id": 1, "planet_id": i} for i in (1, 2)])
+        db.session.execute(insert(FavoriteVehicles), [{"user_id": 1, "vehicle_id": 1}])
+        db.session.commit()
+        reconcile_favorite_counts()
+    return db
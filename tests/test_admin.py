@@ -0,0 +1,50 @@
+import pytest
+
+# Query budgets of the flask-admin pages (see admin.py). Every list page runs
+# the count (estimated, or exact when the table is small or the list is
+# searched / filtered) and the page itself, whatever the size of the table.
+# The latency on big tables is measured by benchmarks/admin_benchmark.py.
+
+# (name, path, most SQL queries with an estimated count, with an exact count)
+PAGES = [
+    ("users", "/admin/user/", 2, 3),
+    ("users search", "/admin/user/?search=user2", 2, 2),
+    ("users edit", "/admin/user/edit/?id=1", 4, 4),
+    ("people", "/admin/people/", 2, 3),
+    ("people last page", "/admin/people/?page=100", 2, 3),
+    ("people huge page_size", "/admin/people/?page_size=100000", 2, 3),
+    ("people sort name", "/admin/people/?sort=1&desc=1", 2, 3),
+    ("people sort eye_color", "/admin/people/?sort=4", 2, 3),
+    ("people search", "/admin/people/?search=Person+4", 2, 2),
+    ("people filter gender", "/admin/people/?flt0_0=female", 2, 2),
+    ("people edit", "/admin/people/edit/?id=1", 2, 2),
+    ("planets", "/admin/planets/", 2, 3),
+    ("planets sort population", "/admin/planets/?sort=2&desc=1", 2, 3),
+    ("planets filter population", "/admin/planets/?flt0_1=5000", 2, 2),
+    ("planets edit", "/admin/planets/edit/?id=1", 2, 2),
+    ("vehicles", "/admin/vehicles/", 2, 3),
+    ("vehicles filter capacity", "/admin/vehicles/?flt0_0=3", 2, 2),
+    ("vehicles edit", "/admin/vehicles/edit/?id=1", 2, 2),
+]
+
+
+@pytest.mark.parametrize("estimated", [True, False], ids=["estimated count", "exact count"])
+@pytest.mark.parametrize("name, path, estimated_budget, exact_budget", PAGES, ids=[page[0] for page in PAGES])
+def test_admin_page_queries(seeded, client, engine, monkeypatch, name, path, estimated_budget, exact_budget, estimated):
+    import admin
+    from utils import QueryCounter
+    # The seeded tables count as big with a limit of 1 row
+    monkeypatch.setattr(admin, "ADMIN_EXACT_COUNT_LIMIT", 1 if estimated else 100000)
+    with QueryCounter(engine) as counter:
+        response = client.get(path)
+        response.get_data()
+    assert response.status_code == 200
+    budget = estimated_budget if estimated else exact_budget
+    assert counter.count <= budget, "\n".join(counter.statements)
+
+
+def test_admin_page_size_is_capped(seeded, client, monkeypatch):
+    import admin
+    monkeypatch.setattr(admin.PeopleModelView, "page_size", 5)
+    body = client.get("/admin/people/?page_size=100000").get_data(as_text=True)
+    assert body.count("/admin/people/edit/?id=") == 5
@@ -0,0 +1,42 @@
+import pytest
+
+
+@pytest.mark.parametrize("entity", ["people", "planets", "users"])
+def test_order_and_missing(seeded, client, entity):
+    # Order of the request, duplicates dropped, unknown ids listed apart
+    response = client.get(f"/{entity}?ids=3,1,99,2,1")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [item["id"] for item in body[entity]] == [3, 1, 2]
+    assert body["missing"] == [99]
+
+
+def test_items_are_cached(seeded, client, engine):
+    from utils import assert_num_queries
+    client.get("/people/3")
+    client.get("/people/1")
+    # The version of the ETag, then one IN query for the item not cached yet
+    with assert_num_queries(engine, 2):
+        body = client.get("/people?ids=1,2,3").get_json()
+    assert [person["name"] for person in body["people"]] == ["Person 1", "Person 2", "Person 3"]
+    with assert_num_queries(engine, 1):
+        client.get("/people?ids=3,2,1")
+
+
+def test_cap(seeded, client, monkeypatch):
+    import batch
+    monkeypatch.setattr(batch, "BATCH_MAX_IDS", 3)
+    assert client.get("/planets?ids=1,2,3,3").status_code == 200
+    response = client.get("/planets?ids=1,2,3,4")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "At most 3 ids can be requested at once"}
+
+
+@pytest.mark.parametrize("ids, message", [
+    ("1,x", "ids must be a comma separated list of integers"),
+    (",", "ids must not be empty"),
+])
+def test_invalid_ids(seeded, client, ids, message):
+    response = client.get(f"/people?ids={ids}")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": message}
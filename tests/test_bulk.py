@@ -0,0 +1,66 @@
+import json
+
+
+def test_json_array(seeded, client):
+    rows = [
+        {"name": "Planet 21", "population": 5, "terrain": 1},
+        {"name": "Planet 22", "population": "6", "terrain": 2},
+        {"name": "Planet 21", "population": 7, "terrain": 1},
+        {"name": "Planet 1", "population": 8, "terrain": 0},
+        {"name": "Planet 23", "terrain": 1},
+        {"name": "Planet 24", "population": True, "terrain": 1},
+        ["Planet 25"],
+    ]
+    response = client.post("/bulk/planets", json=rows)
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "results": [
+            {"index": 0, "name": "Planet 21", "status": "created"},
+            {"index": 1, "name": "Planet 22", "status": "created"},
+            {"index": 2, "name": "Planet 21", "status": "duplicate"},
+            {"index": 3, "name": "Planet 1", "status": "duplicate"},
+            {"index": 4, "status": "invalid", "error": "population is required"},
+            {"index": 5, "status": "invalid", "error": "population must be an integer"},
+            {"index": 6, "status": "invalid", "error": "Each row must be a JSON object"},
+        ],
+        "summary": {"created": 2, "updated": 0, "duplicate": 2, "invalid": 3},
+        "error": None,
+    }
+    planets = client.get("/planets?name__in=Planet 1,Planet 21,Planet 22").get_json()
+    assert [(planet["name"], planet["population"]) for planet in planets] == \
+        [("Planet 1", 1000), ("Planet 21", 5), ("Planet 22", 6)]
+
+
+def test_ndjson(seeded, client):
+    body = "\n".join([
+        json.dumps({"name": "Person 21", "eye_color": "green"}),
+        "",
+        "{not json",
+        json.dumps({"name": "Person 1"}),
+        json.dumps({"name": ""}),
+        json.dumps({"name": "Person 22", "gender": 3}),
+    ])
+    response = client.post("/bulk/people", data=body, content_type="application/x-ndjson")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [(line.get("index"), line.get("status")) for line in lines[:-1]] == \
+        [(0, "created"), (1, "invalid"), (2, "duplicate"), (3, "invalid"), (4, "invalid")]
+    assert lines[1]["error"].startswith("Invalid JSON")
+    assert lines[-1] == {"summary": {"created": 1, "updated": 0, "duplicate": 1, "invalid": 3}, "error": None}
+    person = client.get("/people?name=Person 21").get_json()["people"][0]
+    assert (person["gender"], person["eye_color"]) == ("n/a", "green")
+
+
+def test_update_existing(seeded, client):
+    response = client.post("/bulk/vehicles?on_conflict=update",
+                           json=[{"name": "Vehicle 1", "capacity": 50}, {"name": "Vehicle 6", "capacity": 6}])
+    assert [result["status"] for result in response.get_json()["results"]] == ["updated", "created"]
+    vehicles = client.get("/vehicles?name__in=Vehicle 1,Vehicle 6").get_json()
+    assert [(vehicle["name"], vehicle["capacity"]) for vehicle in vehicles] == [("Vehicle 1", 50), ("Vehicle 6", 6)]
+
+
+def test_invalid_body(seeded, client):
+    response = client.post("/bulk/planets", json={"name": "Planet 21"})
+    assert response.get_json()["error"] == "Expected a JSON array"
+    assert client.post("/bulk/users", json=[]).status_code == 404
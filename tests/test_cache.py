@@ -0,0 +1,53 @@
+from sqlalchemy import text
+
+
+def test_cache_follows_writes_of_other_workers(seeded, client, engine):
+    # Another worker's write only shows up in `table_version`, the cache of
+    # this process must not serve the old row under the new ETag
+    first = client.get("/people/1")
+    assert first.get_json()["name"] == "Person 1"
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE people SET name = 'Renamed', serialized = NULL WHERE id = 1"))
+        connection.execute(text("UPDATE table_version SET version = version + 1 WHERE table_name = 'people'"))
+    second = client.get("/people/1", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.get_json()["name"] == "Renamed"
+    assert second.headers["ETag"] != first.headers["ETag"]
+    assert client.get("/people?limit=1").get_json()["people"][0]["name"] == "Renamed"
+
+
+def cache_stats(client):
+    stats = client.get("/cache/stats").get_json()
+    return stats["hits"], stats["misses"]
+
+
+def test_hits_and_misses(seeded, client, engine):
+    from utils import assert_num_queries
+    hits, misses = cache_stats(client)
+    client.get("/people/1")
+    assert cache_stats(client) == (hits, misses + 1)
+    # Only the table versions of the ETag
+    with assert_num_queries(engine, 1):
+        assert client.get("/people/1").get_json()["name"] == "Person 1"
+    assert cache_stats(client) == (hits + 1, misses + 1)
+    client.get("/people/2")
+    assert cache_stats(client) == (hits + 1, misses + 2)
+
+
+def test_writes_invalidate_their_table(seeded, client):
+    client.get("/people/1")
+    client.get("/planets/1")
+    names = [person["name"] for person in client.get("/people?limit=50").get_json()["people"]]
+    assert "Person 21" not in names
+    response = client.post("/create_people", json={"name": "Person 21", "gender": "n/a",
+                                                   "hair_color": "brown", "eye_color": "blue"})
+    assert response.status_code == 201
+
+    hits, misses = cache_stats(client)
+    names = [person["name"] for person in client.get("/people?limit=50").get_json()["people"]]
+    assert names[-1] == "Person 21"
+    client.get("/people/1")
+    assert cache_stats(client) == (hits, misses + 2)
+    # Other tables keep their entries
+    client.get("/planets/1")
+    assert cache_stats(client) == (hits + 1, misses + 2)
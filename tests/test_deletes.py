@@ -0,0 +1,59 @@
+import pytest
+
+
+def popular(client, kind):
+    return [(item["id"], item["fans"]) for item in client.get(f"/popular/{kind}").get_json()]
+
+
+def test_delete_user(seeded, client, engine):
+    from sqlalchemy import text
+    client.post("/user/2/favorites", json={"people": ["Person 1"]})
+    assert client.delete("/delete/1").status_code == 200
+    with engine.connect() as connection:
+        for table in ("favorite_people", "favorite_planets", "favorite_vehicles"):
+            assert connection.execute(text(f"SELECT COUNT(*) FROM {table} WHERE user_id = 1")).scalar() == 0
+    assert popular(client, "people") == [(1, 1)]
+    assert popular(client, "planets") == []
+    assert client.get("/user/1/favorites").status_code == 404
+
+
+def test_delete_item(seeded, client):
+    assert client.delete("/delete/people/2").status_code == 200
+    assert client.get("/user/1").get_json()["fav_people"] == [1, 3]
+    assert popular(client, "people") == [(3, 1), (1, 1)]
+    assert client.delete("/delete/people/2").status_code == 404
+
+
+def test_bulk_delete_by_ids(seeded, client):
+    response = client.delete("/bulk/people?ids=1,99,5")
+    assert response.get_json() == {"deleted": 2, "missing": [99]}
+    assert client.get("/user/1").get_json()["fav_people"] == [2, 3]
+    assert client.get("/people?ids=1,5").get_json()["missing"] == [1, 5]
+
+
+def test_bulk_delete_by_filter(seeded, client):
+    # Planets 1, 4, 7, ... 19 have terrain 1
+    response = client.delete("/bulk/planets?terrain=1")
+    assert response.get_json() == {"deleted": 7, "missing": []}
+    assert [planet["id"] for planet in client.get("/user/1").get_json()["fav_planets"]] == [2]
+    assert popular(client, "planets") == [(2, 1)]
+
+
+def test_queries_do_not_depend_on_rows(seeded, client, engine):
+    from utils import QueryCounter
+    counts = []
+    for ids in ("1", "2,3,4,5,6,7,8,9,10,11"):
+        with QueryCounter(engine) as counter:
+            assert client.delete(f"/bulk/people?ids={ids}").status_code == 200
+        counts.append(counter.count)
+    assert counts[0] == counts[1]
+
+
+@pytest.mark.parametrize("path, message", [
+    ("/bulk/users?email=user1@example.com", "Users can only be deleted by id, use ?ids="),
+    ("/bulk/people", "A filter or ?ids= is required"),
+])
+def test_invalid_bulk_delete(seeded, client, path, message):
+    response = client.delete(path)
+    assert response.status_code == 400
+    assert response.get_json() == {"message": message}
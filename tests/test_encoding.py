@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize("model_name", ["People", "Planets"])
+def test_page_json_without_stored_fragments(seeded, context, engine, model_name):
+    # Rows written before the serialized column existed are encoded from the
+    # columns of the page query, without loading or updating them
+    import models
+    from pagination import keyset_page_json
+    from utils import assert_num_queries
+    model = getattr(models, model_name)
+    seeded.session.execute(model.__table__.update().where(model.id <= 10).values(serialized=None))
+    seeded.session.commit()
+
+    with assert_num_queries(engine, 1):
+        page, next_cursor = keyset_page_json(model, 15, None, sort=[(model.name, True)])
+    expected = [item.serialize() for item in model.query.order_by(model.name.desc(), model.id).limit(15)]
+    assert json.loads(page) == expected
+    assert next_cursor is not None
+    assert not seeded.session.dirty
+
+
+def test_people_as_msgpack(seeded, client):
+    msgpack = pytest.importorskip("msgpack")
+    response = client.get("/people?limit=2", headers={"Accept": "application/msgpack"})
+    assert response.mimetype == "application/msgpack"
+    assert [person["id"] for person in msgpack.unpackb(response.get_data())["people"]] == [1, 2]
+
+
+@pytest.mark.parametrize("accept, encoding", [("br, gzip", "br"), ("gzip", "gzip"), ("identity", None)])
+def test_people_compressed(seeded, client, accept, encoding):
+    if encoding == "br":
+        pytest.importorskip("brotli")
+    response = client.get("/people?limit=20", headers={"Accept-Encoding": accept})
+    assert response.headers.get("Content-Encoding") == encoding
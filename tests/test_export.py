@@ -0,0 +1,48 @@
+import csv
+import gzip
+import io
+import json
+
+
+def test_ndjson(seeded, client):
+    response = client.get("/export/people")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["Content-Disposition"] == "attachment; filename=people.ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 20
+    assert rows[0] == {"id": 1, "name": "Person 1", "gender": "n/a", "hair_color": "brown", "eye_color": "blue"}
+    assert [row["id"] for row in rows] == list(range(1, 21))
+
+
+def test_csv(seeded, client):
+    response = client.get("/export/planets?format=csv")
+    assert response.mimetype == "text/csv"
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ["id", "name", "population", "terrain"]
+    assert rows[1:3] == [["1", "Planet 1", "1000", "1"], ["2", "Planet 2", "2000", "2"]]
+    assert len(rows) == 21
+
+
+def test_gzip(seeded, client):
+    response = client.get("/export/vehicles?format=csv", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    text = gzip.decompress(response.get_data()).decode("utf-8")
+    assert text.splitlines() == ["id,name,capacity"] + [f"{i},Vehicle {i},{i}" for i in range(1, 6)]
+
+
+def test_batches(app, seeded):
+    # One chunk per batch, plus the header for CSV
+    from export import export_entity
+    with app.app_context():
+        chunks = list(export_entity("planets", "csv", batch_size=6))
+    assert len(chunks) == 4
+    assert b"".join(chunks).decode("utf-8").count("\n") == 21
+
+
+def test_errors(seeded, client):
+    assert client.get("/export/users").status_code == 404
+    response = client.get("/export/people?format=xml")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "Unknown format 'xml', use one of: ndjson, csv"}
@@ -0,0 +1,18 @@
+import pytest
+
+
+@pytest.mark.parametrize("method", ["post", "delete"])
+@pytest.mark.parametrize("body, message", [
+    ({"people": [["x"]]}, """'people' must be a list of names, invalid entries: [["x"]]"""),
+    ({"people": ["Person 4", 5, None, {"name": "Person 5"}]},
+     """'people' must be a list of names, invalid entries: [5, null, {"name": "Person 5"}]"""),
+    ({"people": ["Person 4"], "planets": [7]}, "'planets' must be a list of names, invalid entries: [7]"),
+    ({"planets": "Planet 3"}, "'planets' must be a list of names"),
+    (["Person 4"], "The body must be an object with lists of names"),
+])
+def test_invalid_names(seeded, client, method, body, message):
+    response = getattr(client, method)("/user/1/favorites", json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"message": message}
+    # Nothing was written
+    assert client.get("/user/1").get_json()["fav_people"] == [1, 2, 3]
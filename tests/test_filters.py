@@ -0,0 +1,60 @@
+import pytest
+
+from test_pagination import walk
+
+
+def planet_ids(client, query):
+    response = client.get(f"/planets?{query}")
+    assert response.status_code == 200
+    return [planet["id"] for planet in response.get_json()]
+
+
+@pytest.mark.parametrize("query, ids", [
+    ("terrain=0", [3, 6, 9, 12, 15, 18]),
+    ("terrain__eq=0&population__gte=12000", [12, 15, 18]),
+    ("name__in=Planet 4,Planet 2,Planet 99", [2, 4]),
+    ("terrain__in=0,2&population__lt=6000", [2, 3, 5]),
+    ("population__gt=17000&population__lte=19000", [18, 19]),
+    ("name__prefix=Planet 1&population__lt=13000", [1, 10, 11, 12]),
+    ("name__prefix=Planet%25", []),
+])
+def test_operators(seeded, client, query, ids):
+    assert planet_ids(client, query) == ids
+
+
+@pytest.mark.parametrize("query, message", [
+    ("population=many", "population must be an integer"),
+    ("population__in=1000,x", "population must be an integer"),
+    ("population__prefix=1", "prefix is only supported on text fields"),
+    ("name__gte=Planet", "gte is only supported on numeric fields"),
+    ("serialized=x", "Cannot filter by 'serialized'"),
+    ("name__like=Planet", "Unknown operator 'like'"),
+    ("sort=serialized", "Cannot sort by 'serialized'"),
+])
+def test_invalid(seeded, client, query, message):
+    response = client.get(f"/planets?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": message}
+
+
+def test_sort(seeded, client):
+    assert planet_ids(client, "sort=-population&limit=3") == [20, 19, 18]
+    # Ties by id
+    assert planet_ids(client, "sort=terrain,-population&limit=4") == [18, 15, 12, 9]
+    people = client.get("/people?sort=-name&limit=3").get_json()["people"]
+    assert [person["name"] for person in people] == ["Person 9", "Person 8", "Person 7"]
+
+
+@pytest.mark.parametrize("path, key", [
+    ("/planets?sort=terrain,-population", None),
+    ("/planets?sort=-name&terrain__in=1,2", None),
+    ("/people?sort=-eye_color,name", "people"),
+    ("/vehicles?sort=-capacity", None),
+])
+def test_sorted_cursor_round_trip(seeded, client, path, key):
+    # Following the cursors gives the rows of the unpaginated request
+    body = client.get(f"{path}&limit=100").get_json()
+    expected = [item["id"] for item in (body[key] if key else body)]
+    pages = walk(client, f"{path}&limit=3", key)
+    assert len(pages) > 1
+    assert [item_id for page in pages for item_id in page] == expected
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import select, text
+
+# The lookups on the favorite tables and on the names must be served by an
+# index (migration d1f4a7b9c302 and the unique names), checked with sqlite's
+# EXPLAIN QUERY PLAN on the schema of the models.
+
+
+def query_plan(db, statement):
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in db.session.execute(text("EXPLAIN QUERY PLAN " + sql))]
+
+
+def assert_index_search(plan, table):
+    assert any(step.startswith(f"SEARCH {table} USING") and "INDEX" in step for step in plan), plan
+    assert not any(step.startswith(f"SCAN {table}") for step in plan), plan
+
+
+FAVORITES = [("FavoritePeople", "people_id"), ("FavoritePlanets", "planet_id"),
+             ("FavoriteVehicles", "vehicle_id")]
+
+
+@pytest.mark.parametrize("model_name, column", FAVORITES)
+def test_favorites_by_user(db, context, model_name, column):
+    import models
+    model = getattr(models, model_name)
+    plan = query_plan(db, select(getattr(model, column)).where(model.user_id == 1))
+    assert_index_search(plan, model.__tablename__)
+
+
+@pytest.mark.parametrize("model_name, column", FAVORITES)
+def test_favorite_by_user_and_item(db, context, model_name, column):
+    import models
+    model = getattr(models, model_name)
+    plan = query_plan(db, select(model.id).where(model.user_id == 1, getattr(model, column) == 2))
+    assert_index_search(plan, model.__tablename__)
+
+
+@pytest.mark.parametrize("model_name, column", FAVORITES)
+def test_fans_of_item(db, context, model_name, column):
+    import models
+    model = getattr(models, model_name)
+    plan = query_plan(db, select(model.user_id).where(getattr(model, column) == 2))
+    assert_index_search(plan, model.__tablename__)
+
+
+@pytest.mark.parametrize("model_name", ["People", "Planets", "Vehicles"])
+def test_lookup_by_name(db, context, model_name):
+    import models
+    model = getattr(models, model_name)
+    plan = query_plan(db, select(model).where(model.name == "Luke Skywalker"))
+    assert_index_search(plan, model.__tablename__)
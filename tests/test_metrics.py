@@ -0,0 +1,38 @@
+import pytest
+
+
+def sample(client, name, endpoint):
+    # Value of a series of /metrics, 0 before the first request
+    prefix = f'{name}{{endpoint="{endpoint}"}} '
+    for line in client.get("/metrics").get_data(as_text=True).splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+def test_size_after_compression(seeded, client):
+    before = sample(client, "http_response_size_bytes_sum", "api.get_all_people")
+    response = client.get("/people?limit=20", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    after = sample(client, "http_response_size_bytes_sum", "api.get_all_people")
+    assert after - before == len(response.get_data())
+
+
+@pytest.mark.parametrize("headers, json_store", [
+    ({"Accept": "application/msgpack"}, False),
+    ({}, True),
+])
+def test_serialization_time(seeded, client, monkeypatch, headers, json_store):
+    # MessagePack and the pre-encoded JSON pages do not go through jsonify
+    import app as api
+    monkeypatch.setattr(api, "SERIALIZED_JSON_STORE", json_store)
+    before = sample(client, "http_request_serialization_seconds_sum", "api.get_all_planets")
+    assert client.get("/planets?limit=20", headers=headers).status_code == 200
+    assert sample(client, "http_request_serialization_seconds_sum", "api.get_all_planets") > before
+
+
+def test_gauge_names(seeded, client):
+    types = [line.split()[2:] for line in client.get("/metrics").get_data(as_text=True).splitlines()
+             if line.startswith("# TYPE")]
+    assert ["cache_hits", "gauge"] in types
+    assert not [name for name, kind in types if kind != "counter" and name.endswith("_total")]
@@ -0,0 +1,88 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+@pytest.mark.parametrize("path, after", [
+    ("/planets?sort=population", cursor([{"a": 1}, 3])),
+    ("/planets?sort=population", cursor(["x", 3])),
+    ("/planets?sort=population", cursor([1000, "3"])),
+    ("/planets?sort=population", cursor([True, 3])),
+    ("/planets?sort=population", cursor([1000])),
+    ("/planets?sort=name", cursor([1, 3])),
+    ("/people?sort=name", cursor([None, 3])),
+    ("/people?sort=name", "not a cursor"),
+    ("/vehicles?sort=-capacity", cursor({"capacity": 1, "id": 3})),
+])
+def test_invalid_cursor(seeded, client, path, after):
+    response = client.get(f"{path}&after={after}")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "Invalid cursor"}
+
+
+def walk(client, path, key=None):
+    # Pages of ids following the cursor, from the body or the headers
+    pages = []
+    separator = "&" if "?" in path else "?"
+    response = client.get(path)
+    while True:
+        body = response.get_json()
+        items = body[key] if key else body
+        pages.append([item["id"] for item in items])
+        next_cursor = body["next"] if key else response.headers.get("X-Next-Cursor")
+        if next_cursor is None:
+            return pages
+        response = client.get(f"{path}{separator}after={next_cursor}")
+
+
+@pytest.mark.parametrize("path, key, total", [
+    ("/people?limit=6", "people", 20),
+    ("/planets?limit=7", None, 20),
+    ("/users?limit=2", None, 5),
+])
+def test_keyset_pages(seeded, client, path, key, total):
+    pages = walk(client, path, key)
+    assert [item_id for page in pages for item_id in page] == list(range(1, total + 1))
+    assert all(len(page) == int(path.rpartition("=")[2]) for page in pages[:-1])
+
+
+def test_writes_between_pages(seeded, client):
+    # Rows deleted or added before the cursor do not shift the next page
+    first = client.get("/people?limit=5").get_json()
+    client.delete("/delete/people/2")
+    client.post("/create_people", json={"name": "Person 21", "gender": "n/a",
+                                        "hair_color": "brown", "eye_color": "blue"})
+    second = client.get(f"/people?limit=5&after={first['next']}").get_json()
+    assert [person["id"] for person in second["people"]] == [6, 7, 8, 9, 10]
+
+
+def test_fields(seeded, client):
+    people = client.get("/people?limit=2&fields=name,eye_color").get_json()["people"]
+    assert people == [{"id": 1, "name": "Person 1", "eye_color": "blue"},
+                      {"id": 2, "name": "Person 2", "eye_color": "blue"}]
+    planets = client.get("/planets?limit=1&fields=population").get_json()
+    assert planets == [{"id": 1, "population": 1000}]
+    users = client.get("/users?limit=1&fields=email").get_json()
+    assert users == [{"id": 1, "email": "user1@example.com"}]
+
+
+def test_unknown_fields(seeded, client):
+    response = client.get("/users?fields=email,password")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "Unknown fields: password"}
+
+
+@pytest.mark.parametrize("query, message", [
+    ("limit=0", "limit must be greater than 0"),
+    ("limit=x", "limit must be an integer"),
+    ("after=x", "after must be an integer"),
+])
+def test_invalid_page_args(seeded, client, query, message):
+    response = client.get(f"/people?{query}")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": message}
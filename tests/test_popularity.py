@@ -0,0 +1,57 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+@pytest.mark.parametrize("after", [
+    cursor(["x", 1]),
+    cursor([1, "1"]),
+    cursor([1.5, 1]),
+    cursor([1, None]),
+    cursor([1, 2, 3]),
+    cursor({"fans": 1}),
+    "1",
+])
+def test_invalid_cursor(seeded, client, after):
+    # The cursor is [fans, id], two integers
+    response = client.get(f"/popular/people?after={after}")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": "Invalid cursor"}
+
+
+def test_pages(seeded, client):
+    # People 3: 4 fans, 2 and 4: 2 fans, 1: 1 fan. Ties by id descending.
+    for user_id, names in ((2, ["Person 2", "Person 3", "Person 4"]), (3, ["Person 3", "Person 4"]),
+                           (4, ["Person 3"])):
+        client.post(f"/user/{user_id}/favorites", json={"people": names})
+    pages = []
+    response = client.get("/popular/people?limit=1")
+    while True:
+        pages.append([(item["id"], item["fans"]) for item in response.get_json()])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        response = client.get(f"/popular/people?limit=1&after={response.headers['X-Next-Cursor']}")
+    assert pages == [[(3, 4)], [(4, 2)], [(2, 2)], [(1, 1)]]
+    assert [item["id"] for item in client.get("/popular/people?limit=3").get_json()] == [3, 4, 2]
+    assert client.get("/popular/vehicles").status_code == 404
+
+
+def test_reconcile_command(app, seeded, client, engine):
+    # Favorites written with plain SQL are not counted until the command runs
+    from sqlalchemy import text
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO favorite_planets (user_id, planet_id) VALUES (2, 5), (3, 5), (2, 1)"))
+        connection.execute(text("DELETE FROM favorite_people WHERE user_id = 1 AND people_id = 2"))
+    assert [(item["id"], item["fans"]) for item in client.get("/popular/planets").get_json()] == [(2, 1), (1, 1)]
+
+    result = app.test_cli_runner().invoke(args=["reconcile-favorite-counts"])
+    assert result.exit_code == 0
+    assert result.output == "people: 1 counts corrected\nplanets: 2 counts corrected\n"
+    assert [(item["id"], item["fans"]) for item in client.get("/popular/planets").get_json()] == \
+        [(5, 2), (1, 2), (2, 1)]
+    assert [item["id"] for item in client.get("/popular/people").get_json()] == [3, 1]
@@ -0,0 +1,64 @@
+import pytest
+
+# Number of SQL statements per request, independent of the number of rows
+# (see loading.py). The read endpoints run the table versions of the ETag,
+# the users, and one selectin query each for fav_people and fav_planets.
+
+
+@pytest.mark.parametrize("path", ["/users?limit=2", "/users"])
+def test_list_users(seeded, client, engine, path):
+    from utils import assert_num_queries
+    with assert_num_queries(engine, 4):
+        response = client.get(path)
+    assert response.status_code == 200
+
+
+def test_user_details(seeded, client, engine):
+    from utils import assert_num_queries
+    with assert_num_queries(engine, 4):
+        response = client.get("/user/1")
+    assert response.status_code == 200
+    assert response.get_json()["fav_people"] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("people", [1, 8])
+def test_add_favorites(seeded, client, engine, people):
+    # The user with its favorites, one query per kind for the names, the
+    # favorite counts, the inserts, the table versions, and the favorites of
+    # the response
+    from utils import assert_num_queries
+    names = [f"Person {i}" for i in range(1, people + 1)]
+    with assert_num_queries(engine, 15):
+        response = client.post("/user/2/favorites", json={"people": names, "planets": ["Planet 3"]})
+    assert response.status_code == 200
+    assert len(response.get_json()["fav_people"]) == people
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/user/1/favorites", 200),
+    ("/user/1/favorites/people/2", 200),
+    ("/user/1/favorites/people/9", 200),
+    ("/user/4/favorites/planets/1", 200),
+    ("/user/99/favorites", 404),
+    ("/user/99/favorites/people/1", 404),
+])
+def test_favorites_index(seeded, client, engine, path, status):
+    # Answered from the favorites index once it is built (see adjacency.py)
+    from utils import assert_num_queries
+    client.get("/user/1/favorites")
+    with assert_num_queries(engine, 0):
+        response = client.get(path)
+    assert response.status_code == status
+
+
+def test_favorites_index_follows_local_writes(seeded, client, engine):
+    # The index versions are read again after a commit of this worker, the
+    # user ids are reloaded when only `user` changed
+    from utils import assert_num_queries
+    client.get("/user/1/favorites")
+    client.post("/user/4/favorites", json={"people": ["Person 9"]})
+    with assert_num_queries(engine, 1):
+        assert client.get("/user/4/favorites/people/9").get_json() == {"favorite": True}
+    client.post("/create_user", json={"email": "user6@example.com", "password": "x"})
+    with assert_num_queries(engine, 3):
+        assert client.get("/user/6/favorites").status_code == 200
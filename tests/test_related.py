@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+def test_engines_agree(seeded, context):
+    pytest.importorskip("scipy")
+    from sqlalchemy import insert
+    from models import FavoritePeople
+    from adjacency import Adjacency
+    from related import cosine_top_k_python, cosine_top_k_sparse
+    seeded.session.execute(insert(FavoritePeople), [{"user_id": user_id, "people_id": people_id}
+                                                    for user_id in range(2, 6) for people_id in range(1, 21)
+                                                    if (user_id * people_id) % 3])
+    seeded.session.commit()
+    pairs = seeded.session.query(FavoritePeople.user_id, FavoritePeople.people_id) \
+        .order_by(FavoritePeople.user_id, FavoritePeople.people_id).all()
+    adjacency = Adjacency(pairs)
+    assert cosine_top_k_sparse(adjacency, 5) == cosine_top_k_python(adjacency, 5)
+
+
+def test_related_people(seeded, client):
+    # User 1 has people 1-3 as favorites, user 2 has people 1 and 4
+    client.post("/user/2/favorites", json={"people": ["Person 1", "Person 4"]})
+    related = client.get("/people/1/related").get_json()
+    assert [item["id"] for item in related] == [2, 3, 4]
+    assert related[0]["score"] == pytest.approx(1 / 2 ** 0.5, abs=1e-4)
+    assert client.get("/people/999/related").status_code == 404
+
+
+def test_app_import_does_not_load_numpy():
+    # numpy and scipy are only imported by the batch (see related.py)
+    code = "import sys, wsgi; print('numpy' in sys.modules or 'scipy' in sys.modules)"
+    src = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    result = subprocess.run([sys.executable, "-c", code], cwd=src, capture_output=True, text=True,
+                            env=dict(os.environ, API_ONLY="true"), check=True)
+    assert result.stdout.strip() == "False"
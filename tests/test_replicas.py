@@ -0,0 +1,85 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+from flask import g
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch):
+    # An app with its own primary sqlite file and a copy of it as replica.
+    # The replica settings are read from the environment on import, so they
+    # are patched on the modules. The queue keeps pointing to the test app,
+    # and db forgets the metadata it creates for the replica bind.
+    import replicas
+    from app import create_app
+    from models import db, User
+    from writebehind import favorites_queue
+
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    monkeypatch.setattr(replicas, "REPLICA_URLS", [f"sqlite:///{replica}"])
+    monkeypatch.setattr(replicas, "REPLICA_KEYS", ["replica_0"])
+    monkeypatch.setattr(replicas, "REPLICA_CHECK_SECONDS", 0)
+    monkeypatch.setattr(replicas.replica_set, "keys", ["replica_0"])
+    monkeypatch.setattr(replicas.replica_set, "down_until", {})
+    monkeypatch.setattr(replicas.replica_set, "checked_at", {})
+    monkeypatch.setattr(favorites_queue, "app", favorites_queue.app)
+    monkeypatch.setattr(db, "metadatas", dict(db.metadatas))
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{primary}", "API_ONLY": True})
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([User(email=f"user{i}@example.com", password="x", is_active=True)
+                            for i in range(1, 4)])
+        db.session.commit()
+        db.session.remove()
+    shutil.copy(primary, replica)
+    # Tells the two files apart
+    with sqlite3.connect(replica) as connection:
+        connection.execute("UPDATE user SET email = 'replica@example.com' WHERE id = 1")
+    yield app, replica
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def replica_up(client):
+    metrics = client.get("/metrics").get_data(as_text=True)
+    return [line for line in metrics.splitlines() if line.startswith('db_replica_up{replica="replica_0"}')]
+
+
+def test_get_reads_from_replica(replica_app):
+    app, _ = replica_app
+    client = app.test_client()
+    assert client.get("/user/1").get_json()["email"] == "replica@example.com"
+    assert client.get("/users").get_json()[0]["email"] == "replica@example.com"
+    assert replica_up(client) == ['db_replica_up{replica="replica_0"} 1']
+
+
+def test_reads_after_write_use_primary(replica_app):
+    from models import db, User
+    app, _ = replica_app
+    with app.test_request_context("/users"):
+        g.read_replica = True
+        assert db.session.get(User, 1).email == "replica@example.com"
+        db.session.get(User, 2).is_active = False
+        db.session.flush()
+        db.session.expire_all()
+        assert db.session.get(User, 1).email == "user1@example.com"
+        db.session.rollback()
+        db.session.remove()
+
+
+def test_removed_replica_falls_back_to_primary(replica_app):
+    from models import db
+    app, replica = replica_app
+    client = app.test_client()
+    assert client.get("/user/1").get_json()["email"] == "replica@example.com"
+
+    with app.app_context():
+        db.engines["replica_0"].dispose()
+    os.remove(replica)
+    assert client.get("/user/1").get_json()["email"] == "user1@example.com"
+    assert client.get("/users").get_json()[0]["email"] == "user1@example.com"
+    assert replica_up(client) == ['db_replica_up{replica="replica_0"} 0']
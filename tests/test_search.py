@@ -0,0 +1,55 @@
+import pytest
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    # Counts the bulk builds of the search index, checked on every search
+    import search
+    monkeypatch.setattr(search, "SEARCH_REFRESH_SECONDS", -1)
+    count = [0]
+    build = search.MemorySearch.build
+
+    def counting_build(self):
+        count[0] += 1
+        build(self)
+    monkeypatch.setattr(search.MemorySearch, "build", counting_build)
+    return count
+
+
+def search_names(client, query):
+    return [result["name"] for result in client.get(f"/search?q={query}&type=people").get_json()["results"]]
+
+
+def test_orm_writes_are_applied_without_rebuild(seeded, client, builds):
+    assert search_names(client, "person 2") == ["Person 2", "Person 20"]
+    assert builds[0] == 1
+    for name in ("Person 21", "Person 22"):
+        response = client.post("/create_people", json={"name": name, "gender": "n/a",
+                                                       "hair_color": "brown", "eye_color": "blue"})
+        assert response.status_code == 201
+    assert search_names(client, "person 2") == ["Person 2", "Person 20", "Person 21", "Person 22"]
+    assert builds[0] == 1
+
+
+def test_other_writes_rebuild(app, seeded, client, builds):
+    # A write this process did not apply, as made by another worker
+    from sqlalchemy import text
+    from models import People
+    assert search_names(client, "person 3") == ["Person 3"]
+    with app.app_context():
+        seeded.session.execute(People.__table__.update().where(People.id == 3).values(name="Person 30"))
+        seeded.session.execute(text("UPDATE table_version SET version = version + 1 WHERE table_name = 'people'"))
+        seeded.session.commit()
+    assert search_names(client, "person 3") == ["Person 30"]
+    assert builds[0] == 2
+
+
+@pytest.mark.parametrize("limit, message", [
+    ("0", "limit must be greater than 0"),
+    ("-1", "limit must be greater than 0"),
+    ("x", "limit must be an integer"),
+])
+def test_invalid_limit(seeded, client, limit, message):
+    response = client.get(f"/search?q=person&limit={limit}")
+    assert response.status_code == 400
+    assert response.get_json() == {"message": message}
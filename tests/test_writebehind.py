@@ -0,0 +1,99 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    # FAVORITES_WRITE_BEHIND on, flushed by the tests only
+    import app as api
+    from writebehind import favorites_queue
+    monkeypatch.setattr(api, "FAVORITES_WRITE_BEHIND", True)
+    monkeypatch.setattr(favorites_queue, "interval", 3600)
+    yield favorites_queue
+    favorites_queue.flush()
+
+
+def stored_favorites(engine, user_id):
+    from sqlalchemy import text
+    with engine.connect() as connection:
+        return [people_id for (people_id,) in connection.execute(
+            text("SELECT people_id FROM favorite_people WHERE user_id = :user_id ORDER BY people_id"),
+            {"user_id": user_id})]
+
+
+def test_changes_are_queued_and_coalesced(seeded, client, engine, queue):
+    response = client.post("/user/1/favorites", json={"people": ["Person 4", "Person 5"]})
+    assert response.status_code == 202
+    assert response.get_json()["status"] == {"people": {"Person 4": "added", "Person 5": "added"}}
+    assert [person["id"] for person in response.get_json()["fav_people"]] == [1, 2, 3, 4, 5]
+
+    # Same (user, item) pair, the last change wins
+    response = client.delete("/user/1/favorites", json={"people": ["Person 4"]})
+    assert response.status_code == 202
+    assert [person["id"] for person in response.get_json()["fav_people"]] == [1, 2, 3, 5]
+    assert queue.stats()["pending"] == 2
+    assert stored_favorites(engine, 1) == [1, 2, 3]
+
+    assert queue.flush() == 2
+    assert stored_favorites(engine, 1) == [1, 2, 3, 5]
+    assert [item["id"] for item in client.get("/popular/people").get_json()] == [5, 3, 2, 1]
+
+
+def test_reads_flush_the_changes_of_the_user(seeded, client, queue):
+    client.post("/user/1/favorites", json={"people": ["Person 6"]})
+    assert queue.has_pending(1)
+    assert client.get("/user/1").get_json()["fav_people"] == [1, 2, 3, 6]
+    assert not queue.has_pending()
+
+
+def test_full_queue(seeded, client, queue, monkeypatch):
+    monkeypatch.setattr(queue, "maxsize", 2)
+    monkeypatch.setattr(queue, "timeout", 0.05)
+    response = client.post("/user/1/favorites", json={"people": ["Person 4", "Person 5", "Person 6"]})
+    assert response.status_code == 400
+    assert client.post("/user/1/favorites", json={"people": ["Person 4", "Person 5"]}).status_code == 202
+    # The writer cannot make room while another flush holds the lock
+    with queue.flush_lock:
+        response = client.post("/user/2/favorites", json={"people": ["Person 6"]})
+    assert response.status_code == 503
+    assert response.get_json() == {"message": "Too many pending favorite changes, try again later"}
+    assert queue.stats()["pending"] == 2
+
+
+def test_read_your_writes_is_per_worker(app, seeded, client, queue):
+    # A change queued by another worker is only seen once that worker flushes
+    from writebehind import FavoritesQueue
+    other_worker = FavoritesQueue(interval=3600)
+    other_worker.app = app
+    other_worker.put([("people", 1, 7, True)])
+    assert client.get("/user/1").get_json()["fav_people"] == [1, 2, 3]
+    assert other_worker.flush() == 1
+    assert client.get("/user/1").get_json()["fav_people"] == [1, 2, 3, 7]
+
+
+def test_pair_inserted_by_another_worker(seeded, client, engine, queue, monkeypatch):
+    # Inserted after the flush read the existing pairs: the insert fails on
+    # the unique constraint, the batch is put back and the retry skips the
+    # pair without counting it twice
+    from sqlalchemy import text
+    from sqlalchemy.exc import IntegrityError
+    import writebehind
+    existing_pairs = writebehind.existing_pairs
+
+    def insert_meanwhile(table, column, pairs):
+        found = existing_pairs(table, column, pairs)
+        if not found:
+            with engine.begin() as connection:
+                connection.execute(text("INSERT INTO favorite_people (user_id, people_id) VALUES (1, 8)"))
+        return found
+    monkeypatch.setattr(writebehind, "existing_pairs", insert_meanwhile)
+    client.post("/user/1/favorites", json={"people": ["Person 8"]})
+    failures = queue.stats()["failures"]
+    with pytest.raises(IntegrityError):
+        queue.flush()
+    assert queue.stats()["failures"] == failures + 1
+    assert queue.has_pending(1)
+    assert queue.flush() == 1
+    assert stored_favorites(engine, 1) == [1, 2, 3, 8]
+    assert 8 not in [item["id"] for item in client.get("/popular/people").get_json()]